@@ -0,0 +1,166 @@
+import asyncio
+import json
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_accept_header
+
+from app import app
+from encoding import accept_format, msgpack
+from extensions import db
+from models import Club, User
+from serializers import (serialize_club, serialize_user, CLUB_ASSOCIATIONS, USER_ASSOCIATIONS,
+    CLUB_FIELDS, USER_FIELDS)
+from storage import get_engine_options, install_pragmas
+
+# the async engine needs the aiosqlite driver, and serving every other route needs asgiref - both are optional
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    WsgiToAsgi = None
+
+# ASGI Serving Mode - run with an ASGI server, e.g.
+#   uvicorn asgi:application
+# the composite reads GET /api/clubs/<club_name> and GET /api/users/<username> are served on SQLAlchemy's asyncio
+# engine: the row and each of its list fields (tags, members, officers, reviews / favorites, membership, ...) are
+# loaded concurrently with asyncio.gather, each on its own pooled connection, so one process serves many
+# concurrent clients without a thread per request. every other request is handed to the Flask app (WSGI) unchanged
+# the async routes only load and serialize, so a request is handed to Flask whenever Flask would answer it differently:
+# a conditional request (If-None-Match), an Accept header that negotiates MessagePack, metrics on (METRICS_ENABLED),
+# or, for clubs, the response cache or the club catalog on (those answer from memory, with ETags)
+
+class AsyncStore:
+    def __init__(self):
+        self.engine = None
+
+    def get_engine(self):
+        if self.engine is None:
+            if aiosqlite is None:
+                raise RuntimeError("the ASGI serving mode needs the aiosqlite package (pip install aiosqlite)")
+            with app.app_context():
+                url = db.engine.url.set(drivername="sqlite+aiosqlite")
+            profile = app.config["STORAGE_PROFILE"]
+            self.engine = create_async_engine(url, **get_engine_options(profile, url))
+            install_pragmas(self.engine.sync_engine, profile)
+        return self.engine
+
+    async def fetch(self, statement):
+        async with self.get_engine().connect() as connection:
+            return (await connection.execute(statement)).all()
+
+    async def dispose(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+store = AsyncStore()
+
+# loads one row and the requested list fields of it concurrently - returns (row, associations) or (None, None)
+async def load_composite(table, key_column, key, associations, fields):
+    loads = [store.fetch(select(table).where(key_column == key))]
+    names = [field for field in associations if fields is None or field in fields]
+    loads += [store.fetch(associations[field][0].where(associations[field][1] == key)) for field in names]
+    rows, *lists = await asyncio.gather(*loads)
+    if not rows:
+        return None, None
+    grouped = {}
+    for field, values in zip(names, lists):
+        grouped[field] = defaultdict(list)
+        for owner, value in values:
+            grouped[field][owner].append(value)
+    return rows[0], grouped
+
+async def get_club(club_name, fields):
+    club, associations = await load_composite(Club.__table__, Club.name, club_name, CLUB_ASSOCIATIONS, fields)
+    if club is None:
+        return 400, {"message": "Club does not exist"}
+    return 200, serialize_club(club, associations, fields)
+
+async def get_user(username, fields):
+    user, associations = await load_composite(User.__table__, User.username, username, USER_ASSOCIATIONS, fields)
+    if user is None:
+        return 400, {"message": "User does not exist"}
+    return 200, serialize_user(user, associations, fields)
+
+# Flask endpoint -> (handler, allowed fields, the view argument holding the key, settings under which Flask serves it)
+ROUTES = {
+    "api.access_club": (get_club, CLUB_FIELDS, "club_name", ("CACHE_ENABLED", "CATALOG_ENABLED")),
+    "api.access_user": (get_user, USER_FIELDS, "username", ()),
+}
+# paths are matched with the Flask app's own URL rules, so a static route next to these (/api/clubs/top-rated, ...)
+# is never mistaken for a club name
+url_adapter = app.url_map.bind("localhost")
+
+# True when the Flask route would answer this request differently from the async one
+def _needs_flask(headers, flask_settings):
+    config = app.config
+    if config["METRICS_ENABLED"] or any(config[setting] for setting in flask_settings):
+        return True
+    if b"if-none-match" in headers:
+        return True
+    accept = headers.get(b"accept")
+    return accept is not None and accept_format(parse_accept_header(accept.decode("latin-1"), MIMEAccept)) != "json"
+
+def _match(scope):
+    if scope["method"] != "GET":
+        return None
+    try:
+        endpoint, view_args = url_adapter.match(scope["path"], "GET")
+    except HTTPException:
+        return None
+    if endpoint not in ROUTES:
+        return None
+    handler, allowed_fields, key_argument, flask_settings = ROUTES[endpoint]
+    if _needs_flask(dict(scope["headers"]), flask_settings):
+        return None
+    return handler, view_args[key_argument], allowed_fields
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    # the same Vary header as the Flask responses, whose format depends on Accept when msgpack is installed
+    if msgpack is not None:
+        headers.append((b"vary", b"Accept"))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await store.dispose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+flask_application = WsgiToAsgi(app) if WsgiToAsgi is not None else None
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    route = _match(scope) if scope["type"] == "http" else None
+    if route is None:
+        if flask_application is None:
+            await _send_json(send, 501, {"message": "Serving Flask routes over ASGI needs the asgiref package"})
+            return
+        await flask_application(scope, receive, send)
+        return
+    handler, key, allowed_fields = route
+    fields = parse_qs(scope["query_string"].decode("latin-1")).get("fields", [""])[0]
+    fields = set(field.strip() for field in fields.split(",") if field.strip()) or None
+    invalid = sorted(fields - set(allowed_fields)) if fields else []
+    if invalid:
+        await _send_json(send, 400, {"message": f"Invalid field: {invalid[0]}"})
+        return
+    status, payload = await handler(key, fields)
+    await _send_json(send, status, payload)
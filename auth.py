@@ -0,0 +1,196 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, jsonify, request
+from flask_login import LoginManager, UserMixin
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import select
+
+from extensions import db, app_local
+from events import subscribe
+from models import User
+
+# Token Auth - /login issues a signed token (itsdangerous) holding the username and a stamp of the password hash;
+# requests send it as "Authorization: Bearer <token>" and flask_login's current_user is loaded from it
+# checking a token costs no bcrypt: the signature and age are checked in memory, and the user's identity comes from
+# a small LRU cache (or one primary-key lookup on a miss) - changing the password changes the stamp, which
+# invalidates every token issued before
+# AUTH_SESSION_STORE="memory" also records each token in an in-memory session store with TTL eviction, so /logout
+# can revoke a single token; it is per process, so use the default "stateless" when running several workers
+# tokens are signed with SECRET_KEY (or the CLUBREVIEW_SECRET_KEY environment variable); without one, a random key
+# is made, and tokens stop working when the process restarts
+def init_app(app):
+    app.config.setdefault("AUTH_TOKEN_TTL", 24 * 60 * 60)
+    app.config.setdefault("AUTH_SESSION_STORE", "stateless")
+    app.config.setdefault("AUTH_MAX_SESSIONS", 100000)
+    app.config.setdefault("IDENTITY_CACHE_SIZE", 1024)
+    app.config.setdefault("IDENTITY_CACHE_TTL", 60)
+    if not app.config.get("SECRET_KEY"):
+        app.config["SECRET_KEY"] = os.environ.get("CLUBREVIEW_SECRET_KEY") or secrets.token_hex(32)
+    login_manager.init_app(app)
+
+# a short digest of the password hash - never the hash itself, since token payloads are only signed, not encrypted
+def password_stamp(password_hash):
+    return hashlib.sha256(password_hash.encode("utf-8")).hexdigest()[:16]
+
+# the cached, read-only view of a user that current_user holds for token-authenticated requests
+class Identity(UserMixin):
+    def __init__(self, username, email, first_name, last_name, password_hash):
+        self.username = username
+        self.email = email
+        self.first_name = first_name
+        self.last_name = last_name
+        self.password_stamp = password_stamp(password_hash)
+
+    def get_id(self):
+        return self.username
+
+# LRU cache of identities by username - entries expire after IDENTITY_CACHE_TTL seconds so changes made by other
+# processes are picked up, and are dropped at once when this process commits a change to the user
+class IdentityCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(username)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        row = db.session.execute(
+            select(User.username, User.email, User.first_name, User.last_name, User.password)
+            .where(User.username == username)).first()
+        identity = Identity(*row) if row is not None else None
+        if identity is not None:
+            with self.lock:
+                self.entries[username] = (identity, now + self.ttl)
+                self.entries.move_to_end(username)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return identity
+
+    def discard(self, username):
+        with self.lock:
+            self.entries.pop(username, None)
+
+    def get_stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+# in-memory session store - session id -> (username, expiry); every session lives AUTH_TOKEN_TTL seconds, so
+# insertion order is expiry order and expired sessions are evicted from the front
+class SessionStore:
+    def __init__(self, ttl, max_sessions):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _evict(self, now):
+        while self.sessions:
+            session_id, (username, expires) = next(iter(self.sessions.items()))
+            if expires > now and len(self.sessions) <= self.max_sessions:
+                break
+            self.sessions.popitem(last=False)
+
+    def create(self, username):
+        session_id = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self.lock:
+            self.sessions[session_id] = (username, now + self.ttl)
+            self._evict(now)
+        return session_id
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self.lock:
+            self._evict(now)
+            entry = self.sessions.get(session_id)
+            return entry[0] if entry is not None else None
+
+    def revoke(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def revoke_user(self, username):
+        with self.lock:
+            for session_id in [key for key, (owner, expires) in self.sessions.items() if owner == username]:
+                del self.sessions[session_id]
+
+    def __len__(self):
+        return len(self.sessions)
+
+# one of each per app, sized from its settings
+identity_cache = app_local("identity_cache", lambda: IdentityCache(
+    current_app.config["IDENTITY_CACHE_SIZE"], current_app.config["IDENTITY_CACHE_TTL"]))
+session_store = app_local("session_store", lambda: SessionStore(
+    current_app.config["AUTH_TOKEN_TTL"], current_app.config["AUTH_MAX_SESSIONS"]))
+
+def get_serializer():
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt="clubreview-auth")
+
+# returns a new token for a user whose password was just checked
+def issue_token(user):
+    payload = {"u": user.username, "p": password_stamp(user.password)}
+    if current_app.config["AUTH_SESSION_STORE"] == "memory":
+        payload["s"] = session_store.create(user.username)
+    return get_serializer().dumps(payload)
+
+def _load_token(token):
+    try:
+        return get_serializer().loads(token, max_age=current_app.config["AUTH_TOKEN_TTL"])
+    except BadSignature:
+        return None
+
+# returns the Identity the token was issued to, or None if it is forged, expired, revoked, or its password changed
+def verify_token(token):
+    payload = _load_token(token)
+    if not isinstance(payload, dict) or "u" not in payload or "p" not in payload:
+        return None
+    if "s" in payload and session_store.get(payload["s"]) != payload["u"]:
+        return None
+    identity = identity_cache.get(payload["u"])
+    if identity is None or identity.password_stamp != payload["p"]:
+        return None
+    return identity
+
+def revoke_token(token):
+    payload = _load_token(token)
+    if isinstance(payload, dict) and "s" in payload:
+        session_store.revoke(payload["s"])
+
+# the token of the current request, from "Authorization: Bearer <token>"
+def bearer_token():
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return token.strip() if scheme.lower() == "bearer" and token.strip() else None
+
+login_manager = LoginManager()
+
+@login_manager.request_loader
+def _load_user_from_request(request):
+    token = bearer_token()
+    return verify_token(token) if token else None
+
+@login_manager.unauthorized_handler
+def _unauthorized():
+    return jsonify({"message": "Authentication required"}), 401
+
+def _forget_user(name, payload):
+    for username in {payload["user"], payload.get("old_name", payload["user"])}:
+        identity_cache.discard(username)
+        if name == "user_deleted":
+            session_store.revoke_user(username)
+
+subscribe(_forget_user, ["user_updated", "user_deleted", "password_changed"])
@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from app import create_app
+from extensions import db
+
+# API Load Benchmark - generates a synthetic dataset, replays a mixed read/write workload against the app, and reports
+# throughput, p50/p95/p99 latency, and SQL statements per request for every route the workload hits
+#   python -m benchmarks.api_load run --clubs 2000 --users 5000 --requests 20000 --output before.json
+#   python -m benchmarks.api_load compare before.json after.json
+# the workload runs in-process through the Flask test client, or against a local server with --url; to benchmark
+# a server, generate the dataset first and start the server on it:
+#   python -m benchmarks.api_load generate --database /tmp/bench.db
+#   CLUBREVIEW_DATABASE_URI=sqlite:////tmp/bench.db CLUBREVIEW_METRICS=1 flask --app app run
+#   python -m benchmarks.api_load run --url http://127.0.0.1:5000 --database /tmp/bench.db --output server.json
+# the dataset and the request sequence depend only on --seed and the scale options, so runs are repeatable
+# (SQL counts come from the X-SQL-Queries header, see metrics.py - the server must run with metrics enabled)
+
+PASSWORD = "benchmark password"
+WORDS = ("club", "society", "penn", "music", "coding", "robotics", "finance", "dance", "film", "debate",
+         "chess", "writing", "theatre", "hiking", "cooking", "research", "design", "poetry", "service", "art")
+
+# builds the app against the dataset, with metrics on so every response reports its SQL
+def load_app(database):
+    return create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.abspath(database)}",
+        "METRICS_ENABLED": True,
+        "METRICS_DEBUG_HEADER": True,
+        # the report covers latency - keep the slow request log from flooding the output
+        "METRICS_SLOW_REQUEST_MS": float("inf"),
+    })
+
+def scale_of(args):
+    return {name: getattr(args, name) for name in
+            ("clubs", "users", "tags", "tags_per_club", "memberships", "favorites", "reviews", "seed")}
+
+# Dataset - writes clubs, users, tags and their associations with executemany, then fills the counters and the
+# search index the same way a bulk import does; every user's password is PASSWORD
+def generate(database, scale):
+    if os.path.exists(database):
+        os.remove(database)
+    app = load_app(database)
+    from models import Club, User, Review, Tag, tags, members, officers, favorites, recompute_counters
+    from passwords import password_hasher
+    from search import club_search
+
+    rng = random.Random(scale["seed"])
+    clubs, users = scale["clubs"], scale["users"]
+    with app.app_context():
+        db.create_all()
+        password = password_hasher.hash(PASSWORD)
+        db.session.execute(Tag.__table__.insert(), [{"name": f"Tag {i}", "club_count": 0} for i in range(scale["tags"])])
+        db.session.execute(Club.__table__.insert(), [
+            {"code": f"c{i}", "name": f"Club {i}", "favorite_count": 0,
+             "description": " ".join(rng.choice(WORDS) for _ in range(12))}
+            for i in range(clubs)])
+        db.session.execute(User.__table__.insert(), [
+            {"username": f"u{i}", "email": f"u{i}@upenn.edu", "password": password,
+             "first_name": "User", "last_name": str(i)}
+            for i in range(users)])
+        db.session.execute(tags.insert(), [
+            {"club_name": f"Club {club}", "tag_name": f"Tag {tag}"}
+            for club in range(clubs)
+            for tag in rng.sample(range(scale["tags"]), min(scale["tags"], rng.randint(1, scale["tags_per_club"])))])
+        for table, per_user in ((members, scale["memberships"]), (favorites, scale["favorites"])):
+            db.session.execute(table.insert(), [
+                {"user_username": f"u{user}", "club_name": f"Club {club}"}
+                for user in range(users) for club in rng.sample(range(clubs), min(clubs, per_user))])
+        db.session.execute(officers.insert(), [
+            {"user_username": f"u{rng.randrange(users)}", "club_name": f"Club {club}"} for club in range(clubs)])
+        db.session.execute(Review.__table__.insert(), [
+            {"title": "review", "rating": rng.randint(0, 10), "description": "synthetic review",
+             "user": f"u{user}", "club": f"Club {rng.randrange(clubs)}"}
+            for user in range(users) for _ in range(scale["reviews"])])
+        recompute_counters()
+        db.session.commit()
+        club_search.create()
+        db.session.commit()
+    return app
+
+# Workload - (weight, method, path builder, json builder) per operation; reads dominate, as in production
+def workload(scale):
+    clubs, users, tag_count = scale["clubs"], scale["users"], scale["tags"]
+    reviews = users * scale["reviews"]
+    club = lambda rng: f"Club {rng.randrange(clubs)}"
+    user = lambda rng: f"u{rng.randrange(users)}"
+    tag = lambda rng: f"Tag {rng.randrange(tag_count)}"
+    return [
+        (10, "GET", lambda rng: "/api/clubs?limit=50", None),
+        (15, "GET", lambda rng: f"/api/clubs/{club(rng)}", None),
+        (3, "GET", lambda rng: f"/api/clubs/{club(rng)}/tags", None),
+        (5, "GET", lambda rng: f"/api/clubs/{club(rng)}/members", None),
+        (2, "GET", lambda rng: f"/api/clubs/{club(rng)}/officers", None),
+        (4, "GET", lambda rng: f"/api/clubs/{club(rng)}/reviews", None),
+        (3, "GET", lambda rng: "/api/clubs/top-rated?limit=20", None),
+        (4, "GET", lambda rng: f"/api/clubs/search-club/{rng.choice(WORDS)}?limit=20", None),
+        (3, "GET", lambda rng: f'/api/clubs/filter?limit=20&q="{tag(rng)}" AND NOT "{tag(rng)}"', None),
+        (3, "GET", lambda rng: "/api/users?limit=50", None),
+        (6, "GET", lambda rng: f"/api/users/{user(rng)}", None),
+        (4, "GET", lambda rng: f"/api/users/{user(rng)}/favorites", None),
+        (2, "GET", lambda rng: f"/api/users/{user(rng)}/members", None),
+        (3, "GET", lambda rng: f"/api/users/{user(rng)}/reviews", None),
+        (2, "GET", lambda rng: "/api/reviews?limit=50", None),
+        (3, "GET", lambda rng: f"/api/reviews/{rng.randint(1, max(reviews, 1))}", None),
+        (2, "GET", lambda rng: "/api/tags", None),
+        (3, "GET", lambda rng: f"/api/tags/{tag(rng)}", None),
+        (1, "GET", lambda rng: f"/api/tags/{tag(rng)}/top-rated?limit=20", None),
+        (4, "PUT", lambda rng: f"/api/users/{user(rng)}/favorites", lambda rng: {"name": club(rng)}),
+        (2, "DELETE", lambda rng: f"/api/users/{user(rng)}/favorites", lambda rng: {"name": club(rng)}),
+        (2, "PUT", lambda rng: f"/api/clubs/{club(rng)}/members", lambda rng: {"username": user(rng)}),
+        (3, "PUT", lambda rng: f"/api/clubs/{club(rng)}/reviews",
+            lambda rng: {"title": "bench", "rating": rng.randint(0, 10), "username": user(rng)}),
+        (1, "PATCH", lambda rng: f"/api/clubs/{club(rng)}",
+            lambda rng: {"description": " ".join(rng.choice(WORDS) for _ in range(12))}),
+        (1, "POST", lambda rng: "/login", lambda rng: {"username/email": user(rng), "password": PASSWORD}),
+    ]
+
+# the request sequence for a run - the same seed and scale always give the same requests
+def build_requests(scale, count):
+    rng = random.Random(scale["seed"] + 1)
+    operations = workload(scale)
+    weights = [operation[0] for operation in operations]
+    requests = []
+    for operation in rng.choices(operations, weights=weights, k=count):
+        weight, method, path, body = operation
+        requests.append((method, path(rng), body(rng) if body else None))
+    return requests
+
+# percent-encodes the path and query string of a workload path
+def quote(path):
+    path, _, query = path.partition("?")
+    path = urllib.parse.quote(path)
+    return f"{path}?{urllib.parse.urlencode(urllib.parse.parse_qsl(query))}" if query else path
+
+class InProcessClient:
+    def __init__(self, app):
+        self.app = app
+        self.adapter = self.app.url_map.bind("localhost")
+        self.local = threading.local()
+
+    # the app's endpoint (view function name) for a workload request
+    def endpoint(self, method, path):
+        return self.adapter.match(path.partition("?")[0], method=method)[0]
+
+    def send(self, method, path, body):
+        if not hasattr(self.local, "client"):
+            self.local.client = self.app.test_client()
+        response = self.local.client.open(quote(path), method=method, json=body)
+        response.get_data()
+        return response.status_code, response.headers.get("X-SQL-Queries")
+
+class HTTPClient(InProcessClient):
+    def __init__(self, app, url):
+        super().__init__(app)
+        self.url = url.rstrip("/")
+
+    def send(self, method, path, body):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.url + quote(path), data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status, response.headers.get("X-SQL-Queries")
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers.get("X-SQL-Queries")
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+# Replay - sends the requests from the given number of threads and returns per-route results
+def replay(client, requests, threads):
+    samples = defaultdict(list)      # route -> [(seconds, status, sql statements)]
+    lock = threading.Lock()
+    position = iter(range(len(requests)))
+
+    def worker():
+        local = defaultdict(list)
+        while True:
+            with lock:
+                index = next(position, None)
+            if index is None:
+                break
+            method, path, body = requests[index]
+            route = client.endpoint(method, path)
+            start = time.perf_counter()
+            status, queries = client.send(method, path, body)
+            local[f"{method} {route}"].append((time.perf_counter() - start, status, queries))
+        with lock:
+            for route, values in local.items():
+                samples[route].extend(values)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    routes = {}
+    for route, values in sorted(samples.items()):
+        latencies = sorted(seconds for seconds, status, queries in values)
+        queries = [int(queries) for seconds, status, queries in values if queries is not None]
+        routes[route] = {
+            "requests": len(values),
+            "errors": sum(1 for seconds, status, queries in values if status >= 500),
+            "client_errors": sum(1 for seconds, status, queries in values if 400 <= status < 500),
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "queries_per_request": sum(queries) / len(queries) if queries else None,
+        }
+    return {"seconds": elapsed, "requests": len(requests), "requests_per_second": len(requests) / elapsed,
+            "routes": routes}
+
+def print_run(result):
+    print(f"{result['requests']} requests in {result['seconds']:.1f}s - {result['requests_per_second']:,.0f} req/s")
+    print(f"{'route':<48}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'SQL/req':>9}{'5xx':>6}")
+    for route, stats in result["routes"].items():
+        queries = stats["queries_per_request"]
+        print(f"{route:<48}{stats['requests']:>7}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+              f"{queries if queries is not None else float('nan'):>9.1f}{stats['errors']:>6}")
+
+# Compare - prints the change per route between two saved runs; a route regresses when its p95 latency grows by more
+# than the threshold, or when it issues more SQL statements per request. returns the regressed routes
+def compare(before, after, threshold):
+    regressions = []
+    if before.get("scale") != after.get("scale") or before["requests"] != after["requests"]:
+        print("warning: the runs used different datasets or request counts, so they are not directly comparable")
+    print(f"throughput: {before['requests_per_second']:,.0f} -> {after['requests_per_second']:,.0f} req/s")
+    print(f"{'route':<48}{'p95 before':>12}{'p95 after':>12}{'change':>9}{'SQL before':>12}{'SQL after':>11}")
+    for route in sorted(set(before["routes"]) | set(after["routes"])):
+        old, new = before["routes"].get(route), after["routes"].get(route)
+        if old is None or new is None:
+            print(f"{route:<48}{'only in ' + ('after' if old is None else 'before'):>24}")
+            continue
+        change = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0
+        old_queries, new_queries = old["queries_per_request"], new["queries_per_request"]
+        regressed = change > threshold or (
+            old_queries is not None and new_queries is not None and new_queries > old_queries + 0.05)
+        if regressed:
+            regressions.append(route)
+        print(f"{route:<48}{old['p95_ms']:>12.2f}{new['p95_ms']:>12.2f}{change:>+9.0%}"
+              f"{old_queries if old_queries is not None else float('nan'):>12.1f}"
+              f"{new_queries if new_queries is not None else float('nan'):>11.1f}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def add_scale_arguments(parser):
+    parser.add_argument("--database", default=os.path.join(tempfile.gettempdir(), "clubreview-bench.db"))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--clubs", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--tags", type=int, default=50)
+    parser.add_argument("--tags-per-club", type=int, default=4)
+    parser.add_argument("--memberships", type=int, default=3, help="clubs each user is a member of")
+    parser.add_argument("--favorites", type=int, default=3, help="clubs each user favorites")
+    parser.add_argument("--reviews", type=int, default=1, help="reviews written by each user")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a dataset, replay a workload, and compare runs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate", help="write the synthetic dataset")
+    add_scale_arguments(generate_parser)
+    run_parser = commands.add_parser("run", help="replay the workload and report per-route results")
+    add_scale_arguments(run_parser)
+    run_parser.add_argument("--requests", type=int, default=10000)
+    run_parser.add_argument("--threads", type=int, default=4)
+    run_parser.add_argument("--url", help="benchmark a running server instead of the app in-process")
+    run_parser.add_argument("--no-cache", action="store_true", help="disable the response cache (in-process only)")
+    run_parser.add_argument("--output", help="save the results as JSON, for compare")
+    compare_parser = commands.add_parser("compare", help="compare two saved runs")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="allowed p95 growth (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.before) as before, open(args.after) as after:
+            regressions = compare(json.load(before), json.load(after), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    scale = scale_of(args)
+    if args.command == "generate":
+        generate(args.database, scale)
+        print(f"wrote {args.database}")
+        return
+
+    if args.url:
+        client = HTTPClient(load_app(args.database), args.url)
+    else:
+        app = generate(args.database, scale)
+        app.config["CACHE_ENABLED"] = not args.no_cache
+        client = InProcessClient(app)
+    result = replay(client, build_requests(scale, args.requests), args.threads)
+    result["scale"] = scale
+    print_run(result)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(result, output, indent=2)
+
+if __name__ == "__main__":
+    main()
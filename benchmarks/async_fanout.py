@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+from sqlalchemy import select
+
+from app import app
+from extensions import db
+from models import Club
+import asgi
+
+# Async Fan-out Benchmark - GET /api/clubs/<club_name> under many concurrent clients, served by the sync Flask (WSGI)
+# path on a thread per client, and by the ASGI path (asgi.py) on one event loop with the per-club loads gathered
+# both run in-process against the app's database (point it at a generated dataset with CLUBREVIEW_DATABASE_URI,
+# see benchmarks/api_load.py); the response cache is turned off so every request reaches the database
+#   python -m benchmarks.async_fanout --clients 8 64 256 --seconds 5
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))] if sorted_values else 0
+
+def summarize(mode, clients, latencies, seconds):
+    latencies.sort()
+    return {"mode": mode, "clients": clients, "requests_per_second": len(latencies) / seconds,
+            "p50_ms": percentile(latencies, 0.50) * 1000, "p99_ms": percentile(latencies, 0.99) * 1000}
+
+def run_sync(paths, clients, seconds):
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        test_client = app.test_client()
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            test_client.get(random.choice(paths)).get_data()
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize("sync (WSGI)", clients, latencies, seconds)
+
+# calls the ASGI application directly, the way an ASGI server would for a bodiless GET
+async def asgi_get(path):
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"", "headers": [],
+             "server": ("benchmark", 80), "client": ("benchmark", 1)}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi.application(scope, receive, send)
+    return messages[0]["status"]
+
+async def run_async(paths, clients, seconds):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def client():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await asgi_get(random.choice(paths))
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    await asgi.store.dispose()
+    return summarize("async (ASGI)", clients, latencies, seconds)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the sync WSGI and async ASGI club routes under concurrency.")
+    parser.add_argument("--clients", type=int, nargs="+", default=[8, 64, 256])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--sample", type=int, default=1000, help="number of distinct clubs requested")
+    args = parser.parse_args()
+
+    app.config["CACHE_ENABLED"] = False
+    with app.app_context():
+        names = db.session.execute(select(Club.name).limit(args.sample)).scalars().all()
+    if not names:
+        parser.error("the database has no clubs - generate a dataset first")
+    paths = [f"/api/clubs/{name}" for name in names]
+
+    print(f"{'mode':<16}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for clients in args.clients:
+        for result in (run_sync(paths, clients, args.seconds), asyncio.run(run_async(paths, clients, args.seconds))):
+            print(f"{result['mode']:<16}{result['clients']:>8}{result['requests_per_second']:>10,.0f}"
+                  f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
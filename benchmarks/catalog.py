@@ -0,0 +1,114 @@
+import argparse
+import os
+import random
+import statistics
+import time
+from urllib.parse import quote
+
+from app import create_app
+from catalog import catalog
+from extensions import db
+from models import Club, User
+from pagination import encode_cursor
+
+# Catalog Benchmark - the club catalog (catalog.py) against the SQL read path on a dataset
+#   build     reading every club and tag into records
+#   memory    bytes held by the records and indexes
+#   routes    GET /api/clubs (a page of --limit clubs), /api/clubs/<name>, /api/tags and /api/tags/<name>, p50/p99
+#             with the catalog and without it (response cache off), and the SQL statements each one ran
+#   update    re-reading one club after a write (an edited description, or a new member)
+# the writes are flushed inside a transaction that is rolled back at the end (nothing is written to the database), and
+# every record is then compared with the database (catalog.check), so a missed refresh fails the run
+#   python -m benchmarks.api_load generate --database /tmp/bench.db --clubs 60000 --users 20000
+#   python -m benchmarks.catalog --database /tmp/bench.db
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def measure(client, urls):
+    latencies = []
+    statements = 0
+    for url in urls:
+        start = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise SystemExit(f"GET {url} returned {response.status_code}")
+        statements += int(response.headers["X-SQL-Queries"])
+    return latencies, statements / len(urls)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the club catalog against the SQL read path.")
+    parser.add_argument("--database", help="SQLite file to read (default: the app's database)")
+    parser.add_argument("--requests", type=int, default=500, help="requests per route and path")
+    parser.add_argument("--updates", type=int, default=200, help="club writes applied")
+    parser.add_argument("--limit", type=int, default=100, help="clubs per page")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    config = {"CACHE_ENABLED": False, "METRICS_ENABLED": True, "METRICS_DEBUG_HEADER": True}
+    if args.database:
+        config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.abspath(args.database)}"
+    app = create_app(config)
+    client = app.test_client()
+    rng = random.Random(args.seed)
+    with app.app_context():
+        start = time.perf_counter()
+        catalog.load()
+        build_seconds = time.perf_counter() - start
+        footprint = catalog.footprint()
+        club_names = list(catalog.club_order)
+        tag_names = list(catalog.tag_order)
+        usernames = db.session.execute(db.select(User.username)).scalars().all()
+    if not club_names or not tag_names:
+        raise SystemExit("the database has no clubs or tags")
+    print(f"{footprint['clubs']:,} clubs, {footprint['tags']:,} tags")
+    print(f"build       {build_seconds * 1000:10.0f} ms")
+    print(f"memory      {footprint['bytes'] / 2**20:10.1f} MiB"
+          f"{footprint['bytes'] / footprint['clubs']:8.0f} bytes per club")
+
+    routes = {
+        "clubs page": lambda: f"/api/clubs?limit={args.limit}&cursor={encode_cursor(rng.choice(club_names))}",
+        "club": lambda: f"/api/clubs/{quote(rng.choice(club_names), safe='')}",
+        "tags page": lambda: f"/api/tags?limit={args.limit}",
+        "tag": lambda: f"/api/tags/{quote(rng.choice(tag_names), safe='')}",
+    }
+    for route, url in routes.items():
+        urls = [url() for _ in range(args.requests)]
+        for enabled in (False, True):
+            app.config["CATALOG_ENABLED"] = enabled
+            latencies, statements = measure(client, urls)
+            print(f"{route:10}  {'catalog' if enabled else 'sql':7} {percentile(latencies, 0.5) * 1e6:8.0f} us p50"
+                  f"{percentile(latencies, 0.99) * 1e6:8.0f} us p99 {statements:5.1f} queries")
+
+    with app.app_context():
+        latencies = []
+        for _ in range(args.updates):
+            club = db.session.get(Club, rng.choice(club_names))
+            if rng.random() < 0.5:
+                club.description = f"edited {rng.random()}"
+                db.session.flush()
+                start = time.perf_counter()
+                catalog.apply("club_updated", {"club": club.name, "old_name": club.name, "tags": []})
+            else:
+                username = rng.choice(usernames)
+                club.add_members([username])
+                db.session.flush()
+                start = time.perf_counter()
+                catalog.apply("member_added", {"club": club.name, "user": username})
+            catalog.club(club.name)
+            latencies.append(time.perf_counter() - start)
+        if latencies:
+            print(f"update      {statistics.mean(latencies) * 1e3:10.2f} ms mean"
+                  f"{percentile(latencies, 0.99) * 1e3:8.2f} ms p99")
+        problems = catalog.check()
+        db.session.rollback()
+    for problem in problems[:20]:
+        print(problem)
+    if problems:
+        raise SystemExit(f"the catalog differs from the database in {len(problems)} places")
+    print("every club and tag matches the database")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import os
+import threading
+import time
+
+from passwords import PasswordHasher
+
+# Login Throughput Benchmark - password checks per second through the password hasher pool, per number of workers
+# client threads stand in for request threads that are all logging in at once; each check waits for a pool worker,
+# so throughput should grow with the worker count until it reaches the number of cores
+#   python -m benchmarks.login_throughput --rounds 10 --clients 32 --seconds 5 --executor thread
+
+def worker_counts(cores):
+    counts = []
+    count = 1
+    while count < cores:
+        counts.append(count)
+        count *= 2
+    return counts + [cores]
+
+def client(hasher, hashed, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        hasher.check("correct horse battery staple", hashed)
+        latencies.append(time.perf_counter() - start)
+
+def run(workers, args):
+    hasher = PasswordHasher(rounds=args.rounds, executor=args.executor, workers=workers, queue=args.clients,
+                            timeout=args.seconds * 10)
+    hashed = hasher.hash("correct horse battery staple")
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=client, args=(hasher, hashed, deadline, latencies)) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    hasher.shutdown()
+    latencies.sort()
+    return {
+        "workers": workers,
+        "logins_per_second": len(latencies) / args.seconds,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+    }
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Measure login (bcrypt check) throughput versus pool size.")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt work factor (BCRYPT_LOG_ROUNDS)")
+    parser.add_argument("--executor", default="thread", choices=["thread", "process"])
+    parser.add_argument("--workers", type=int, nargs="+", default=worker_counts(cores))
+    parser.add_argument("--clients", type=int, default=32, help="concurrent logins")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{cores} cores, bcrypt cost {args.rounds}, {args.clients} concurrent logins, {args.executor} pool")
+    print(f"{'workers':<10}{'logins/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for workers in args.workers:
+        result = run(workers, args)
+        print(f"{result['workers']:<10}{result['logins_per_second']:>12,.1f}"
+              f"{result['p50_ms']:>10,.1f}{result['p99_ms']:>10,.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import os
+import random
+import statistics
+import time
+
+from app import create_app
+from recommendations import ClubRecommender, NEIGHBORS
+
+# Recommendation Benchmark - the cost of the recommendation index (recommendations.py) on a dataset
+#   build      loading the user x club matrix and computing the neighbors of every club
+#   recommend  one user's top recommendations (p50/p99 over sampled users)
+#   update     applying one membership or favorite event and refreshing the affected neighbor lists
+# the updates are applied to the index only (nothing is written to the database), and at the end every neighbor list
+# is compared with a fresh computation from the same matrix, so a wrong incremental refresh fails the run
+#   python -m benchmarks.api_load generate --database /tmp/rec.db --users 100000 --clubs 5000
+#   python -m benchmarks.recommendations --database /tmp/rec.db
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure building, serving, and updating club recommendations.")
+    parser.add_argument("--database", help="SQLite file to read (default: the app's database)")
+    parser.add_argument("--requests", type=int, default=5000, help="recommendations served")
+    parser.add_argument("--updates", type=int, default=500, help="membership and favorite events applied")
+    parser.add_argument("--limit", type=int, default=10, help="recommendations per request")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    config = {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.abspath(args.database)}"} if args.database else None
+    app = create_app(config, serve=False)
+    rng = random.Random(args.seed)
+    recommender = ClubRecommender()
+    with app.app_context():
+        start = time.perf_counter()
+        recommender.load()
+        build_seconds = time.perf_counter() - start
+        usernames = sorted(recommender.rows)
+        club_names = [name for name in recommender.club_names if name is not None]
+        if not usernames:
+            raise SystemExit("the database has no memberships or favorites")
+        cells = sum(len(row) for row in recommender.rows.values())
+        print(f"{len(usernames):,} users x {len(club_names):,} clubs, {cells:,} cells, {NEIGHBORS} neighbors per club")
+        print(f"build       {build_seconds * 1000:10.0f} ms")
+
+        latencies = []
+        for _ in range(args.requests):
+            username = rng.choice(usernames)
+            start = time.perf_counter()
+            recommender.recommend(username, args.limit)
+            latencies.append(time.perf_counter() - start)
+        print(f"recommend   {percentile(latencies, 0.5) * 1e6:10.0f} us p50"
+              f"{percentile(latencies, 0.99) * 1e6:10.0f} us p99")
+
+        latencies = []
+        for _ in range(args.updates):
+            username = rng.choice(usernames)
+            row = recommender.rows.get(username, {})
+            names = [recommender.club_names[position] for position in row]
+            if names and rng.random() < 0.3:
+                event = rng.choice(["member_removed", "favorite_removed"])
+                club_name = rng.choice(names)
+            else:
+                event = rng.choice(["member_added", "favorite_added"])
+                club_name = rng.choice(club_names)
+            start = time.perf_counter()
+            recommender.apply(event, {"club": club_name, "user": username})
+            recommender.recommend(username, args.limit)
+            latencies.append(time.perf_counter() - start)
+        print(f"update      {statistics.mean(latencies) * 1e3:10.2f} ms mean"
+              f"{percentile(latencies, 0.99) * 1e3:8.2f} ms p99")
+
+        with recommender.reading():
+            for position, (positions, similarities) in enumerate(recommender.neighbors):
+                expected = recommender._similarities(position)
+                best = sorted(expected.values(), reverse=True)[:NEIGHBORS]
+                if [round(value, 9) for value in similarities] != [round(value, 9) for value in best] or any(
+                        abs(expected.get(other, 0.0) - value) > 1e-9 for other, value in zip(positions, similarities)):
+                    raise SystemExit(f"the neighbors of {recommender.club_names[position]!r} are out of date")
+        print("incremental neighbor lists match a full recomputation")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import os
+import random
+import statistics
+import time
+
+import related
+from app import create_app
+from extensions import db
+from models import Club
+from related import RelatedClubIndex, RELATED
+
+# Related Clubs Benchmark - the cost of the related-club index (related.py) on a dataset
+#   build    vectorizing every club and computing the related clubs of each (numpy, or --no-numpy for pure Python)
+#   related  one club's related clubs (p50/p99 over sampled clubs)
+#   update   re-vectorizing one edited club and patching the lists it appears in
+# the edits are flushed inside a transaction that is rolled back at the end (nothing is written to the database), and
+# every list is then compared with a fresh computation from the same vectors, so a wrong incremental refresh fails
+#   python -m benchmarks.api_load generate --database /tmp/related.db --clubs 5000
+#   python -m benchmarks.related --database /tmp/related.db
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure building, serving, and updating related clubs.")
+    parser.add_argument("--database", help="SQLite file to read (default: the app's database)")
+    parser.add_argument("--requests", type=int, default=5000, help="related-club lookups")
+    parser.add_argument("--updates", type=int, default=200, help="club descriptions edited")
+    parser.add_argument("--limit", type=int, default=10, help="related clubs per lookup")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-numpy", action="store_true", help="use the pure-Python similarity computation")
+    args = parser.parse_args()
+
+    if args.no_numpy:
+        related.USE_NUMPY = False
+    config = {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.abspath(args.database)}"} if args.database else None
+    app = create_app(config, serve=False)
+    rng = random.Random(args.seed)
+    index = RelatedClubIndex()
+    with app.app_context():
+        start = time.perf_counter()
+        index.load()
+        build_seconds = time.perf_counter() - start
+        club_names = list(index.club_ids)
+        if not club_names:
+            raise SystemExit("the database has no clubs")
+        terms = len({term for vector in index.vectors for term in vector})
+        print(f"{len(club_names):,} clubs, {terms:,} terms, {RELATED} related per club, "
+              f"{'numpy' if index.matrix is not None else 'pure Python'}")
+        print(f"build       {build_seconds * 1000:10.0f} ms")
+
+        latencies = []
+        for _ in range(args.requests):
+            club_name = rng.choice(club_names)
+            start = time.perf_counter()
+            index.related(club_name, args.limit)
+            latencies.append(time.perf_counter() - start)
+        print(f"related     {percentile(latencies, 0.5) * 1e6:10.0f} us p50"
+              f"{percentile(latencies, 0.99) * 1e6:10.0f} us p99")
+
+        words = [word for vector in index.vectors for word in vector if not word.startswith("tag:")]
+        latencies = []
+        for _ in range(args.updates):
+            club = db.session.get(Club, rng.choice(club_names))
+            club.description = " ".join(rng.choice(words) for _ in range(rng.randint(3, 15)))
+            db.session.flush()
+            start = time.perf_counter()
+            index.apply("club_updated", {"club": club.name, "old_name": club.name})
+            index.related(club.name, args.limit)
+            latencies.append(time.perf_counter() - start)
+        if latencies:
+            print(f"update      {statistics.mean(latencies) * 1e3:10.2f} ms mean"
+                  f"{percentile(latencies, 0.99) * 1e3:8.2f} ms p99")
+
+        for position, (positions, similarities) in enumerate(index.neighbors):
+            expected = index._similarities(position)
+            best = sorted(expected.values(), reverse=True)[:RELATED]
+            if [round(value, 9) for value in similarities] != [round(value, 9) for value in best] or any(
+                    abs(expected.get(other, 0.0) - value) > 1e-9 for other, value in zip(positions, similarities)):
+                raise SystemExit(f"the related clubs of {index.club_names[position]!r} are out of date")
+        print("incremental related-club lists match a full recomputation")
+        db.session.rollback()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import time
+
+from app import create_app
+from extensions import db
+from models import Club, User, Review
+from serializers import (compile_columns, load_associations, CLUB_COLUMNS, USER_COLUMNS, REVIEW_COLUMNS,
+    CLUB_ASSOCIATIONS, USER_ASSOCIATIONS)
+from encoding import orjson, msgpack, ORJSON_OPTIONS
+
+# Serialization Benchmark - microseconds (building the dicts, encoding them) and bytes per club, user, and review
+# for a list response, produced by
+#   getters + json      the previous path: one model getter call per field, then the stdlib encoder (as jsonify)
+#   compiled + json     the precompiled column serializers (serializers.py), stdlib encoder
+#   compiled + orjson   precompiled serializers, orjson (the JSON fast path when orjson is installed)
+#   compiled + msgpack  precompiled serializers, MessagePack (Accept: application/msgpack)
+# the list fields are loaded once beforehand - only building the dicts and encoding them is timed
+#   python -m benchmarks.serialization --database /tmp/bench.db --sample 2000
+# (generate a dataset with python -m benchmarks.api_load generate --database /tmp/bench.db)
+
+# model -> (model class, key column, getters of the previous path, compiled column expressions, list fields)
+MODELS = {
+    "club": (Club, "name", {
+        "code": Club.get_club_code, "name": Club.get_club_name, "description": Club.get_club_description,
+        "favorite_count": Club.get_favorite_count, "review_count": Club.get_review_count,
+        "rating_mean": Club.get_rating_mean, "rating_histogram": Club.get_rating_histogram,
+    }, CLUB_COLUMNS, CLUB_ASSOCIATIONS),
+    "user": (User, "username", {
+        "username": User.get_username, "email": User.get_user_email, "first_name": User.get_first_name,
+        "last_name": User.get_last_name,
+    }, USER_COLUMNS, USER_ASSOCIATIONS),
+    "review": (Review, "id", {
+        "id": Review.get_review_id, "title": Review.get_review_title, "rating": Review.get_review_rating,
+        "description": Review.get_review_description, "user": Review.get_review_user,
+        "club": Review.get_review_club,
+    }, REVIEW_COLUMNS, {}),
+}
+
+def build_with_getters(objs, key_column, getters, associations):
+    data = []
+    for obj in objs:
+        item = {field: getter(obj) for field, getter in getters.items()}
+        key = getattr(obj, key_column)
+        for field, grouped in associations.items():
+            item[field] = grouped.get(key, [])
+        data.append(item)
+    return data
+
+def build_compiled(objs, key_column, columns, associations):
+    serialize = compile_columns(columns)
+    data = []
+    for obj in objs:
+        item = serialize(obj)
+        key = getattr(obj, key_column)
+        for field, grouped in associations.items():
+            item[field] = grouped.get(key, [])
+        data.append(item)
+    return data
+
+def json_encode(data):
+    return json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+# path -> (build, encode), or None when the encoder isn't installed
+def get_paths():
+    return {
+        "getters + json": ("getters", json_encode),
+        "compiled + json": ("compiled", json_encode),
+        "compiled + orjson": ("compiled", lambda data: orjson.dumps(data, option=ORJSON_OPTIONS)) if orjson else None,
+        "compiled + msgpack": ("compiled", msgpack.packb) if msgpack else None,
+    }
+
+def best_time(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the cost of serializing clubs, users, and reviews.")
+    parser.add_argument("--database", help="SQLite file to read (default: the app's database)")
+    parser.add_argument("--sample", type=int, default=2000, help="objects of each model serialized per run")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per path (the fastest is reported)")
+    args = parser.parse_args()
+
+    config = {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.abspath(args.database)}"} if args.database else None
+    app = create_app(config, serve=False)
+    print(f"{'model':<8}{'path':<20}{'build us':>10}{'encode us':>11}{'total us':>10}{'bytes':>8}   (per object)")
+    with app.app_context():
+        for name, (model, key_column, getters, columns, association_queries) in MODELS.items():
+            objs = model.query.order_by(getattr(model, key_column)).limit(args.sample).all()
+            if not objs:
+                print(f"{name:<8}(no rows)")
+                continue
+            keys = [getattr(obj, key_column) for obj in objs]
+            associations = load_associations(association_queries, keys) if association_queries else {}
+            builds = {
+                "getters": lambda: build_with_getters(objs, key_column, getters, associations),
+                "compiled": lambda: build_compiled(objs, key_column, columns, associations),
+            }
+            built = {build: best_time(function, args.repeat) for build, function in builds.items()}
+            if built["getters"][1] != built["compiled"][1]:
+                raise SystemExit(f"the compiled {name} serializer disagrees with the getters")
+            for path, spec in get_paths().items():
+                if spec is None:
+                    print(f"{name:<8}{path:<20}{'not installed':>21}")
+                    continue
+                build, encode = spec
+                build_seconds, data = built[build]
+                encode_seconds, body = best_time(lambda: encode(data), args.repeat)
+                per_object = [seconds / len(objs) * 1e6 for seconds in (build_seconds, encode_seconds)]
+                print(f"{name:<8}{path:<20}{per_object[0]:>10.2f}{per_object[1]:>11.2f}{sum(per_object):>10.2f}"
+                      f"{len(body) / len(objs):>8.0f}")
+            db.session.expunge_all()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, insert, select, update
+
+from extensions import db
+from models import Club, User, members, favorites
+from storage import STORAGE_PROFILES, get_profile, install_pragmas
+
+# Storage Profile Benchmark - runs the same concurrent read/write mix against a fresh database per storage profile
+# readers load a club and its member names (the access_club query pattern); writers favorite a club and bump its
+# counter in one transaction (the access_user_favorites pattern)
+#   python -m benchmarks.sqlite_profile --readers 8 --writers 2 --seconds 5
+
+def seed(engine, clubs, users, memberships_per_user):
+    with engine.begin() as connection:
+        connection.execute(insert(Club.__table__), [
+            {"code": f"c{i}", "name": f"Club {i}", "description": "benchmark club", "favorite_count": 0}
+            for i in range(clubs)])
+        connection.execute(insert(User.__table__), [
+            {"username": f"u{i}", "email": f"u{i}@upenn.edu", "password": "x", "first_name": "U", "last_name": str(i)}
+            for i in range(users)])
+        connection.execute(insert(members), [
+            {"user_username": f"u{i}", "club_name": f"Club {club}"}
+            for i in range(users) for club in random.sample(range(clubs), memberships_per_user)])
+
+def reader(engine, clubs, deadline, counts):
+    done = 0
+    while time.perf_counter() < deadline:
+        name = f"Club {random.randrange(clubs)}"
+        with engine.connect() as connection:
+            connection.execute(select(Club).where(Club.name == name)).first()
+            connection.execute(
+                select(User.first_name, User.last_name)
+                .join(members, members.c.user_username == User.username)
+                .where(members.c.club_name == name)).all()
+        done += 1
+    counts.append(done)
+
+def writer(engine, clubs, users, deadline, counts, errors):
+    done = 0
+    while time.perf_counter() < deadline:
+        club = f"Club {random.randrange(clubs)}"
+        user = f"u{random.randrange(users)}"
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(favorites).prefix_with("OR IGNORE"), {"user_username": user, "club_name": club})
+                connection.execute(update(Club).where(Club.name == club).values(favorite_count=Club.favorite_count + 1))
+            done += 1
+        except Exception:
+            errors.append(1)
+    counts.append(done)
+
+def run_profile(profile_name, args):
+    directory = tempfile.mkdtemp(prefix=f"clubreview-{profile_name}-")
+    path = os.path.join(directory, "bench.db")
+    profile = get_profile(profile_name)
+    engine = create_engine(f"sqlite:///{path}", **profile["engine_options"])
+    install_pragmas(engine, profile_name)
+    db.metadata.create_all(engine)
+    seed(engine, args.clubs, args.users, args.memberships)
+
+    reads, writes, errors = [], [], []
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=reader, args=(engine, args.clubs, deadline, reads)) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(engine, args.clubs, args.users, deadline, writes, errors))
+                for _ in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    return {
+        "profile": profile_name,
+        "reads_per_second": sum(reads) / args.seconds,
+        "writes_per_second": sum(writes) / args.seconds,
+        "write_errors": len(errors),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare read/write throughput of the SQLite storage profiles.")
+    parser.add_argument("--profiles", nargs="+", default=list(STORAGE_PROFILES), choices=list(STORAGE_PROFILES))
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--clubs", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--memberships", type=int, default=3, help="clubs each user is a member of")
+    args = parser.parse_args()
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds}s per profile")
+    print(f"{'profile':<12}{'reads/s':>12}{'writes/s':>12}{'write errors':>14}")
+    for profile_name in args.profiles:
+        result = run_profile(profile_name, args)
+        print(f"{result['profile']:<12}{result['reads_per_second']:>12,.0f}"
+              f"{result['writes_per_second']:>12,.0f}{result['write_errors']:>14}")
+
+if __name__ == "__main__":
+    main()
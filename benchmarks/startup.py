@@ -0,0 +1,102 @@
+import argparse
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+# Startup Benchmark - cold start of a fresh interpreter for each way the app is started, and (with --importtime)
+# where that time goes according to python -X importtime, summed by top-level package
+#   python -m benchmarks.startup --runs 9 --importtime
+# "frameworks" is the floor set by importing Flask, Flask-SQLAlchemy and Flask-Login alone; every other scenario is
+# reported as the time it adds on top of that floor, which is what the budget below limits (--check exits with 1
+# when a scenario is over budget)
+
+# scenario -> command run in a new interpreter
+SCENARIOS = {
+    "interpreter": ["-c", "pass"],
+    "frameworks": ["-c", "import flask, flask_sqlalchemy, flask_login"],
+    # importing the module builds nothing
+    "import": ["-c", "import app"],
+    # bootstrap.py: database and models only
+    "seed": ["-c", "from app import create_app; create_app(serve=False)"],
+    # gunicorn app:app, flask run, asgi.py: the whole API
+    "worker": ["-c", "from app import app"],
+    # any flask --app app command has to build the app to find its commands
+    "cli": ["-m", "flask", "--app", "app", "--help"],
+}
+# milliseconds a scenario may add to the frameworks floor
+BUDGET_MS = {"import": 50, "seed": 150, "worker": 200, "cli": 250}
+
+def run(arguments, *options):
+    return subprocess.run([sys.executable, *options, *arguments], stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, text=True, check=True)
+
+# best of runs, in ms - the scenarios take turns, so a slow spell on the machine hits all of them alike, and only
+# the fastest run of each counts, since noise can only ever add time
+def measure(names, runs):
+    times = defaultdict(list)
+    for _ in range(runs):
+        for name in names:
+            start = time.perf_counter()
+            run(SCENARIOS[name])
+            times[name].append(time.perf_counter() - start)
+    return {name: min(times[name]) * 1000 for name in names}
+
+# import time:  self [us] | cumulative | imported package
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| +(\S+)")
+
+# self import time (ms) by top-level package, largest first
+def import_breakdown(arguments):
+    totals = defaultdict(int)
+    for line in run(arguments, "-X", "importtime").stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            totals[match.group(3).split(".")[0]] += int(match.group(1))
+    return sorted(((name, micros / 1000) for name, micros in totals.items()), key=lambda item: -item[1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup time of the app's entry points.")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--runs", type=int, default=9, help="runs per scenario (the fastest is reported)")
+    parser.add_argument("--importtime", action="store_true", help="show where each scenario's import time goes")
+    parser.add_argument("--top", type=int, default=12, help="packages shown per import time breakdown")
+    parser.add_argument("--check", action="store_true", help="exit with 1 if a scenario is over its budget")
+    args = parser.parse_args()
+
+    names = args.scenarios or list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario: {name}")
+    # one untimed run of each, so every scenario is measured with compiled bytecode on disk
+    timed = list(dict.fromkeys(["frameworks", *names]))
+    for name in timed:
+        run(SCENARIOS[name])
+    results = measure(timed, args.runs)
+    floor = results["frameworks"]
+    over_budget = []
+    print(f"{'scenario':<14}{'best ms':>9}{'+ floor ms':>12}{'budget':>9}")
+    for name in names:
+        budget = BUDGET_MS.get(name)
+        if budget is None:
+            print(f"{name:<14}{results[name]:>9.0f}")
+            continue
+        added = results[name] - floor
+        if added > budget:
+            over_budget.append(name)
+        print(f"{name:<14}{results[name]:>9.0f}{added:>12.0f}{budget:>9}{'  OVER' if added > budget else ''}")
+
+    if args.importtime:
+        for name in names:
+            if name in ("interpreter", "frameworks"):
+                continue
+            breakdown = import_breakdown(SCENARIOS[name])
+            print(f"\n{name}: {sum(ms for _, ms in breakdown):.0f}ms importing")
+            for package, ms in breakdown[:args.top]:
+                print(f"  {ms:8.1f}  {package}")
+    if args.check and over_budget:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
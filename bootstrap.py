@@ -1,43 +1,46 @@
 import os
-import json
+import argparse
 
-from app import app, db, DB_FILE
+from app import create_app, DB_FILE
+from extensions import db
 
 from models import Club, User, Review, Tag
+from importer import bulk_import
 
 def create_user():
-    user_josh = User(username="josh",email="josh@upenn.edu",password="awooga",first_name="Josh",last_name="Joshua")
+    user_josh = User(username="josh",email="josh@upenn.edu",first_name="Josh",last_name="Joshua")
+    user_josh.set_password("awooga")
     db.session.add(user_josh)
     db.session.commit()
 
-def load_data():
-    script_path = os.path.basename(__file__)
-    clubs_json_path = os.path.join(os.path.dirname(script_path), 'clubs.json')
+# streams clubs.json (or the given .json/.jsonl dump) into the database in batches, see importer.py
+def load_data(clubs_json_path=None, batch_size=5000):
+    if clubs_json_path is None:
+        script_path = os.path.basename(__file__)
+        clubs_json_path = os.path.join(os.path.dirname(script_path), 'clubs.json')
 
     if os.path.exists(clubs_json_path):
-        with open(clubs_json_path, 'r') as file:
-            clubs_data = json.load(file)
-            for club in clubs_data:
-                new_club = Club(code=club["code"],name=club["name"],description=club["description"])
-                db.session.add(new_club)
-                db.session.commit()
-                for tag_name in club["tags"]:
-                    tag = Tag.query.filter_by(name=tag_name).first()
-                    if tag:
-                        new_club.add_tag(tag)
-                    else:
-                        new_tag = Tag(name=tag_name)
-                        new_club.add_tag(new_tag)
+        bulk_import(clubs_json_path, batch_size=batch_size)
 
 
 # No need to modify the below code.
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the database and load a club dump into it.")
+    parser.add_argument("path", nargs="?", help="club dump to load (.json array or .jsonl), defaults to clubs.json")
+    parser.add_argument("--batch-size", type=int, default=5000, help="clubs inserted per transaction")
+    args = parser.parse_args()
+
     # Delete any existing database before bootstrapping a new one.
     LOCAL_DB_FILE = "instance/" + DB_FILE
     if os.path.exists(LOCAL_DB_FILE):
         os.remove(LOCAL_DB_FILE)
+    # the write-ahead log of the production storage profile must go with the database it belongs to
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(LOCAL_DB_FILE + suffix):
+            os.remove(LOCAL_DB_FILE + suffix)
 
-    with app.app_context():
+    # only the database and models - seeding needs none of the routes, caches, or request hooks
+    with create_app(serve=False).app_context():
         db.create_all()
         create_user()
-        load_data()
+        load_data(args.path, args.batch_size)
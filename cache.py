@@ -0,0 +1,331 @@
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, request, make_response
+
+from changes import catch_up
+from events import subscribe
+from encoding import response_format
+from extensions import db, app_local
+
+# Cache settings (override in app.config, set by init_app):
+#   CACHE_ENABLED      - turns the response cache on/off (default on)
+#   CACHE_BACKEND      - "memory" (per-process LRU dict), "sqlite" (a SQLite file shared by every worker process on the
+#                        machine, at CACHE_SQLITE_PATH) or "redis" (shared, needs the redis package and CACHE_REDIS_URL)
+#                        defaults to the CLUBREVIEW_CACHE_BACKEND environment variable, or "memory"
+#   CACHE_MAX_ENTRIES  - capacity of the memory and sqlite backends
+#   CACHE_TTL          - seconds before an entry expires even if nothing invalidated it
+#   CACHE_NAMESPACE    - prefixes every key (and names the default SQLite file and the Redis keys), so apps on
+#                        different databases never share entries; defaults to a hash of the database URL
+# the SQLite file is emptied (entries, versions, and a new epoch) whenever an app starts with it: the database may
+# have changed while nothing was running to invalidate it
+def init_app(app):
+    app.config.setdefault("CACHE_ENABLED", True)
+    app.config.setdefault("CACHE_BACKEND", os.environ.get("CLUBREVIEW_CACHE_BACKEND", "memory"))
+    app.config.setdefault("CACHE_MAX_ENTRIES", 1024)
+    app.config.setdefault("CACHE_TTL", 300)
+    app.config.setdefault("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    with app.app_context():
+        database_url = db.engine.url.render_as_string(hide_password=False)
+    app.config.setdefault("CACHE_NAMESPACE", hashlib.sha1(database_url.encode()).hexdigest()[:16])
+    app.config.setdefault("CACHE_SQLITE_PATH",
+        os.path.join(tempfile.gettempdir(), f"clubreview-cache-{app.config['CACHE_NAMESPACE']}.db"))
+    if app.config["CACHE_BACKEND"] == "sqlite":
+        with app.app_context():
+            response_cache.get_backend().clear()
+
+# Cache Backend (in-process) - an LRU dict of entries with per-entry expiry, plus the dependency version counters
+# versions live outside the LRU so they are never evicted (an evicted version would reset and revive stale entries)
+class MemoryCacheBackend:
+    shared = False
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.version_counters = {}
+        self.epoch = uuid.uuid4().hex
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def versions(self, names):
+        with self.lock:
+            return tuple(self.version_counters.get(name, 0) for name in names)
+
+    def bump(self, names):
+        with self.lock:
+            for name in names:
+                self.version_counters[name] = self.version_counters.get(name, 0) + 1
+
+    def size(self):
+        return len(self.entries)
+
+# Cache Backend (Redis) - entries and versions are shared by every process using the same Redis server
+# Redis handles expiry (SET EX) and eviction (configure maxmemory-policy allkeys-lru on the server)
+class RedisCacheBackend:
+    shared = True
+
+    def __init__(self, client, prefix="clubreview:cache:"):
+        self.client = client
+        self.prefix = prefix
+        self.client.setnx(prefix + "epoch", uuid.uuid4().hex)
+        self.epoch = self.client.get(prefix + "epoch").decode()
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + "entry:" + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + "entry:" + key, pickle.dumps(value), ex=ttl)
+
+    def versions(self, names):
+        if not names:
+            return ()
+        values = self.client.hmget(self.prefix + "versions", list(names))
+        return tuple(int(value) if value is not None else 0 for value in values)
+
+    def bump(self, names):
+        pipeline = self.client.pipeline()
+        for name in names:
+            pipeline.hincrby(self.prefix + "versions", name, 1)
+        pipeline.execute()
+
+    def size(self):
+        return None
+
+# Cache Backend (SQLite file) - entries and versions are shared by every process that opens the same file, so the
+# workers of a multi-process server share cached responses and see each other's invalidations without a server
+# the file runs in WAL mode without fsync (it only holds a cache); each thread of each process has its own connection,
+# and connections are reopened after a fork. past max_entries, the entries closest to expiry are evicted first
+class SqliteCacheBackend:
+    shared = True
+
+    def __init__(self, path, max_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.evictions = 0
+        connection = self.connect()
+        connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex,))
+        self.epoch = connection.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    def connect(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, expires REAL, value BLOB)")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_entries_expires ON entries (expires)")
+            connection.execute("CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, version INTEGER)")
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self.connect().execute(
+            "SELECT value FROM entries WHERE key = ? AND expires >= ?", (key, time.time())).fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def set(self, key, value, ttl):
+        connection = self.connect()
+        connection.execute("INSERT OR REPLACE INTO entries (key, expires, value) VALUES (?, ?, ?)",
+                           (key, time.time() + ttl, pickle.dumps(value)))
+        excess = connection.execute("SELECT count(*) FROM entries").fetchone()[0] - self.max_entries
+        if excess > 0:
+            connection.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY expires LIMIT ?)", (excess,))
+            self.evictions += excess
+
+    def versions(self, names):
+        if not names:
+            return ()
+        rows = dict(self.connect().execute(
+            f"SELECT name, version FROM versions WHERE name IN ({', '.join('?' * len(names))})", list(names)).fetchall())
+        return tuple(rows.get(name, 0) for name in names)
+
+    def bump(self, names):
+        self.connect().executemany(
+            "INSERT INTO versions (name, version) VALUES (?, 1) "
+            "ON CONFLICT (name) DO UPDATE SET version = version + 1", [(name,) for name in names])
+
+    def size(self):
+        return self.connect().execute("SELECT count(*) FROM entries").fetchone()[0]
+
+    # drops every entry and version and starts a new epoch, so no earlier entry or ETag matches again
+    def clear(self):
+        connection = self.connect()
+        self.epoch = uuid.uuid4().hex
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute("DELETE FROM entries")
+        connection.execute("DELETE FROM versions")
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('epoch', ?)", (self.epoch,))
+        connection.execute("COMMIT")
+
+# Response Cache - caches whole GET responses keyed by URL (and response format)
+# each cached route names the data it depends on (e.g. "club:Penn Memes Club"); every dependency has a version
+# counter that write events bump, and an entry is only served while its dependencies' versions are unchanged
+# every response also depends on "all", which bulk changes (counters_recomputed) bump
+# ETags are derived from the versions alone, so a matching If-None-Match returns 304 before any database or serialization work
+# the backend an app's config asks for - each app gets its own (see extensions.app_local)
+def _open_backend():
+    config = current_app.config
+    if config["CACHE_BACKEND"] == "redis":
+        import redis
+        return RedisCacheBackend(redis.Redis.from_url(config["CACHE_REDIS_URL"]),
+                                 f"clubreview:cache:{config['CACHE_NAMESPACE']}:")
+    if config["CACHE_BACKEND"] == "sqlite":
+        return SqliteCacheBackend(config["CACHE_SQLITE_PATH"], config["CACHE_MAX_ENTRIES"])
+    return MemoryCacheBackend(config["CACHE_MAX_ENTRIES"])
+
+class ResponseCache:
+    def __init__(self):
+        self.backend = app_local("response_cache", _open_backend)
+        self.stats = app_local("response_cache_stats",
+            lambda: {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0})
+
+    def get_backend(self):
+        return self.backend
+
+    def etag(self, key, versions):
+        digest = hashlib.sha1(f"{self.get_backend().epoch}|{key}|{versions}".encode()).hexdigest()
+        return digest[:32]
+
+    def invalidate(self, names):
+        self.get_backend().bump(names)
+        self.stats["invalidations"] += len(names)
+
+    def get_stats(self):
+        backend = self.get_backend()
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return dict(self.stats,
+            hit_rate=self.stats["hits"] / lookups if lookups else 0.0,
+            evictions=backend.evictions,
+            entries=backend.size(),
+            backend=current_app.config["CACHE_BACKEND"])
+
+    # wraps a view so its GET responses are cached; dependencies(**view_args) returns the names the response depends on
+    def cached(self, dependencies):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                if request.method != "GET" or not current_app.config["CACHE_ENABLED"]:
+                    return view(**kwargs)
+                backend = self.get_backend()
+                # a per-process backend learns of the other processes' writes from the change feed
+                if not backend.shared:
+                    catch_up()
+                names = ["all"] + dependencies(**kwargs)
+                versions = backend.versions(names)
+                # JSON and MessagePack responses to the same URL are cached (and tagged) separately
+                key = f"{current_app.config['CACHE_NAMESPACE']}|{request.full_path}|{response_format()}"
+                etag = self.etag(key, versions)
+
+                if request.if_none_match.contains_weak(etag):
+                    self.stats["not_modified"] += 1
+                    response = make_response("", 304)
+                    response.set_etag(etag, weak=True)
+                    return response
+
+                entry = backend.get(key)
+                if entry is not None and entry["versions"] == versions:
+                    self.stats["hits"] += 1
+                    response = make_response(entry["body"], entry["status"])
+                    response.mimetype = entry["mimetype"]
+                else:
+                    self.stats["misses"] += 1
+                    # the view reads indexes that may be up to CHANGES_POLL_INTERVAL behind the versions read above
+                    catch_up(force=True)
+                    response = make_response(view(**kwargs))
+                    if response.status_code == 200:
+                        backend.set(key, {
+                            "versions": versions,
+                            "body": response.get_data(),
+                            "status": response.status_code,
+                            "mimetype": response.mimetype,
+                        }, current_app.config["CACHE_TTL"])
+                if response.status_code == 200:
+                    response.set_etag(etag, weak=True)
+                return response
+            return wrapper
+        return decorator
+
+response_cache = ResponseCache()
+cached = response_cache.cached
+
+# dependency names - which cached responses each write event makes stale
+def club_key(club_name):
+    return f"club:{club_name}"
+
+def tag_key(tag_name):
+    return f"tag:{tag_name}"
+
+def _stale_names(name, payload):
+    if name == "counters_recomputed":
+        return ["all"]
+    if name == "club_created":
+        return ["clubs", club_key(payload["club"])]
+    if name == "club_updated":
+        names = ["clubs", club_key(payload["club"]), club_key(payload["old_name"])]
+        if payload["old_name"] != payload["club"]:
+            names += ["tags"] + [tag_key(tag_name) for tag_name in payload["tags"]]
+        return names
+    if name == "club_deleted":
+        return ["clubs", club_key(payload["club"]), "tags"] + [tag_key(tag_name) for tag_name in payload["tags"]]
+    if name in ("tag_added", "tag_removed"):
+        return ["clubs", club_key(payload["club"]), "tags", tag_key(payload["tag"])]
+    if name == "tag_created":
+        return ["tags", tag_key(payload["tag"])]
+    if name in ("tag_updated", "tag_deleted"):
+        names = ["tags", tag_key(payload["tag"]), tag_key(payload.get("old_name", payload["tag"]))]
+        if payload["clubs"]:
+            names += ["clubs"] + [club_key(club_name) for club_name in payload["clubs"]]
+        return names
+    if name in ("member_added", "member_removed", "officer_added", "officer_removed",
+                "favorite_added", "favorite_removed", "review_created", "review_updated", "review_deleted"):
+        return ["clubs", club_key(payload["club"])]
+    if name in ("user_updated", "user_deleted") and payload["clubs"]:
+        return ["clubs"] + [club_key(club_name) for club_name in payload["clubs"]]
+    return []
+
+def _invalidate(name, payload):
+    names = _stale_names(name, payload)
+    if names:
+        response_cache.invalidate(sorted(set(names)))
+
+# a shared backend already holds every process's invalidations; a per-process one also needs the replayed events
+def _invalidate_replayed(name, payload):
+    if not response_cache.get_backend().shared:
+        _invalidate(name, payload)
+
+subscribe(_invalidate, replayed=False)
+subscribe(_invalidate_replayed, local=False)
@@ -0,0 +1,233 @@
+import os
+import sys
+from array import array
+from bisect import insort
+
+from sqlalchemy import select
+
+from extensions import db, app_local
+from events import subscribe
+from indexes import MemoryIndex
+from models import Club, Tag
+from pagination import paginate_keys
+from serializers import (CLUB_COLUMNS, TAG_COLUMNS, CLUB_ASSOCIATIONS, TAG_ASSOCIATIONS, compile_columns,
+    load_associations, serialize_clubs, serialize_tags)
+
+# Club Catalog - an optional in-process read model that answers the club and tag reads from memory
+# (CATALOG_ENABLED, or CLUBREVIEW_CATALOG=1): one __slots__ record per club and per tag, and their sorted names
+def init_app(app):
+    app.config.setdefault("CATALOG_ENABLED", os.environ.get("CLUBREVIEW_CATALOG") == "1")
+
+# the fields each record holds - its columns as named in CLUB_COLUMNS/TAG_COLUMNS, then its list fields
+CLUB_RECORD_COLUMNS = (Club.code, Club.name, Club.description, Club.favorite_count, Club.review_count,
+    Club.rating_mean, Club.rating_histogram)
+TAG_RECORD_COLUMNS = (Tag.name, Tag.club_count)
+# columns stored as interned strings - names also appear in the list fields, and most histograms are alike
+INTERNED_COLUMNS = {"name", "rating_histogram"}
+
+# events that change one club (and the tag, for tag_added/tag_removed)
+CLUB_EVENTS = {"club_created", "member_added", "member_removed", "officer_added", "officer_removed",
+    "favorite_added", "favorite_removed", "tag_added", "tag_removed", "review_created", "review_updated",
+    "review_deleted"}
+
+class ClubRecord:
+    __slots__ = tuple(column.key for column in CLUB_RECORD_COLUMNS) + tuple(CLUB_ASSOCIATIONS)
+
+class TagRecord:
+    __slots__ = tuple(column.key for column in TAG_RECORD_COLUMNS) + tuple(TAG_ASSOCIATIONS)
+
+# the list fields are stored as tuples of interned strings (one copy of each name, however many lists hold it) or,
+# for review ids, as an array of ints
+def _names(values):
+    return tuple(sys.intern(value) for value in values) if values else ()
+
+def _ids(values):
+    return array("i", values or ())
+
+# serializes records the way serializers.py serializes model objects, so responses are the same either way
+def _serialize_records(records, columns, associations, fields):
+    serialize = compile_columns(columns, fields)
+    list_fields = [field for field in associations if fields is None or field in fields]
+    data = []
+    for record in records:
+        item = serialize(record)
+        for field in list_fields:
+            item[field] = list(getattr(record, field))
+        data.append(item)
+    return data
+
+# the size of an object and of every object it holds that isn't in seen (strings shared by many records count once)
+def _size(obj, seen):
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list)):
+        size += sum(_size(item, seen) for item in obj)
+    elif isinstance(obj, dict):
+        size += sum(_size(key, seen) + _size(value, seen) for key, value in obj.items())
+    elif hasattr(obj, "__slots__"):
+        size += sum(_size(getattr(obj, slot), seen) for slot in obj.__slots__)
+    return size
+
+# a serialized object with its list fields sorted (the database returns them in no particular order)
+def _normalized(item, associations):
+    return {field: sorted(value) if field in associations else value for field, value in item.items()}
+
+class ClubCatalog(MemoryIndex):
+    def _reset(self):
+        self.clubs = {}             # club name -> ClubRecord
+        self.tags = {}              # tag name -> TagRecord
+        self.club_order = []        # club names, sorted
+        self.tag_order = []         # tag names, sorted
+        self.dirty = set()          # names of the clubs changed since the last read
+        self.dirty_tags = set()
+
+    # reads every club and tag with their list fields (one query per table and per list field)
+    def _build(self):
+        self._read_clubs(None)
+        self._read_tags(None)
+
+    def _dirty_count(self):
+        return max(len(self.dirty), len(self.dirty_tags))
+
+    def _refresh(self):
+        club_names, self.dirty = self.dirty, set()
+        tag_names, self.dirty_tags = self.dirty_tags, set()
+        if club_names:
+            self._read_clubs(list(club_names))
+        if tag_names:
+            self._read_tags(list(tag_names))
+
+    # reads the given clubs (all of them for None) into records - the given names that no longer exist are removed
+    def _read_clubs(self, names):
+        statement = select(*CLUB_RECORD_COLUMNS)
+        if names is not None:
+            statement = statement.where(Club.name.in_(names))
+        rows = db.session.execute(statement).all()
+        associations = load_associations(CLUB_ASSOCIATIONS, names)
+        self._store(rows, associations, self.clubs, self.club_order, ClubRecord, CLUB_RECORD_COLUMNS,
+            {"tags": _names, "members": _names, "officers": _names, "reviews": _ids})
+        for name in set(names or ()) - {row.name for row in rows}:
+            self._remove(name, self.clubs, self.club_order)
+
+    def _read_tags(self, names):
+        statement = select(*TAG_RECORD_COLUMNS)
+        if names is not None:
+            statement = statement.where(Tag.name.in_(names))
+        rows = db.session.execute(statement).all()
+        associations = load_associations(TAG_ASSOCIATIONS, names)
+        self._store(rows, associations, self.tags, self.tag_order, TagRecord, TAG_RECORD_COLUMNS,
+            {"tagged_clubs": _names})
+        for name in set(names or ()) - {row.name for row in rows}:
+            self._remove(name, self.tags, self.tag_order)
+
+    # creates or overwrites one record per row - converters turns each list field into its stored form
+    def _store(self, rows, associations, records, order, record_class, columns, converters):
+        keys = [column.key for column in columns]
+        added = []
+        for row in rows:
+            name = sys.intern(row.name)
+            record = records.get(name)
+            if record is None:
+                record = records[name] = record_class()
+                added.append(name)
+            for key, value in zip(keys, row):
+                setattr(record, key, sys.intern(value) if key in INTERNED_COLUMNS and value else value)
+            for field, convert in converters.items():
+                setattr(record, field, convert(associations[field].get(name)))
+        if len(added) > 1:
+            order.extend(added)
+            order.sort()
+        elif added:
+            insort(order, added[0])
+
+    def _remove(self, name, records, order):
+        if records.pop(name, None) is not None:
+            order.remove(name)
+
+    def _apply(self, name, payload):
+        if name in CLUB_EVENTS:
+            self.dirty.add(payload["club"])
+            if "tag" in payload:
+                self.dirty_tags.add(payload["tag"])
+        elif name in ("club_updated", "club_deleted"):
+            # the tags list the club by name
+            self.dirty.update((payload["club"], payload.get("old_name", payload["club"])))
+            self.dirty_tags.update(payload["tags"])
+        elif name in ("tag_created", "tag_updated", "tag_deleted"):
+            self.dirty_tags.update((payload["tag"], payload.get("old_name", payload["tag"])))
+            self.dirty.update(payload.get("clubs", ()))
+        elif name in ("user_updated", "user_deleted"):
+            # member and officer lists hold full names
+            self.dirty.update(payload["clubs"])
+        elif name == "counters_recomputed":
+            self.loaded = False
+
+    # one page of clubs (see pagination.paginate_keys), serialized with the given fields, and the next cursor
+    def club_page(self, fields=None):
+        with self.reading():
+            names, next_cursor = paginate_keys(self.club_order)
+            clubs = _serialize_records([self.clubs[name] for name in names], CLUB_COLUMNS, CLUB_ASSOCIATIONS, fields)
+            return clubs, next_cursor
+
+    def tag_page(self, fields=None):
+        with self.reading():
+            names, next_cursor = paginate_keys(self.tag_order)
+            tags = _serialize_records([self.tags[name] for name in names], TAG_COLUMNS, TAG_ASSOCIATIONS, fields)
+            return tags, next_cursor
+
+    # one serialized club or tag - None when it doesn't exist
+    def club(self, name):
+        with self.reading():
+            record = self.clubs.get(name)
+            return _serialize_records([record], CLUB_COLUMNS, CLUB_ASSOCIATIONS, None)[0] if record else None
+
+    def tag(self, name):
+        with self.reading():
+            record = self.tags.get(name)
+            return _serialize_records([record], TAG_COLUMNS, TAG_ASSOCIATIONS, None)[0] if record else None
+
+    # the number of records and the bytes they take (records, their values, and the name indexes), by part
+    # strings shared by several records are counted once, in the part that reaches them first
+    def footprint(self):
+        with self.reading():
+            seen = set()
+            parts = {
+                "clubs": sum(_size(record, seen) for record in self.clubs.values()),
+                "tags": sum(_size(record, seen) for record in self.tags.values()),
+                "indexes": _size(self.clubs, seen) + _size(self.tags, seen)
+                    + _size(self.club_order, seen) + _size(self.tag_order, seen),
+            }
+            return {"clubs": len(self.clubs), "tags": len(self.tags), "bytes": sum(parts.values()),
+                "bytes_by_part": parts}
+
+    # compares every record with the same club or tag serialized from the database - returns the differences found
+    def check(self):
+        with self.reading():
+            problems = []
+            expected = serialize_clubs(Club.query.all(), all_clubs=True)
+            actual = _serialize_records(self.clubs.values(), CLUB_COLUMNS, CLUB_ASSOCIATIONS, None)
+            problems += self._compare("club", expected, actual, CLUB_ASSOCIATIONS)
+            expected = serialize_tags(Tag.query.all())
+            actual = _serialize_records(self.tags.values(), TAG_COLUMNS, TAG_ASSOCIATIONS, None)
+            problems += self._compare("tag", expected, actual, TAG_ASSOCIATIONS)
+            if self.club_order != sorted(self.clubs):
+                problems.append("the club order is not sorted by name")
+            if self.tag_order != sorted(self.tags):
+                problems.append("the tag order is not sorted by name")
+            return problems
+
+    def _compare(self, kind, expected, actual, associations):
+        expected = {item["name"]: _normalized(item, associations) for item in expected}
+        actual = {item["name"]: _normalized(item, associations) for item in actual}
+        problems = [f"{kind} {name!r} is missing" for name in sorted(set(expected) - set(actual))]
+        problems += [f"{kind} {name!r} no longer exists" for name in sorted(set(actual) - set(expected))]
+        for name in sorted(set(expected) & set(actual)):
+            for field, value in expected[name].items():
+                if actual[name].get(field) != value:
+                    problems.append(f"{kind} {name!r}: {field} is {actual[name].get(field)!r}, expected {value!r}")
+        return problems
+
+catalog = app_local("catalog", ClubCatalog)
+subscribe(lambda name, payload: catalog.apply(name, payload))
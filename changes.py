@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import aliased
+
+from events import replay
+from extensions import db, app_local
+from models import Change
+
+# Change Feed - an append-only log of every write, so clients can sync deltas instead of re-reading whole lists
+# every event staged on the session (see events.py) is also inserted into the change table just before the
+# session commits, so an entry commits or rolls back together with the change it describes
+# SQLite runs one write transaction at a time, so entries commit in sequence order - a client that has applied
+# everything up to seq N never misses an entry that commits later with a smaller number
+# clients read GET /api/changes?since=<last seq they applied> and refetch the objects the entries name
+# Compaction - entries older than CHANGES_COMPACT_AFTER seconds are deleted when a newer entry has the same key
+# (e.g. only the last of a club's updates, or the last add/remove of one membership, is kept), so the log grows with
+# the number of objects rather than the number of writes; recent entries are never compacted
+#   flask --app app compact-changes
+def init_app(app):
+    app.config.setdefault("CHANGES_COMPACT_AFTER", 7 * 24 * 60 * 60)
+    app.config.setdefault("CHANGES_FOLLOW", os.environ.get("CLUBREVIEW_FOLLOW_CHANGES") == "1")
+    app.config.setdefault("CHANGES_POLL_INTERVAL", float(os.environ.get("CLUBREVIEW_POLL_INTERVAL", 1.0)))
+
+# events that change nothing a client reads (a new password hash), so they are not logged
+UNLOGGED_EVENTS = {"password_changed"}
+
+# association events name the club and the other end of the association
+ASSOCIATION_ENDS = {"member": "user", "officer": "user", "favorite": "user", "tag": "tag"}
+
+# the object or association an event changed - e.g. ["club", "Penn Memes Club"] for club_updated, or
+# ["member", "Penn Memes Club", "josh"] for member_added and member_removed
+def change_key(name, payload):
+    kind, _, action = name.rpartition("_")
+    if action in ("added", "removed"):
+        key = [kind, payload["club"], payload[ASSOCIATION_ENDS[kind]]]
+    else:
+        key = [kind, payload[kind]]
+    return json.dumps(key, separators=(",", ":"))
+
+def _record_changes(session):
+    events = [(name, payload) for name, payload in session.info.get("pending_events", ())
+              if name not in UNLOGGED_EVENTS]
+    if not events:
+        return
+    now = time.time()
+    seqs = session.execute(insert(Change).returning(Change.seq), [
+        {"event": name, "key": change_key(name, payload), "payload": json.dumps(payload, separators=(",", ":")),
+         "created_at": now}
+        for name, payload in events]).scalars().all()
+    # marked as this process's before they commit, so a concurrent catch_up never replays entries whose events
+    # events.py dispatches here after the commit (an event applied twice would count twice in the incremental indexes)
+    feed_follower.remember(seqs)
+    session.info.setdefault("change_seqs", []).extend(seqs)
+
+def _committed_changes(session):
+    session.info.pop("change_seqs", None)
+
+# rolled back entries never existed, and another process may commit entries with the same numbers
+def _discard_changes(session):
+    seqs = session.info.pop("change_seqs", ())
+    if seqs:
+        feed_follower.forget(seqs)
+
+event.listen(db.session, "before_commit", _record_changes)
+event.listen(db.session, "after_commit", _committed_changes)
+event.listen(db.session, "after_rollback", _discard_changes)
+
+def get_latest_seq():
+    return db.session.execute(select(func.max(Change.seq))).scalar() or 0
+
+# Cross-Process Sync - each process keeps its own in-memory indexes, and events.py hands a write's events only to the
+# process that committed it; with CHANGES_FOLLOW on, catch_up() replays the entries other processes committed, polling
+# the feed (one indexed max(seq) lookup) at most every CHANGES_POLL_INTERVAL seconds. a lone process is the only
+# writer and never polls, so CHANGES_FOLLOW is off unless gunicorn.conf.py runs several workers
+# replaying takes the indexes' locks, so catch_up must not be called while holding one
+CATCH_UP_BATCH = 1000
+
+class FeedFollower:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seq = None         # the last entry applied in this process
+        self.local = set()      # entries after seq committed by this process
+        self.polled = 0.0       # when the feed was last polled (time.monotonic)
+
+    def remember(self, seqs):
+        with self.lock:
+            if self.seq is not None:
+                self.local.update(seqs)
+
+    def forget(self, seqs):
+        with self.lock:
+            self.local.difference_update(seqs)
+
+    # replays the entries committed by other processes since the last poll - returns how many were replayed
+    # the first call only records where the feed is, so call it before building an index (gunicorn's master does);
+    # force polls even within CHANGES_POLL_INTERVAL of the last poll
+    def catch_up(self, force=False):
+        config = current_app.config
+        if not config["CHANGES_FOLLOW"]:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            if not force and self.seq is not None and now - self.polled < config["CHANGES_POLL_INTERVAL"]:
+                return 0
+            self.polled = now
+            latest = get_latest_seq()
+            if self.seq is None:
+                self.seq = latest
+            if latest <= self.seq:
+                return 0
+            replayed = 0
+            while self.seq < latest:
+                rows = db.session.execute(
+                    select(Change.seq, Change.event, Change.payload)
+                    .where(Change.seq > self.seq, Change.seq <= latest).order_by(Change.seq).limit(CATCH_UP_BATCH)).all()
+                if not rows:
+                    break
+                for seq, name, payload in rows:
+                    if seq in self.local:
+                        self.local.discard(seq)
+                    else:
+                        replay(name, json.loads(payload))
+                        replayed += 1
+                self.seq = rows[-1].seq
+            self.seq = latest
+            self.local = {seq for seq in self.local if seq > latest}
+            return replayed
+
+feed_follower = app_local("feed_follower", FeedFollower)
+
+def catch_up(force=False):
+    return feed_follower.catch_up(force)
+
+# returns up to limit entries after since, oldest first, and whether more follow
+def get_changes(since, limit):
+    rows = db.session.execute(
+        select(Change.seq, Change.event, Change.created_at, Change.payload)
+        .where(Change.seq > since).order_by(Change.seq).limit(limit + 1)).all()
+    changes = [{"seq": seq, "event": name, "at": created_at, "data": json.loads(payload)}
+               for seq, name, created_at, payload in rows[:limit]]
+    return changes, len(rows) > limit
+
+# deletes entries older than older_than seconds (default CHANGES_COMPACT_AFTER) that a newer entry with the same key
+# supersedes - one pass over the table, with the (key, seq) index answering each "is there a newer one" lookup
+# like the other helpers this only stages the delete - the caller commits; returns the number of entries deleted
+def compact_changes(older_than=None):
+    if older_than is None:
+        older_than = current_app.config["CHANGES_COMPACT_AFTER"]
+    newer = aliased(Change)
+    superseded = select(newer.seq).where(newer.key == Change.key, newer.seq > Change.seq).exists()
+    result = db.session.execute(
+        delete(Change).where(Change.created_at < time.time() - older_than, superseded)
+        .execution_options(synchronize_session=False))
+    return result.rowcount
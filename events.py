@@ -0,0 +1,45 @@
+from collections import defaultdict
+
+from sqlalchemy import event
+
+from extensions import db
+
+# Write Events - model helpers and routes emit an event for every change they stage, e.g.
+#   emit("member_added", club="Penn Memes Club", user="josh")
+# events are held on the session and handed to subscribers only after the transaction commits,
+# so caches and in-memory indexes never see changes that were rolled back
+# payloads hold plain names/ids (never ORM objects), since the objects are expired once the commit finishes
+
+_subscribers = defaultdict(list)
+_replay_subscribers = defaultdict(list)
+
+# registers handler(name, payload) for the given event names (or for every event when names is None)
+# the handler gets the events this process commits (local) and, replayed from the change feed, the events other
+# processes commit (replayed, see changes.catch_up) - state that every process already shares needs only the local ones
+def subscribe(handler, names=None, local=True, replayed=True):
+    for name in names or ["*"]:
+        if local:
+            _subscribers[name].append(handler)
+        if replayed:
+            _replay_subscribers[name].append(handler)
+
+# stages an event on the current session
+def emit(name, **payload):
+    db.session.info.setdefault("pending_events", []).append((name, payload))
+
+def _dispatch(session):
+    events = session.info.pop("pending_events", [])
+    for name, payload in events:
+        for handler in _subscribers[name] + _subscribers["*"]:
+            handler(name, payload)
+
+# hands an event committed by another process to this process's handlers
+def replay(name, payload):
+    for handler in _replay_subscribers[name] + _replay_subscribers["*"]:
+        handler(name, payload)
+
+def _discard(session):
+    session.info.pop("pending_events", None)
+
+event.listen(db.session, "after_commit", _dispatch)
+event.listen(db.session, "after_rollback", _discard)
@@ -0,0 +1,71 @@
+import zlib
+
+from flask import Response, current_app, request, stream_with_context
+from sqlalchemy import select
+
+from extensions import db
+from models import Club, User, Review, Tag
+from serializers import (serialize_clubs, serialize_users, serialize_reviews, serialize_tags,
+    CLUB_FIELDS, USER_FIELDS, REVIEW_FIELDS, TAG_FIELDS)
+
+# Streaming Export - writes a whole table as JSON or NDJSON without building it in memory
+# rows are read EXPORT_CHUNK_SIZE at a time (yield_per keeps the cursor open and fetches in chunks), each chunk is
+# serialized with the batched serializers (one query per list field per chunk) and sent before the next is read,
+# so memory stays bounded by one chunk and the first bytes go out as soon as the first chunk is ready
+# with "Accept-Encoding: gzip" the stream is compressed on the fly, flushed after every chunk
+def init_app(app):
+    app.config.setdefault("EXPORT_CHUNK_SIZE", 1000)
+
+# collection -> (model, serializer, allowed fields, order column)
+EXPORTS = {
+    "clubs": (Club, serialize_clubs, CLUB_FIELDS, Club.name),
+    "users": (User, serialize_users, USER_FIELDS, User.username),
+    "reviews": (Review, serialize_reviews, REVIEW_FIELDS, Review.id),
+    "tags": (Tag, serialize_tags, TAG_FIELDS, Tag.name),
+}
+FORMATS = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+# yields lists of serialized objects, one chunk of rows at a time
+def iter_chunks(collection, fields=None):
+    model, serialize, allowed_fields, order_column = EXPORTS[collection]
+    statement = select(model).order_by(order_column).execution_options(yield_per=current_app.config["EXPORT_CHUNK_SIZE"])
+    for rows in db.session.execute(statement).scalars().partitions():
+        yield serialize(rows, fields=fields)
+
+# yields the export as text pieces - a {"<collection>": [...]} document, or one object per line for ndjson
+def iter_export(collection, format="json", fields=None):
+    dumps = lambda item: current_app.json.dumps(item, separators=(",", ":"))
+    if format == "ndjson":
+        for chunk in iter_chunks(collection, fields):
+            yield "".join(dumps(item) + "\n" for item in chunk)
+        return
+    yield f'{{"{collection}":['
+    first = True
+    for chunk in iter_chunks(collection, fields):
+        if chunk:
+            yield ("" if first else ",") + ",".join(dumps(item) for item in chunk)
+            first = False
+    yield "]}"
+
+def _gzip(pieces):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        data = compressor.compress(piece.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _accepts_gzip():
+    return any(encoding.strip().split(";")[0] == "gzip"
+               for encoding in request.headers.get("Accept-Encoding", "").split(","))
+
+# builds the streamed response for the current request
+def export_response(collection, format="json", fields=None):
+    pieces = iter_export(collection, format, fields)
+    headers = {"Vary": "Accept-Encoding"}
+    if _accepts_gzip():
+        body = _gzip(pieces)
+        headers["Content-Encoding"] = "gzip"
+    else:
+        body = (piece.encode("utf-8") for piece in pieces)
+    return Response(stream_with_context(body), mimetype=FORMATS[format], headers=headers)
@@ -0,0 +1,23 @@
+import threading
+
+from flask import current_app
+from flask_sqlalchemy import SQLAlchemy
+from werkzeug.local import LocalProxy
+
+# the database extension, created unbound so models and helpers can import it without building an app -
+# create_app (see app.py) binds it with db.init_app
+db = SQLAlchemy()
+
+_app_local_lock = threading.Lock()
+
+# a proxy to an object kept per app in app.extensions[name], made by factory() on first use in that app - in-memory
+# indexes and caches hold one database's data, so two apps (e.g. a test's create_app next to the shared one) never share them
+def app_local(name, factory):
+    def get():
+        extensions = current_app.extensions
+        if name not in extensions:
+            with _app_local_lock:
+                if name not in extensions:
+                    extensions[name] = factory()
+        return extensions[name]
+    return LocalProxy(get)
@@ -0,0 +1,258 @@
+import re
+from collections import defaultdict
+
+from sqlalchemy import func, select
+
+from extensions import db, app_local
+from events import subscribe
+from indexes import MemoryIndex
+from models import Club, tags, members
+
+# Tag Facets - an in-memory index answering tag filters like Technology AND (Arts OR "Pre-Professional")
+# every tag is one int with a bit set per club, so AND/OR/NOT are big-integer operations and facets are popcounts
+_TOKEN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+))')
+_OPERATORS = ("AND", "OR", "NOT")
+
+# splits a filter expression into "(", ")", operators, and tag names - consecutive bare words form one tag name
+def tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    after_word = False
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if match is None:
+            raise ValueError(f"Invalid filter expression near: {expression[position:]}")
+        position = match.end()
+        open_paren, close_paren, quoted, word = match.groups()
+        if open_paren or close_paren:
+            tokens.append(open_paren or close_paren)
+        elif quoted is not None:
+            tokens.append(("tag", quoted))
+        elif word.upper() in _OPERATORS:
+            tokens.append(word.upper())
+        elif after_word:
+            tokens[-1] = ("tag", f"{tokens[-1][1]} {word}")
+        else:
+            tokens.append(("tag", word))
+        after_word = word is not None and word.upper() not in _OPERATORS
+    return tokens
+
+# parses a filter expression into a tree of ("tag", name), ("not", node), ("and", left, right), ("or", left, right)
+# NOT binds tightest, then AND, then OR
+def parse(expression):
+    tokens = tokenize(expression)
+    if not tokens:
+        raise ValueError("Empty filter expression")
+    node, position = _parse_or(tokens, 0)
+    if position != len(tokens):
+        raise ValueError(f"Unexpected {_describe(tokens[position])} in filter expression")
+    return node
+
+def _describe(token):
+    return f"tag {token[1]!r}" if isinstance(token, tuple) else repr(token)
+
+def _parse_or(tokens, position):
+    left, position = _parse_and(tokens, position)
+    while position < len(tokens) and tokens[position] == "OR":
+        right, position = _parse_and(tokens, position + 1)
+        left = ("or", left, right)
+    return left, position
+
+def _parse_and(tokens, position):
+    left, position = _parse_not(tokens, position)
+    while position < len(tokens) and tokens[position] == "AND":
+        right, position = _parse_not(tokens, position + 1)
+        left = ("and", left, right)
+    return left, position
+
+def _parse_not(tokens, position):
+    if position >= len(tokens):
+        raise ValueError("Filter expression ends unexpectedly")
+    token = tokens[position]
+    if token == "NOT":
+        node, position = _parse_not(tokens, position + 1)
+        return ("not", node), position
+    if token == "(":
+        node, position = _parse_or(tokens, position + 1)
+        if position >= len(tokens) or tokens[position] != ")":
+            raise ValueError("Missing ) in filter expression")
+        return node, position + 1
+    if isinstance(token, tuple):
+        return token, position + 1
+    raise ValueError(f"Unexpected {_describe(token)} in filter expression")
+
+def _popcount(bits):
+    return bin(bits).count("1")
+
+# yields the positions of the set bits, lowest first
+def _positions(bits):
+    digits = bin(bits)[:1:-1]
+    position = digits.find("1")
+    while position != -1:
+        yield position
+        position = digits.find("1", position + 1)
+
+# builds a bitmap from a list of bit positions in one pass (setting bits one at a time copies the whole int each time)
+def _bitmap(positions, size):
+    buffer = bytearray((size + 7) // 8)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, "little")
+
+class TagBitmapIndex(MemoryIndex):
+    def _reset(self):
+        self.club_ids = {}          # club name -> bit position
+        self.club_names = []        # bit position -> club name (None once the club is deleted)
+        self.free_ids = []          # positions of deleted clubs, reused by new clubs
+        self.all_clubs = 0          # bits of every live club
+        self.tag_bitmaps = {}       # tag name -> bits of its clubs
+        self.member_counts = []     # bit position -> number of members
+        self.rating_means = []      # bit position -> mean rating (None without reviews)
+        self.dirty = set()          # clubs whose counts changed since they were read
+
+    # reads every club, tag link, and member count (three queries)
+    def _build(self):
+        for name, rating_mean in db.session.execute(select(Club.name, Club.rating_mean)).all():
+            self.club_ids[name] = len(self.club_names)
+            self.club_names.append(name)
+            self.rating_means.append(rating_mean)
+        size = len(self.club_names)
+        self.all_clubs = (1 << size) - 1
+        self.member_counts = [0] * size
+        rows = db.session.execute(
+            select(members.c.club_name, func.count()).group_by(members.c.club_name)).all()
+        for name, count in rows:
+            if name in self.club_ids:
+                self.member_counts[self.club_ids[name]] = count
+        positions = defaultdict(list)
+        for club_name, tag_name in db.session.execute(select(tags.c.club_name, tags.c.tag_name)).all():
+            if club_name in self.club_ids:
+                positions[tag_name].append(self.club_ids[club_name])
+        self.tag_bitmaps = {tag_name: _bitmap(ids, size) for tag_name, ids in positions.items()}
+
+    # re-reads the rating and member count of the changed clubs, adding clubs that are new to the index
+    def _refresh(self):
+        club_names, self.dirty = list(self.dirty), set()
+        ratings = dict(db.session.execute(
+            select(Club.name, Club.rating_mean).where(Club.name.in_(club_names))).all())
+        counts = dict(db.session.execute(
+            select(members.c.club_name, func.count())
+            .where(members.c.club_name.in_(club_names)).group_by(members.c.club_name)).all())
+        for name in club_names:
+            if name not in ratings:
+                continue
+            position = self.club_ids.get(name)
+            if position is None:
+                position = self._add_club(name)
+            self.rating_means[position] = ratings[name]
+            self.member_counts[position] = counts.get(name, 0)
+
+    def _add_club(self, name):
+        if self.free_ids:
+            position = self.free_ids.pop()
+            self.club_names[position] = name
+        else:
+            position = len(self.club_names)
+            self.club_names.append(name)
+            self.member_counts.append(0)
+            self.rating_means.append(None)
+        self.club_ids[name] = position
+        self.all_clubs |= 1 << position
+        return position
+
+    def _remove_club(self, name):
+        position = self.club_ids.pop(name, None)
+        if position is None:
+            return
+        bit = 1 << position
+        self.all_clubs &= ~bit
+        for tag_name in [tag_name for tag_name, bits in self.tag_bitmaps.items() if bits & bit]:
+            self.tag_bitmaps[tag_name] &= ~bit
+        self.club_names[position] = None
+        self.member_counts[position] = 0
+        self.rating_means[position] = None
+        self.free_ids.append(position)
+
+    def _apply(self, name, payload):
+        if name in ("tag_added", "tag_removed"):
+            position = self.club_ids.get(payload["club"])
+            if position is None:
+                self.dirty.add(payload["club"])
+                position = self._add_club(payload["club"])
+            bits = self.tag_bitmaps.get(payload["tag"], 0)
+            if name == "tag_added":
+                bits |= 1 << position
+            else:
+                bits &= ~(1 << position)
+            self.tag_bitmaps[payload["tag"]] = bits
+        elif name == "club_created":
+            self.dirty.add(payload["club"])
+        elif name == "club_updated":
+            old_name, new_name = payload["old_name"], payload["club"]
+            if old_name != new_name and old_name in self.club_ids:
+                position = self.club_ids.pop(old_name)
+                self.club_ids[new_name] = position
+                self.club_names[position] = new_name
+            self.dirty.add(new_name)
+        elif name == "club_deleted":
+            self._remove_club(payload["club"])
+            self.dirty.discard(payload["club"])
+        elif name == "tag_created":
+            self.tag_bitmaps.setdefault(payload["tag"], 0)
+        elif name == "tag_updated":
+            old_name = payload.get("old_name", payload["tag"])
+            if old_name != payload["tag"]:
+                self.tag_bitmaps[payload["tag"]] = self.tag_bitmaps.pop(old_name, 0)
+        elif name == "tag_deleted":
+            self.tag_bitmaps.pop(payload["tag"], None)
+        elif name in ("member_added", "member_removed", "review_created", "review_updated", "review_deleted"):
+            self.dirty.add(payload["club"])
+        elif name == "user_deleted":
+            self.dirty.update(payload["clubs"])
+        elif name == "counters_recomputed":
+            self.loaded = False
+
+    def _evaluate(self, node):
+        kind = node[0]
+        if kind == "tag":
+            return self.tag_bitmaps.get(node[1], 0)
+        if kind == "not":
+            return self.all_clubs & ~self._evaluate(node[1])
+        if kind == "and":
+            return self._evaluate(node[1]) & self._evaluate(node[2])
+        return self._evaluate(node[1]) | self._evaluate(node[2])
+
+    # Filter - returns (club names in index order, number of matching clubs, facet counts) for the expression
+    # (None matches every club), restricted to clubs whose member count and mean rating fall in the given ranges
+    # (a club without reviews never matches a rating range); facets maps each tag to its number of matching clubs
+    def filter(self, expression=None, min_members=None, max_members=None, min_rating=None, max_rating=None,
+               limit=None, offset=0):
+        tree = parse(expression) if expression is not None else None
+        with self.reading():
+            bits = self._evaluate(tree) if tree is not None else self.all_clubs
+            if (min_members, max_members, min_rating, max_rating) != (None, None, None, None):
+                bits = _bitmap([
+                    position for position in _positions(bits)
+                    if (min_members is None or self.member_counts[position] >= min_members)
+                    and (max_members is None or self.member_counts[position] <= max_members)
+                    and (min_rating is None and max_rating is None or self.rating_means[position] is not None
+                         and (min_rating is None or self.rating_means[position] >= min_rating)
+                         and (max_rating is None or self.rating_means[position] <= max_rating))
+                ], len(self.club_names))
+            facets = {}
+            for tag_name, tag_bits in self.tag_bitmaps.items():
+                count = _popcount(bits & tag_bits)
+                if count:
+                    facets[tag_name] = count
+            names = []
+            for index, position in enumerate(_positions(bits)):
+                if index < offset:
+                    continue
+                if limit is not None and len(names) >= limit:
+                    break
+                names.append(self.club_names[position])
+            return names, _popcount(bits), facets
+
+tag_index = app_local("tag_index", TagBitmapIndex)
+subscribe(lambda name, payload: tag_index.apply(name, payload))
@@ -0,0 +1,47 @@
+import multiprocessing
+import os
+
+# Production Server - a preforking gunicorn server with threaded workers
+#   gunicorn -c gunicorn.conf.py
+# the app (and every module it imports) is loaded once in the master before forking, so workers share that memory
+# copy-on-write; each worker then drops the database connections and thread pools it inherited (see post_fork)
+# workers share the response cache through a SQLite file (CACHE_BACKEND="sqlite") unless CLUBREVIEW_CACHE_BACKEND
+# says otherwise, so a response cached or invalidated by one worker is seen by all of them; each worker's in-memory
+# indexes replay the other workers' writes from the change feed (CLUBREVIEW_FOLLOW_CHANGES, see changes.catch_up), so
+# a response a worker caches is never built from an index older than the versions it is cached under
+# settings come from the environment: CLUBREVIEW_BIND, CLUBREVIEW_WORKERS, CLUBREVIEW_THREADS
+wsgi_app = "app:app"
+bind = os.environ.get("CLUBREVIEW_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("CLUBREVIEW_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.environ.get("CLUBREVIEW_THREADS", 4))
+worker_class = "gthread"
+preload_app = True
+
+os.environ.setdefault("CLUBREVIEW_CACHE_BACKEND", "sqlite")
+if workers > 1:
+    os.environ.setdefault("CLUBREVIEW_FOLLOW_CHANGES", "1")
+
+# the recommendation and related-club indexes (and the club catalog, when enabled) take seconds to build on a large
+# dataset, so the master builds them once before forking and every worker starts with them; the feed position is
+# recorded first, so every write made after the build is replayed into them
+def when_ready(server):
+    from app import app
+    from changes import catch_up
+    from recommendations import recommender
+    from related import related_clubs
+    from catalog import catalog
+    with app.app_context():
+        catch_up()
+        recommender.load()
+        related_clubs.load()
+        if app.config["CATALOG_ENABLED"]:
+            catalog.load()
+
+# a forked worker must not reuse the master's pooled SQLite connections, and the master's threads don't survive the fork
+def post_fork(server, worker):
+    from app import app
+    from extensions import db
+    from passwords import password_hasher
+    with app.app_context():
+        db.engine.dispose(close=False)
+    password_hasher.executor = None
@@ -0,0 +1,123 @@
+import json
+import time
+
+from sqlalchemy import insert, select
+
+from extensions import db
+from models import Club, Tag, tags, recompute_counters
+from search import club_search
+
+READ_CHUNK_SIZE = 1 << 16
+
+# yields the clubs of a JSON array file one at a time, reading it in fixed-size chunks instead of loading the whole file
+def _iter_json_array(file):
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    eof = False
+    while True:
+        # skip whitespace, the opening bracket, and the commas between clubs
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] in ",["):
+            if buffer[position] == "[":
+                started = True
+            position += 1
+        if position < len(buffer) and buffer[position] == "]" and started:
+            return
+        if position < len(buffer):
+            try:
+                club, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield club
+                position = end
+                continue
+        elif eof:
+            return
+        chunk = file.read(READ_CHUNK_SIZE)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+# yields the clubs of a JSON Lines file (one club object per line)
+def _iter_json_lines(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+# streams the clubs of a .json (array) or .jsonl/.ndjson (one object per line) dump
+def iter_clubs(path):
+    with open(path, "r") as file:
+        if path.endswith((".jsonl", ".ndjson")):
+            yield from _iter_json_lines(file)
+        else:
+            yield from _iter_json_array(file)
+
+# Bulk Import - loads a club dump with executemany inserts, committing once per batch of clubs
+# tags are resolved through an in-memory set of known tag names instead of a query per tag
+# a club whose name or code is already taken (in the database, or earlier in the dump) is skipped and reported, so only
+# the clubs actually inserted get tag links and are counted
+# counters and the search index are rebuilt once at the end, since per-row maintenance would dominate the import
+def bulk_import(path, batch_size=5000, report=print):
+    known_tags = set(db.session.execute(select(Tag.name)).scalars())
+    known_names, known_codes = set(), set()
+    for name, code in db.session.execute(select(Club.name, Club.code)):
+        known_names.add(name)
+        known_codes.add(code)
+    club_table = Club.__table__
+    tag_table = Tag.__table__
+    stats = {"clubs": 0, "skipped": 0, "tags": 0, "club_tags": 0, "batches": 0}
+    club_rows, new_tag_rows, club_tag_rows = [], [], []
+    started = time.perf_counter()
+
+    def flush_batch():
+        if not club_rows:
+            return
+        db.session.execute(insert(club_table), club_rows)
+        if new_tag_rows:
+            db.session.execute(insert(tag_table).prefix_with("OR IGNORE"), new_tag_rows)
+        if club_tag_rows:
+            db.session.execute(insert(tags).prefix_with("OR IGNORE"), club_tag_rows)
+        db.session.commit()
+        stats["clubs"] += len(club_rows)
+        stats["tags"] += len(new_tag_rows)
+        stats["club_tags"] += len(club_tag_rows)
+        stats["batches"] += 1
+        elapsed = time.perf_counter() - started
+        report(f"batch {stats['batches']}: {stats['clubs']} clubs in {elapsed:.2f}s "
+               f"({stats['clubs'] / elapsed:,.0f} clubs/s)")
+        club_rows.clear()
+        new_tag_rows.clear()
+        club_tag_rows.clear()
+
+    for club in iter_clubs(path):
+        if club["name"] in known_names or club["code"] in known_codes:
+            field = "name" if club["name"] in known_names else "code"
+            report(f"skipped club {club['name']!r}: duplicate {field} {club[field]!r}")
+            stats["skipped"] += 1
+            continue
+        known_names.add(club["name"])
+        known_codes.add(club["code"])
+        club_rows.append({"code": club["code"], "name": club["name"], "description": club["description"]})
+        for tag_name in dict.fromkeys(club.get("tags", [])):
+            if tag_name not in known_tags:
+                known_tags.add(tag_name)
+                new_tag_rows.append({"name": tag_name})
+            club_tag_rows.append({"tag_name": tag_name, "club_name": club["name"]})
+        if len(club_rows) >= batch_size:
+            flush_batch()
+    flush_batch()
+
+    recompute_counters()
+    club_search.create()
+    db.session.commit()
+
+    stats["seconds"] = time.perf_counter() - started
+    stats["clubs_per_second"] = stats["clubs"] / stats["seconds"] if stats["seconds"] else 0.0
+    report(f"imported {stats['clubs']} clubs, {stats['tags']} new tags and {stats['club_tags']} club tags "
+           f"in {stats['seconds']:.2f}s ({stats['clubs_per_second']:,.0f} clubs/s), skipped {stats['skipped']} "
+           f"duplicate clubs")
+    return stats
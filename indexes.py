@@ -0,0 +1,48 @@
+import threading
+from contextlib import contextmanager
+
+from changes import catch_up
+
+# In-Memory Index - base of the indexes built from the database on first use and kept current by the write events
+# apply() marks what an event changed as dirty, and the next read re-reads it (or rebuilds past refresh_limit)
+# subclasses define _reset (empty state, dirty included), _build, _refresh (re-reads and clears dirty) and _apply
+REFRESH_LIMIT = 500
+
+class MemoryIndex:
+    refresh_limit = REFRESH_LIMIT
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.dirty = set()
+
+    # builds the index - the feed position is recorded first, so writes committed during the build are replayed
+    def load(self):
+        catch_up()
+        with self.lock:
+            self._load()
+
+    def _load(self):
+        self._reset()
+        self._build()
+        self.loaded = True
+
+    def _dirty_count(self):
+        return len(self.dirty)
+
+    # holds the lock over one read of an up-to-date index - catch_up runs first, as replaying takes the lock
+    @contextmanager
+    def reading(self):
+        catch_up()
+        with self.lock:
+            if not self.loaded or self._dirty_count() > self.refresh_limit:
+                self._load()
+            elif self._dirty_count():
+                self._refresh()
+            yield
+
+    # an index that isn't built yet has nothing to update - it reads the change when it is built
+    def apply(self, name, payload):
+        with self.lock:
+            if self.loaded:
+                self._apply(name, payload)
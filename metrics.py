@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from extensions import db
+
+# Request Metrics - opt-in (METRICS_ENABLED, or the CLUBREVIEW_METRICS=1 environment variable)
+# per route: a latency histogram, a histogram of SQL statements per request, total SQL time, and response bytes,
+# exposed in Prometheus text format at /metrics. SQL is counted with SQLAlchemy engine events, so statements issued
+# by lazy relationships are counted too
+# a request slower than METRICS_SLOW_REQUEST_MS is logged with the SQL it ran, and with METRICS_DEBUG_HEADER every
+# response reports its statement count and SQL time in X-SQL-Queries / X-SQL-Time-Ms
+def init_app(app):
+    app.config.setdefault("METRICS_ENABLED", os.environ.get("CLUBREVIEW_METRICS") == "1")
+    app.config.setdefault("METRICS_DEBUG_HEADER", False)
+    app.config.setdefault("METRICS_SLOW_REQUEST_MS", 500)
+    app.config.setdefault("METRICS_SLOW_LOG_STATEMENTS", 50)
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(db.engine, "after_cursor_execute", _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    # cumulative (le, count) pairs, ending with +Inf
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+        yield "+Inf", self.count
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.sql_seconds = 0
+        self.response_bytes = 0
+        self.responses = defaultdict(int)    # status code -> count
+
+lock = threading.Lock()
+routes = defaultdict(RouteMetrics)          # (endpoint, method) -> RouteMetrics
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    started = connection.info["metrics_query_start"].pop()
+    if not has_request_context() or "metrics_start" not in g:
+        return
+    elapsed = time.perf_counter() - started
+    g.sql_count += 1
+    g.sql_seconds += elapsed
+    if len(g.sql_log) < current_app.config["METRICS_SLOW_LOG_STATEMENTS"]:
+        g.sql_log.append((elapsed, statement))
+
+def _start_request():
+    if current_app.config["METRICS_ENABLED"]:
+        g.metrics_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0
+        g.sql_log = []
+
+def _record_request(response):
+    if "metrics_start" not in g:
+        return response
+    elapsed = time.perf_counter() - g.metrics_start
+    size = 0 if response.is_streamed else response.calculate_content_length() or 0
+    with lock:
+        route = routes[(request.endpoint or "unknown", request.method)]
+        route.latency.observe(elapsed)
+        route.statements.observe(g.sql_count)
+        route.sql_seconds += g.sql_seconds
+        route.response_bytes += size
+        route.responses[response.status_code] += 1
+    if elapsed * 1000 >= current_app.config["METRICS_SLOW_REQUEST_MS"]:
+        statements = "\n".join(f"  {seconds * 1000:8.2f}ms  {statement}" for seconds, statement in g.sql_log)
+        current_app.logger.warning("slow request: %s %s took %.1fms, %d SQL statements (%.1fms):\n%s",
+            request.method, request.full_path, elapsed * 1000, g.sql_count, g.sql_seconds * 1000, statements)
+    if current_app.config["METRICS_DEBUG_HEADER"]:
+        response.headers["X-SQL-Queries"] = str(g.sql_count)
+        response.headers["X-SQL-Time-Ms"] = f"{g.sql_seconds * 1000:.2f}"
+    return response
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+def _histogram_lines(name, histogram, **labels):
+    for bound, count in histogram.cumulative():
+        yield f"{name}_bucket{{{_labels(**labels, le=bound)}}} {count}"
+    yield f"{name}_sum{{{_labels(**labels)}}} {histogram.sum}"
+    yield f"{name}_count{{{_labels(**labels)}}} {histogram.count}"
+
+# returns every metric in the Prometheus text exposition format
+def render():
+    lines = [
+        "# HELP clubreview_request_duration_seconds Request latency by route.",
+        "# TYPE clubreview_request_duration_seconds histogram",
+    ]
+    with lock:
+        snapshot = sorted(routes.items())
+        for (endpoint, method), route in snapshot:
+            lines.extend(_histogram_lines("clubreview_request_duration_seconds", route.latency,
+                                          endpoint=endpoint, method=method))
+        lines += ["# HELP clubreview_request_sql_statements SQL statements issued per request by route.",
+                  "# TYPE clubreview_request_sql_statements histogram"]
+        for (endpoint, method), route in snapshot:
+            lines.extend(_histogram_lines("clubreview_request_sql_statements", route.statements,
+                                          endpoint=endpoint, method=method))
+        lines += ["# HELP clubreview_sql_seconds_total Time spent executing SQL by route.",
+                  "# TYPE clubreview_sql_seconds_total counter"]
+        lines += [f"clubreview_sql_seconds_total{{{_labels(endpoint=endpoint, method=method)}}} {route.sql_seconds}"
+                  for (endpoint, method), route in snapshot]
+        lines += ["# HELP clubreview_response_bytes_total Response body bytes by route.",
+                  "# TYPE clubreview_response_bytes_total counter"]
+        lines += [f"clubreview_response_bytes_total{{{_labels(endpoint=endpoint, method=method)}}} {route.response_bytes}"
+                  for (endpoint, method), route in snapshot]
+        lines += ["# HELP clubreview_responses_total Responses by route and status code.",
+                  "# TYPE clubreview_responses_total counter"]
+        for (endpoint, method), route in snapshot:
+            for status, count in sorted(route.responses.items()):
+                lines.append(f"clubreview_responses_total{{{_labels(endpoint=endpoint, method=method, status=status)}}} {count}")
+    return "\n".join(lines) + "\n"
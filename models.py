@@ -1,41 +1,98 @@
-from app import db, bcrypt
+from extensions import db
 from flask_login import UserMixin
 from datetime import date
+from sqlalchemy import case, func, select, update
+from events import emit
+from passwords import password_hasher
 
 # Your database models should go here.
 # Check out the Flask-SQLAlchemy quickstart for some good docs!
 # https://flask-sqlalchemy.palletsprojects.com/en/2.x/quickstart/
+# Model helpers (add_member, add_tag, ...) only stage changes on the session - the route commits once (see uow.py)
+
+# many-to-many mappings - each row has an integer surrogate id; the natural (owner, club) pair is unique, and its index
+# serves lookups from the owner side, while a second index on (club, owner) serves lookups from the club side
+# (see schema.py for the in-place migration of older databases and the query-plan checks)
 
 # many-to-many mapping - stores associations between tags and clubs
+# rating_mean is a copy of the club's mean rating (kept by Club._sync_tag_ratings), so the best rated clubs with a tag
+# are read in order from ix_tags_tag_name_rating_mean instead of sorting every club with the tag
 tags = db.Table('tags',
-    db.Column('tag_name', db.Integer, db.ForeignKey('tag.name'), primary_key=True),
-    db.Column('club_name', db.Integer, db.ForeignKey('club.name'), primary_key=True)
+    db.Column('id', db.Integer, primary_key=True, autoincrement=True),
+    db.Column('tag_name', db.String(80), db.ForeignKey('tag.name'), nullable=False),
+    db.Column('club_name', db.String(180), db.ForeignKey('club.name'), nullable=False),
+    db.Column('rating_mean', db.Float, nullable=True),
+    db.UniqueConstraint('tag_name', 'club_name', name='uq_tags_tag_name_club_name'),
+    db.Index('ix_tags_club_name_tag_name', 'club_name', 'tag_name')
 )
+db.Index('ix_tags_tag_name_rating_mean', tags.c.tag_name, tags.c.rating_mean.desc(), tags.c.club_name)
 
 # many-to-many mapping - stores associations between members (users) and clubs
 members = db.Table('members',
-    db.Column('user_username', db.Integer, db.ForeignKey('user.username'), primary_key=True),
-    db.Column('club_name', db.Integer, db.ForeignKey('club.name'), primary_key=True)
+    db.Column('id', db.Integer, primary_key=True, autoincrement=True),
+    db.Column('user_username', db.String(30), db.ForeignKey('user.username'), nullable=False),
+    db.Column('club_name', db.String(180), db.ForeignKey('club.name'), nullable=False),
+    db.UniqueConstraint('user_username', 'club_name', name='uq_members_user_username_club_name'),
+    db.Index('ix_members_club_name_user_username', 'club_name', 'user_username')
 )
 
 # many-to-many mapping - stores associations between officers (users) and clubs
 officers = db.Table('officers',
-    db.Column('user_username', db.Integer, db.ForeignKey('user.username'), primary_key=True),
-    db.Column('club_name', db.Integer, db.ForeignKey('club.name'), primary_key=True)
+    db.Column('id', db.Integer, primary_key=True, autoincrement=True),
+    db.Column('user_username', db.String(30), db.ForeignKey('user.username'), nullable=False),
+    db.Column('club_name', db.String(180), db.ForeignKey('club.name'), nullable=False),
+    db.UniqueConstraint('user_username', 'club_name', name='uq_officers_user_username_club_name'),
+    db.Index('ix_officers_club_name_user_username', 'club_name', 'user_username')
 )
 
 # many-to-many mapping - stores associations between users and favorite clubs (clubs)
 favorites = db.Table('favorites',
-    db.Column('user_username', db.Integer, db.ForeignKey('user.username'), primary_key=True),
-    db.Column('club_name', db.Integer, db.ForeignKey('club.name'), primary_key=True)
+    db.Column('id', db.Integer, primary_key=True, autoincrement=True),
+    db.Column('user_username', db.String(30), db.ForeignKey('user.username'), nullable=False),
+    db.Column('club_name', db.String(180), db.ForeignKey('club.name'), nullable=False),
+    db.UniqueConstraint('user_username', 'club_name', name='uq_favorites_user_username_club_name'),
+    db.Index('ix_favorites_club_name_user_username', 'club_name', 'user_username')
 )
 
+# batch helpers for the association tables - each runs one statement for the whole list of values
+# returns the subset of values already linked to owner
+def _linked(table, owner_column, owner, value_column, values):
+    if not values:
+        return set()
+    return set(db.session.execute(
+        select(table.c[value_column])
+        .where(table.c[owner_column] == owner, table.c[value_column].in_(list(values)))).scalars())
+
+def _link(table, owner_column, owner, value_column, values):
+    if values:
+        db.session.execute(table.insert(), [{owner_column: owner, value_column: value} for value in values])
+
+def _unlink(table, owner_column, owner, value_column, values):
+    if values:
+        db.session.execute(table.delete()
+            .where(table.c[owner_column] == owner, table.c[value_column].in_(list(values))))
+
+# ratings are whole numbers from MIN_RATING to MAX_RATING; each club keeps a histogram with one bucket per rating
+MIN_RATING = 0
+MAX_RATING = 10
+EMPTY_HISTOGRAM = ",".join(["0"] * (MAX_RATING - MIN_RATING + 1))
+
+# the stored histogram ("0,2,1,...") as a list of counts
+def parse_histogram(histogram):
+    return [int(count) for count in (histogram or EMPTY_HISTOGRAM).split(",")]
+
 # Club Object - contains club code, name, description, favorite count, member list, officer list, tags list, and associated reviews
+# also keeps rating aggregates (review count, rating sum, mean rating, rating histogram) that the review routes update
 class Club(db.Model):
     code = db.Column(db.String(30), unique=True, nullable=False)
     name = db.Column(db.String(180), primary_key=True, unique=True, nullable=False)
     description = db.Column(db.String(300), nullable=False)
-    favorite_count = db.Column(db.Integer)
+    favorite_count = db.Column(db.Integer, nullable=False, default=0)
+    review_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # indexed so the top-rated routes read clubs in rating order instead of sorting every club
+    rating_mean = db.Column(db.Float, nullable=True, index=True)
+    rating_histogram = db.Column(db.String(64), nullable=False, default=EMPTY_HISTOGRAM, server_default=EMPTY_HISTOGRAM)
     members = db.relationship('User', secondary=members, lazy='dynamic',
         backref=db.backref('membership_clubs', lazy='dynamic'))
     officers = db.relationship('User', secondary=officers, lazy='dynamic',
@@ -58,8 +115,56 @@ class Club(db.Model):
         return self.description
     
     def get_favorite_count(self):
-        favorite_count = len(self.favorite_users.all())
-        return favorite_count
+        return self.favorite_count or 0
+
+    def get_review_count(self):
+        return self.review_count or 0
+
+    def get_rating_mean(self):
+        return self.rating_mean
+
+    def get_rating_histogram(self):
+        return parse_histogram(self.rating_histogram)
+
+    # updates the rating aggregates for one review being added (delta=1) or removed (delta=-1)
+    # the count, sum, and mean are computed in SQL from the stored values; that update also takes SQLite's write lock, so
+    # the histogram read after it can't be changed by another writer before this transaction commits
+    def _apply_rating(self, rating, delta):
+        review_count = Club.review_count + delta
+        rating_sum = Club.rating_sum + delta * rating
+        db.session.execute(update(Club).where(Club.name == self.name).values(
+            review_count=review_count, rating_sum=rating_sum,
+            rating_mean=case((review_count > 0, rating_sum * 1.0 / review_count), else_=None)))
+        histogram = parse_histogram(db.session.execute(
+            select(Club.rating_histogram).where(Club.name == self.name)).scalar())
+        histogram[rating - MIN_RATING] += delta
+        db.session.execute(update(Club).where(Club.name == self.name)
+            .values(rating_histogram=",".join(str(count) for count in histogram)))
+        self._sync_tag_ratings()
+
+    # copies the mean rating onto this club's tag links (see the tags table)
+    def _sync_tag_ratings(self):
+        db.session.execute(update(tags).where(tags.c.club_name == self.name)
+            .values(rating_mean=select(Club.rating_mean).where(Club.name == self.name).scalar_subquery()))
+
+    def add_rating(self, rating):
+        self._apply_rating(rating, 1)
+
+    def remove_rating(self, rating):
+        self._apply_rating(rating, -1)
+
+    # returns the highest rated clubs (optionally only those with the given tag), best first, read in rating_mean index
+    # order - from the club index, or with a tag from the tag links' copy of the rating
+    @staticmethod
+    def top_rated(limit, min_reviews=1, tag_name=None):
+        if tag_name is None:
+            query = (Club.query.filter(Club.rating_mean.isnot(None), Club.review_count >= min_reviews)
+                .order_by(Club.rating_mean.desc(), Club.name))
+        else:
+            query = (Club.query.join(tags, tags.c.club_name == Club.name)
+                .filter(tags.c.tag_name == tag_name, tags.c.rating_mean.isnot(None), Club.review_count >= min_reviews)
+                .order_by(tags.c.rating_mean.desc(), tags.c.club_name))
+        return query.limit(limit).all()
     
     def get_members(self):
         return self.members
@@ -67,14 +172,15 @@ class Club(db.Model):
     def add_member(self, user):
         if user not in self.members:
             self.members.append(user)
-            db.session.commit()
+            emit("member_added", club=self.name, user=user.username)
 
     def remove_member(self, user):
         if user in self.members:
             self.members.remove(user)
+            emit("member_removed", club=self.name, user=user.username)
         if user in self.officers:
             self.officers.remove(user)
-        db.session.commit()
+            emit("officer_removed", club=self.name, user=user.username)
     
     def get_officers(self):
         return self.officers
@@ -82,14 +188,15 @@ class Club(db.Model):
     def add_officer(self, user):
         if user not in self.members:
             self.members.append(user)
+            emit("member_added", club=self.name, user=user.username)
         if user not in self.officers:
             self.officers.append(user)
-        db.session.commit()
+            emit("officer_added", club=self.name, user=user.username)
 
     def remove_officer(self, user):
         if user in self.officers:
             self.officers.remove(user)
-            db.session.commit()
+            emit("officer_removed", club=self.name, user=user.username)
     
     def get_tags(self):
         return self.tags
@@ -97,22 +204,99 @@ class Club(db.Model):
     def add_tag(self, tag):
         if tag not in self.tags:
             self.tags.append(tag)
-            db.session.commit()
+            db.session.execute(update(Tag).where(Tag.name == tag.name).values(club_count=Tag.club_count + 1))
+            if self.rating_mean is not None:
+                db.session.flush()
+                self._sync_tag_ratings()
+            emit("tag_added", club=self.name, tag=tag.name)
 
     def remove_tag(self, tag):
         if tag in self.tags:
             self.tags.remove(tag)
-            db.session.commit()
+            db.session.execute(update(Tag).where(Tag.name == tag.name).values(club_count=Tag.club_count - 1))
+            emit("tag_removed", club=self.name, tag=tag.name)
 
     def get_reviews(self):
         return self.reviews
 
+    # batch variants of the helpers above - take lists of usernames/tag names (which must exist), diff them against the
+    # association table with set operations, and stage the changed rows in bulk; each returns the set of names that changed
+    def add_members(self, usernames):
+        added = set(usernames) - _linked(members, "club_name", self.name, "user_username", usernames)
+        _link(members, "club_name", self.name, "user_username", added)
+        for username in sorted(added):
+            emit("member_added", club=self.name, user=username)
+        return added
+
+    def remove_members(self, usernames):
+        removed = _linked(members, "club_name", self.name, "user_username", usernames)
+        removed_officers = _linked(officers, "club_name", self.name, "user_username", usernames)
+        _unlink(members, "club_name", self.name, "user_username", removed)
+        _unlink(officers, "club_name", self.name, "user_username", removed_officers)
+        for username in sorted(removed):
+            emit("member_removed", club=self.name, user=username)
+        for username in sorted(removed_officers):
+            emit("officer_removed", club=self.name, user=username)
+        return removed
+
+    def add_officers(self, usernames):
+        self.add_members(usernames)
+        added = set(usernames) - _linked(officers, "club_name", self.name, "user_username", usernames)
+        _link(officers, "club_name", self.name, "user_username", added)
+        for username in sorted(added):
+            emit("officer_added", club=self.name, user=username)
+        return added
+
+    def remove_officers(self, usernames):
+        removed = _linked(officers, "club_name", self.name, "user_username", usernames)
+        _unlink(officers, "club_name", self.name, "user_username", removed)
+        for username in sorted(removed):
+            emit("officer_removed", club=self.name, user=username)
+        return removed
+
+    def add_tags(self, tag_names):
+        added = set(tag_names) - _linked(tags, "club_name", self.name, "tag_name", tag_names)
+        _link(tags, "club_name", self.name, "tag_name", added)
+        if added:
+            db.session.execute(update(Tag).where(Tag.name.in_(list(added))).values(club_count=Tag.club_count + 1))
+            if self.rating_mean is not None:
+                self._sync_tag_ratings()
+        for tag_name in sorted(added):
+            emit("tag_added", club=self.name, tag=tag_name)
+        return added
+
+    def remove_tags(self, tag_names):
+        removed = _linked(tags, "club_name", self.name, "tag_name", tag_names)
+        _unlink(tags, "club_name", self.name, "tag_name", removed)
+        if removed:
+            db.session.execute(update(Tag).where(Tag.name.in_(list(removed))).values(club_count=Tag.club_count - 1))
+        for tag_name in sorted(removed):
+            emit("tag_removed", club=self.name, tag=tag_name)
+        return removed
+
+    # renames the club, its links, and its reviews - the foreign keys don't cascade updates (see Tag.rename)
+    def rename(self, new_name):
+        for table in (tags, members, officers, favorites):
+            db.session.execute(update(table).where(table.c.club_name == self.name).values(club_name=new_name))
+        db.session.execute(update(Review).where(Review.club == self.name).values(club=new_name))
+        self.name = new_name
+
+    # decrements the club count of every tag on this club, then deletes the club
+    def delete(self):
+        tag_names = db.session.execute(select(tags.c.tag_name).where(tags.c.club_name == self.name)).scalars().all()
+        emit("club_deleted", club=self.name, tags=tag_names)
+        db.session.execute(
+            update(Tag)
+            .where(Tag.name.in_(select(tags.c.tag_name).where(tags.c.club_name == self.name)))
+            .values(club_count=Tag.club_count - 1))
+        db.session.delete(self)
+
 # Club Object - contains user username, email, password, first name, last name, favorite clubs list, and associated reviews
 # can access membership club list (+ join/leave function), access officership club list, and encrypt passwords
 class User(db.Model, UserMixin):
     username = db.Column(db.String(30), primary_key=True, unique=True, nullable=False)
     email = db.Column(db.String(80), unique=True, nullable=False)
-    password = db.Column(db.String(30), nullable=False)
+    password = db.Column(db.String(60), nullable=False)
     first_name = db.Column(db.String(30), nullable=False)
     last_name = db.Column(db.String(30), nullable=False)
     favorites = db.relationship('Club', secondary=favorites, lazy='dynamic',
@@ -123,6 +307,10 @@ class User(db.Model, UserMixin):
     def __repr__(self):
         return f"User ('{self.username}', '{self.email}')"
     
+    # flask_login identifies users by get_id (UserMixin's default needs an id column, which users don't have)
+    def get_id(self):
+        return self.username
+
     def get_username(self):
         return self.username
     
@@ -136,13 +324,21 @@ class User(db.Model, UserMixin):
         return self.first_name
     
     def get_last_name(self):
-        return self.first_name
+        return self.last_name
     
+    # hashing runs on the password hasher's pool (see passwords.py)
+    # the event drops the cached identity, so tokens issued for the old password stop working (see auth.py) - it is its
+    # own event, not user_updated, since nothing a client reads changes (it is left out of the change feed)
     def set_password(self, new_password):
-        self.password = bcrypt.generate_password_hash(new_password)
+        self.password = password_hasher.hash(new_password)
+        emit("password_changed", user=self.username)
 
     def check_password(self, check_password):
-        return bcrypt.check_password_hash(self.password, check_password)
+        return password_hasher.check(check_password, self.password)
+
+    # true when the stored hash was made with another work factor (or is a password stored before hashing)
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password)
     
     def get_favorites(self):
         return self.favorites
@@ -150,13 +346,38 @@ class User(db.Model, UserMixin):
     def add_favorite(self, club):
         if club not in self.favorites:
             self.favorites.append(club)
-            db.session.commit()
+            db.session.execute(update(Club).where(Club.name == club.name)
+                .values(favorite_count=Club.favorite_count + 1))
+            emit("favorite_added", club=club.name, user=self.username)
 
     def remove_favorite(self, club):
         if club in self.favorites:
             self.favorites.remove(club)
-            db.session.commit()
+            db.session.execute(update(Club).where(Club.name == club.name)
+                .values(favorite_count=Club.favorite_count - 1))
+            emit("favorite_removed", club=club.name, user=self.username)
     
+    # batch variants of add_favorite/remove_favorite - take lists of club names (which must exist), see Club.add_members
+    def add_favorites(self, club_names):
+        added = set(club_names) - _linked(favorites, "user_username", self.username, "club_name", club_names)
+        _link(favorites, "user_username", self.username, "club_name", added)
+        if added:
+            db.session.execute(update(Club).where(Club.name.in_(list(added)))
+                .values(favorite_count=Club.favorite_count + 1))
+        for club_name in sorted(added):
+            emit("favorite_added", club=club_name, user=self.username)
+        return added
+
+    def remove_favorites(self, club_names):
+        removed = _linked(favorites, "user_username", self.username, "club_name", club_names)
+        _unlink(favorites, "user_username", self.username, "club_name", removed)
+        if removed:
+            db.session.execute(update(Club).where(Club.name.in_(list(removed)))
+                .values(favorite_count=Club.favorite_count - 1))
+        for club_name in sorted(removed):
+            emit("favorite_removed", club=club_name, user=self.username)
+        return removed
+
     def get_member_clubs(self):
         return self.membership_clubs.all()
     
@@ -172,14 +393,38 @@ class User(db.Model, UserMixin):
     def get_reviews(self):
         return self.reviews
 
+    # returns the names of every club this user is a member, officer, or favoriter of
+    def get_related_club_names(self):
+        related = select(members.c.club_name).where(members.c.user_username == self.username).union(
+            select(officers.c.club_name).where(officers.c.user_username == self.username),
+            select(favorites.c.club_name).where(favorites.c.user_username == self.username))
+        return db.session.execute(related).scalars().all()
+
+    # renames the user, their links, and their reviews - the foreign keys don't cascade updates (see Tag.rename)
+    def rename(self, new_name):
+        for table in (members, officers, favorites):
+            db.session.execute(update(table).where(table.c.user_username == self.username)
+                .values(user_username=new_name))
+        db.session.execute(update(Review).where(Review.user == self.username).values(user=new_name))
+        self.username = new_name
+
+    # decrements the favorite count of every club this user favorited, then deletes the user
+    def delete(self):
+        emit("user_deleted", user=self.username, clubs=self.get_related_club_names())
+        db.session.execute(
+            update(Club)
+            .where(Club.name.in_(select(favorites.c.club_name).where(favorites.c.user_username == self.username)))
+            .values(favorite_count=Club.favorite_count - 1))
+        db.session.delete(self)
+
 # Club Object - contains review id, title, rating, description, associated user, and associated club
 class Review(db.Model):
     id = db.Column(db.Integer, primary_key=True, unique=True, autoincrement=True)
     title = db.Column(db.String(150), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
     description = db.Column(db.String(500), nullable=True)
-    user = db.Column(db.String(30), db.ForeignKey('user.username'), nullable=False)
-    club = db.Column(db.String(180), db.ForeignKey('club.name'), nullable=False)
+    user = db.Column(db.String(30), db.ForeignKey('user.username'), nullable=False, index=True)
+    club = db.Column(db.String(180), db.ForeignKey('club.name'), nullable=False, index=True)
 
     def get_review_id(self):
         return self.id
@@ -209,14 +454,71 @@ class Review(db.Model):
 # can access associated clubs
 class Tag(db.Model):
     name = db.Column(db.String(80), primary_key=True, unique=True, nullable=False)
-    club_count = db.Column(db.Integer)
+    club_count = db.Column(db.Integer, nullable=False, default=0)
 
     def get_tag_name(self):
         return self.name
 
     def get_tagged_clubs_count(self):
-        self.club_count = len(self.tagged_clubs.all())
-        return self.club_count
+        return self.club_count or 0
 
     def get_tagged_clubs(self):
-        return self.tagged_clubs.all()
\ No newline at end of file
+        return self.tagged_clubs.all()
+
+    # renames the tag and its club links - the foreign keys don't cascade updates, so the links are updated here
+    def rename(self, new_name):
+        db.session.execute(update(tags).where(tags.c.tag_name == self.name).values(tag_name=new_name))
+        self.name = new_name
+
+# Change Object - one entry of the change feed (see changes.py): sequence number, event name, key of the object or
+# association it changed, payload (JSON), and commit time
+# seq is an AUTOINCREMENT key, so a number is never handed out twice, even after compaction deletes entries
+class Change(db.Model):
+    __table_args__ = (db.Index("ix_change_key_seq", "key", "seq"), {"sqlite_autoincrement": True})
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    event = db.Column(db.String(40), nullable=False)
+    key = db.Column(db.String(500), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.Float, nullable=False)
+
+# recomputes every favorite count, tag club count, and club rating aggregate from the association and review tables
+# each counter is reset, then set from one GROUP BY pass over its association table (run after bulk imports)
+# like the other helpers this only stages the updates - the caller commits; the counters_recomputed event makes the
+# caches and indexes that hold counts or ratings reload them
+def recompute_counters():
+    favorite_counts = (select(favorites.c.club_name, func.count().label("count"))
+        .group_by(favorites.c.club_name).subquery())
+    db.session.execute(update(Club).values(favorite_count=0))
+    db.session.execute(
+        update(Club)
+        .where(Club.name == favorite_counts.c.club_name)
+        .values(favorite_count=favorite_counts.c.count))
+
+    club_counts = (select(tags.c.tag_name, func.count().label("count"))
+        .group_by(tags.c.tag_name).subquery())
+    db.session.execute(update(Tag).values(club_count=0))
+    db.session.execute(
+        update(Tag)
+        .where(Tag.name == club_counts.c.tag_name)
+        .values(club_count=club_counts.c.count))
+
+    # the rating histogram is built in the same GROUP BY pass, one SUM(CASE) per rating bucket
+    buckets = [func.sum(case((Review.rating == rating, 1), else_=0)) for rating in range(MIN_RATING, MAX_RATING + 1)]
+    histogram = buckets[0].cast(db.String)
+    for bucket in buckets[1:]:
+        histogram = histogram + "," + bucket.cast(db.String)
+    ratings = (select(Review.club.label("club_name"), func.count().label("count"),
+            func.sum(Review.rating).label("total"), histogram.label("histogram"))
+        .group_by(Review.club).subquery())
+    db.session.execute(update(Club).values(review_count=0, rating_sum=0, rating_mean=None,
+        rating_histogram=EMPTY_HISTOGRAM))
+    db.session.execute(
+        update(Club)
+        .where(Club.name == ratings.c.club_name)
+        .values(review_count=ratings.c.count, rating_sum=ratings.c.total,
+            rating_mean=ratings.c.total * 1.0 / ratings.c.count, rating_histogram=ratings.c.histogram))
+
+    # and the copy of each club's mean rating on its tag links
+    db.session.execute(update(tags).values(
+        rating_mean=select(Club.rating_mean).where(Club.name == tags.c.club_name).scalar_subquery()))
+    emit("counters_recomputed", counters="all")
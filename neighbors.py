@@ -0,0 +1,38 @@
+import heapq
+from array import array
+
+# Neighbor Lists - the most similar items of every item, kept by the recommendation and related-club indexes
+# each list is a (positions, similarities) pair of arrays, most similar first, holding at most size positive entries;
+# when one item changes, the lists of the other items are patched with its new similarity instead of recomputed
+
+def empty_neighbors():
+    return array("i"), array("d")
+
+# the size most similar positions of a {position: similarity} dict
+def top_neighbors(similarities, size):
+    best = heapq.nlargest(size, similarities, key=similarities.__getitem__)
+    best = [position for position in best if similarities[position] > 0]
+    return array("i", best), array("d", [similarities[position] for position in best])
+
+# puts the new similarity of position into the list of other - returns False when the list of other has to be
+# recomputed instead (position fell out of a full list, so the item that takes its place is unknown)
+def update_neighbor(neighbors, other, position, similarity, size):
+    positions, similarities = neighbors[other]
+    listed = position in positions
+    if not listed and similarity <= 0:
+        return True
+    full = len(positions) >= size
+    if listed:
+        if full and similarity < similarities[-1]:
+            return False
+        entries = [entry for entry in zip(positions, similarities) if entry[0] != position]
+    elif full and similarity <= similarities[-1]:
+        return True
+    else:
+        entries = list(zip(positions, similarities))
+    if similarity > 0:
+        entries.append((position, similarity))
+    entries.sort(key=lambda entry: -entry[1])
+    entries = entries[:size]
+    neighbors[other] = (array("i", [entry for entry, _ in entries]), array("d", [value for _, value in entries]))
+    return True
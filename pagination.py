@@ -0,0 +1,101 @@
+import base64
+import binascii
+import json
+from bisect import bisect_right
+
+from flask import request, abort
+
+# page size used when the request does not pass ?limit=, and the largest page a client can ask for
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# cursors are the last primary key of the previous page, JSON-encoded then base64-encoded so they are opaque to clients
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        abort(400, "Invalid cursor")
+
+# decodes a keyset cursor, which must hold one key of the given Python type (str for names, int for ids) - anything
+# else would reach the SQL comparison
+def decode_key(cursor, key_type):
+    key = decode_cursor(cursor)
+    if not isinstance(key, key_type) or isinstance(key, bool):
+        abort(400, "Invalid cursor")
+    return key
+
+# reads ?limit= from the request - defaults to DEFAULT_PAGE_SIZE and must be between 1 and MAX_PAGE_SIZE
+def get_page_size():
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE)
+    try:
+        limit = int(limit)
+    except ValueError:
+        abort(400, "Invalid limit")
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        abort(400, f"Limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+# reads ?fields=a,b,c from the request - returns None (all fields) when not given
+def get_fields(allowed_fields):
+    fields = request.args.get("fields")
+    if not fields:
+        return None
+    fields = set(field.strip() for field in fields.split(",") if field.strip())
+    for field in fields:
+        if field not in allowed_fields:
+            abort(400, f"Invalid field: {field}")
+    return fields
+
+# keyset pagination - returns one page of the query ordered by key_column, and the cursor of the next page (None on the last page)
+# each page is an indexed range scan on the primary key starting after ?cursor=, so every page costs the same
+def paginate(query, key_column):
+    limit = get_page_size()
+    cursor = request.args.get("cursor")
+    if cursor:
+        query = query.filter(key_column > decode_key(cursor, key_column.type.python_type))
+    items = query.order_by(key_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(getattr(items[-1], key_column.key))
+    return items, next_cursor
+
+# keyset pagination over a sorted list of keys held in memory (see catalog.py) - the same pages and cursors as paginate
+def paginate_keys(keys):
+    limit = get_page_size()
+    cursor = request.args.get("cursor")
+    start = 0
+    if cursor:
+        start = bisect_right(keys, decode_key(cursor, str))
+    page = keys[start:start + limit + 1]
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1])
+    return page, next_cursor
+
+# offset pagination for results with no stable key order (e.g. search results ranked by relevance)
+# the cursor holds the offset of the next page
+def get_offset():
+    cursor = request.args.get("cursor")
+    if not cursor:
+        return 0
+    offset = decode_cursor(cursor)
+    if not isinstance(offset, int) or offset < 0:
+        abort(400, "Invalid cursor")
+    return offset
+
+# reads an optional non-negative number query parameter (e.g. ?min_reviews=) - returns default when not given
+def get_number_arg(name, default=None, type=int):
+    if name not in request.args:
+        return default
+    try:
+        value = type(request.args[name])
+    except ValueError:
+        abort(400, f"Invalid {name}")
+    if not value >= 0:
+        abort(400, f"Invalid {name}")
+    return value
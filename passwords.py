@@ -0,0 +1,116 @@
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# Password Hashing - bcrypt runs on a dedicated, bounded pool instead of on the request thread
+# bcrypt releases the GIL, so a thread pool hashes on as many cores as it has workers; PASSWORD_HASH_EXECUTOR="process"
+# uses worker processes instead. at most PASSWORD_HASH_WORKERS hashes run at once and PASSWORD_HASH_QUEUE more may wait,
+# so a login storm queues a bounded amount of work and is refused (PasswordHasherBusy) beyond that,
+# while the request threads stay free for the rest of the API
+# BCRYPT_LOG_ROUNDS is the bcrypt work factor - hashes made with another cost are rehashed on the next successful login
+def init_app(app):
+    app.config.setdefault("BCRYPT_LOG_ROUNDS", 12)
+    app.config.setdefault("PASSWORD_HASH_EXECUTOR", "thread")
+    app.config.setdefault("PASSWORD_HASH_WORKERS", os.cpu_count() or 1)
+    app.config.setdefault("PASSWORD_HASH_QUEUE", 64)
+    app.config.setdefault("PASSWORD_HASH_TIMEOUT", 10)
+    password_hasher.configure(
+        rounds=app.config["BCRYPT_LOG_ROUNDS"],
+        executor=app.config["PASSWORD_HASH_EXECUTOR"],
+        workers=app.config["PASSWORD_HASH_WORKERS"],
+        queue=app.config["PASSWORD_HASH_QUEUE"],
+        timeout=app.config["PASSWORD_HASH_TIMEOUT"],
+    )
+
+# bcrypt only uses the first 72 bytes of a password, and the bcrypt module refuses longer ones
+MAX_PASSWORD_BYTES = 72
+
+class PasswordHasherBusy(Exception):
+    pass
+
+# worker functions - module level so a process pool can pickle them
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode("utf-8")
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+# returns the work factor of a bcrypt hash ("$2b$12$..." -> 12), or None for a value that isn't a bcrypt hash
+def get_rounds(hashed):
+    parts = (hashed or "").split("$")
+    if len(parts) != 4 or not parts[1].startswith("2") or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+def _encode(password):
+    password = password.encode("utf-8")
+    if len(password) > MAX_PASSWORD_BYTES:
+        raise ValueError(f"Password is longer than {MAX_PASSWORD_BYTES} bytes")
+    return password
+
+class PasswordHasher:
+    def __init__(self, rounds=12, executor="thread", workers=1, queue=64, timeout=10):
+        self.executor = None
+        self.lock = threading.Lock()
+        self.configure(rounds, executor, workers, queue, timeout)
+
+    # (re)sets the work factor and the pool size - a running pool is shut down and a new one started on next use
+    def configure(self, rounds=12, executor="thread", workers=1, queue=64, timeout=10):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown password hash executor: {executor} (expected thread or process)")
+        self.shutdown()
+        self.rounds = rounds
+        self.executor_type = executor
+        self.workers = workers
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(workers + queue)
+
+    # the pool is started on first use (so building the app never forks worker processes), and the process pool's
+    # multiprocessing machinery is only imported when it is asked for
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                if self.executor_type == "process":
+                    from concurrent.futures import ProcessPoolExecutor
+                    self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            return self.executor
+
+    def _run(self, function, *args):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy("Too many password checks in progress")
+        try:
+            return self.get_executor().submit(function, *args).result()
+        finally:
+            self.slots.release()
+
+    # returns the bcrypt hash of the password (as a str) - raises ValueError if the password is too long
+    def hash(self, password):
+        return self._run(_hash, _encode(password), self.rounds)
+
+    # values that aren't bcrypt hashes are passwords stored before /register hashed them - they are compared
+    # directly (in constant time) so those users can still log in, and needs_rehash reports them for rehashing
+    def check(self, password, hashed):
+        if get_rounds(hashed) is None:
+            return hmac.compare_digest(password.encode("utf-8"), (hashed or "").encode("utf-8"))
+        try:
+            password = _encode(password)
+        except ValueError:
+            return False
+        return self._run(_check, password, hashed.encode("utf-8"))
+
+    def needs_rehash(self, hashed):
+        return get_rounds(hashed) != self.rounds
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+# configured from the app's settings by init_app (create_app, see app.py)
+password_hasher = PasswordHasher()
@@ -0,0 +1,149 @@
+import heapq
+import math
+from collections import defaultdict
+from operator import itemgetter
+
+from sqlalchemy import select
+
+from extensions import db, app_local
+from events import subscribe
+from indexes import MemoryIndex
+from models import members, favorites
+from neighbors import empty_neighbors, top_neighbors, update_neighbor
+
+# Club Recommendations - "clubs you might like": clubs are similar when the same users joined or favorited them
+# (the cosine of their columns in the user x club matrix), and a user gets the NEIGHBORS of their clubs they don't have
+MEMBER_WEIGHT = 1.0
+FAVORITE_WEIGHT = 2.0
+NEIGHBORS = 30
+
+WEIGHTS = {"member_added": MEMBER_WEIGHT, "member_removed": -MEMBER_WEIGHT,
+           "favorite_added": FAVORITE_WEIGHT, "favorite_removed": -FAVORITE_WEIGHT}
+
+class ClubRecommender(MemoryIndex):
+    refresh_limit = 1000
+
+    def _reset(self):
+        self.club_ids = {}          # club name -> position
+        self.club_names = []        # position -> club name (None once the club is deleted)
+        self.rows = {}              # username -> {club position: weight}
+        self.columns = []           # club position -> {username: weight}
+        self.squares = []           # club position -> sum of the squared weights in its column
+        self.norms = []             # club position -> length of its column (the square root of squares)
+        self.neighbors = []         # club position -> (positions, similarities) of its most similar clubs
+        self.dirty = {}             # changed club position -> positions of the clubs its changed users had
+
+    # reads every membership and favorite (two queries), then computes the neighbors of every club
+    def _build(self):
+        for table, weight in ((members, MEMBER_WEIGHT), (favorites, FAVORITE_WEIGHT)):
+            for username, club_name in db.session.execute(select(table.c.user_username, table.c.club_name)):
+                row = self.rows.setdefault(username, {})
+                position = self._position(club_name)
+                row[position] = row.get(position, 0.0) + weight
+        for username, row in self.rows.items():
+            for position, weight in row.items():
+                self.columns[position][username] = weight
+                self.squares[position] += weight * weight
+        self.norms = [math.sqrt(squares) for squares in self.squares]
+        self.neighbors = [top_neighbors(self._similarities(position), NEIGHBORS)
+                          for position in range(len(self.club_names))]
+
+    def _position(self, club_name):
+        position = self.club_ids.get(club_name)
+        if position is None:
+            position = len(self.club_names)
+            self.club_ids[club_name] = position
+            self.club_names.append(club_name)
+            self.columns.append({})
+            self.squares.append(0.0)
+            self.norms.append(0.0)
+            self.neighbors.append(empty_neighbors())
+        return position
+
+    # the cosine similarity of one club to every club it shares a user with, as {position: similarity}
+    def _similarities(self, position):
+        products = defaultdict(float)
+        for username, weight in self.columns[position].items():
+            for other, other_weight in self.rows[username].items():
+                products[other] += weight * other_weight
+        products.pop(position, None)
+        if not products:
+            return {}
+        scale = 1.0 / self.norms[position]
+        norms = self.norms
+        return {other: product * scale / norms[other] for other, product in products.items()}
+
+    # adds weight (negative to take it away) to one cell of the matrix - the club's similarities are now stale, and so
+    # is its entry in the lists of the user's other clubs (which lose it when the user was their only link)
+    def _add_weight(self, username, position, weight):
+        row = self.rows.setdefault(username, {})
+        column = self.columns[position]
+        old = row.get(position, 0.0)
+        new = max(old + weight, 0.0)
+        self.dirty.setdefault(position, set()).update(row)
+        if new > 0:
+            row[position] = column[username] = new
+        else:
+            row.pop(position, None)
+            column.pop(username, None)
+        self.squares[position] += new * new - old * old
+        self.norms[position] = math.sqrt(self.squares[position])
+
+    # recomputes the neighbors of the changed clubs, and their entries in the lists of the clubs they share users with
+    def _refresh(self):
+        stale, self.dirty = self.dirty, {}
+        recompute = set()
+        for position, shared in stale.items():
+            similarities = self._similarities(position)
+            self.neighbors[position] = top_neighbors(similarities, NEIGHBORS)
+            for other in shared.union(similarities):
+                if other != position and other not in stale:
+                    if not update_neighbor(self.neighbors, other, position, similarities.get(other, 0.0), NEIGHBORS):
+                        recompute.add(other)
+        for position in recompute:
+            self.neighbors[position] = top_neighbors(self._similarities(position), NEIGHBORS)
+
+    def _apply(self, name, payload):
+        if name in WEIGHTS:
+            self._add_weight(payload["user"], self._position(payload["club"]), WEIGHTS[name])
+        elif name == "club_updated":
+            old_name, new_name = payload["old_name"], payload["club"]
+            if old_name != new_name and old_name in self.club_ids:
+                position = self.club_ids.pop(old_name)
+                self.club_ids[new_name] = position
+                self.club_names[position] = new_name
+        elif name == "club_deleted":
+            position = self.club_ids.pop(payload["club"], None)
+            if position is not None:
+                for username, weight in list(self.columns[position].items()):
+                    self._add_weight(username, position, -weight)
+                self.club_names[position] = None
+        elif name == "user_updated":
+            old_name, new_name = payload["old_name"], payload["user"]
+            if old_name != new_name and old_name in self.rows:
+                row = self.rows[new_name] = self.rows.pop(old_name)
+                for position in row:
+                    self.columns[position][new_name] = self.columns[position].pop(old_name)
+        elif name == "user_deleted":
+            for position, weight in list(self.rows.get(payload["user"], {}).items()):
+                self._add_weight(payload["user"], position, -weight)
+            self.rows.pop(payload["user"], None)
+
+    # returns up to limit (club name, score) pairs for the user, best first - none for a user without clubs
+    def recommend(self, username, limit):
+        with self.reading():
+            row = self.rows.get(username)
+            if not row:
+                return []
+            scores = defaultdict(float)
+            for position, weight in row.items():
+                positions, similarities = self.neighbors[position]
+                for other, similarity in zip(positions, similarities):
+                    scores[other] += weight * similarity
+            for position in row:
+                scores.pop(position, None)
+            best = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+            return [(self.club_names[position], score) for position, score in best]
+
+recommender = app_local("recommender", ClubRecommender)
+subscribe(lambda name, payload: recommender.apply(name, payload))
@@ -0,0 +1,246 @@
+import importlib.util
+import math
+from collections import Counter, defaultdict
+
+from sqlalchemy import select
+
+from extensions import db, app_local
+from events import subscribe
+from indexes import MemoryIndex
+from models import Club
+from neighbors import empty_neighbors, top_neighbors, update_neighbor
+from search import tokenize
+from serializers import load_club_associations
+
+# numpy (the batched similarity computation) is optional - without it the similarities are summed over an inverted index
+# it is imported when the index is first built, so the app doesn't pay for importing it at startup
+USE_NUMPY = importlib.util.find_spec("numpy") is not None
+numpy = None
+
+def _import_numpy():
+    global numpy
+    if USE_NUMPY and numpy is None:
+        import numpy
+    return numpy if USE_NUMPY else None
+
+# Related Clubs - the RELATED clubs most like a given club: the cosine of the TF-IDF vectors of their descriptions and
+# tags (a tag counts as TAG_WEIGHT words); document frequencies are those of the last full build
+RELATED = 20
+TAG_WEIGHT = 3.0
+BATCH_SIZE = 64
+DENSE_TERMS = 256
+
+# the weighted term counts of one club - a tag is a term of its own, kept apart from the words of the description
+def club_terms(description, tag_names):
+    terms = {word: 1 + math.log(count) for word, count in Counter(tokenize(description or "")).items()}
+    for tag_name in tag_names:
+        terms[f"tag:{tag_name}"] = TAG_WEIGHT
+    return terms
+
+class RelatedClubIndex(MemoryIndex):
+    def _reset(self):
+        self.club_ids = {}          # club name -> position
+        self.club_names = []        # position -> club name (None once the club is deleted)
+        self.vectors = []           # position -> {term: weight}, of length 1
+        self.neighbors = []         # position -> (positions, similarities) of its most similar clubs
+        self.idf = {}               # term -> inverse document frequency at the last full build
+        self.default_idf = 1.0      # inverse document frequency of a term no club had at the last full build
+        self.term_ids = {}          # term -> matrix column (numpy)
+        self.matrix = None          # (indptr, indices, data, row of each entry) of the vectors (numpy)
+        self.postings = defaultdict(dict)   # term -> {position: weight} (without numpy)
+        self.dirty = set()          # names of the clubs created, updated, or deleted since they were read
+
+    # reads every club's description and tags (two queries), then computes the related clubs of every club
+    def _build(self):
+        club_tags = load_club_associations(None, fields={"tags"})["tags"]
+        documents = [(name, club_terms(description, club_tags.get(name, [])))
+                     for name, description in db.session.execute(select(Club.name, Club.description))]
+        frequencies = Counter(term for _, terms in documents for term in terms)
+        self.default_idf = math.log((1 + len(documents)) / 2) + 1
+        self.idf = {term: math.log((1 + len(documents)) / (1 + count)) + 1 for term, count in frequencies.items()}
+        for name, terms in documents:
+            self.club_ids[name] = len(self.club_names)
+            self.club_names.append(name)
+            self.vectors.append(self._vector(terms))
+            self.neighbors.append(empty_neighbors())
+        if _import_numpy() is not None:
+            self._build_matrix()
+            self._all_neighbors()
+        else:
+            for position, vector in enumerate(self.vectors):
+                for term, weight in vector.items():
+                    self.postings[term][position] = weight
+            for position in range(len(self.vectors)):
+                self.neighbors[position] = top_neighbors(self._similarities(position), RELATED)
+
+    def _vector(self, terms):
+        weights = {term: count * self.idf.get(term, self.default_idf) for term, count in terms.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        return {term: weight / norm for term, weight in weights.items()} if norm else {}
+
+    def _term_id(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.term_ids)
+        return term_id
+
+    def _build_matrix(self):
+        indptr, indices, data = [0], [], []
+        for vector in self.vectors:
+            indices.extend(self._term_id(term) for term in vector)
+            data.extend(vector.values())
+            indptr.append(len(indices))
+        self._set_matrix(numpy.array(indptr, dtype=numpy.int64), numpy.array(indices, dtype=numpy.int64),
+                         numpy.array(data, dtype=numpy.float64))
+
+    def _set_matrix(self, indptr, indices, data):
+        rows = numpy.repeat(numpy.arange(len(indptr) - 1), numpy.diff(indptr))
+        self.matrix = (indptr, indices, data, rows)
+
+    # the related clubs of every club, BATCH_SIZE clubs at a time, as the product of the batch's rows with the matrix:
+    # the DENSE_TERMS most frequent terms (the ones most clubs share) are multiplied as dense (clubs x terms) matrices,
+    # and only the entries of the other terms that occur in the batch go through the sparse product
+    def _all_neighbors(self):
+        _, indices, data, rows = self.matrix
+        size = len(self.vectors)
+        frequencies = numpy.bincount(indices, minlength=len(self.term_ids))
+        dense_terms = numpy.argsort(-frequencies, kind="stable")[:DENSE_TERMS]
+        columns = numpy.full(len(self.term_ids), -1)
+        columns[dense_terms] = numpy.arange(len(dense_terms))
+        is_dense = columns[indices] >= 0
+        dense = numpy.zeros((size, len(dense_terms)))
+        dense[rows[is_dense], columns[indices[is_dense]]] = data[is_dense]
+        sparse = numpy.flatnonzero(~is_dense)
+        sparse_rows, sparse_terms, sparse_data = rows[sparse], indices[sparse], data[sparse]
+        sparse_indptr = numpy.searchsorted(sparse_rows, numpy.arange(size + 1))
+        for start in range(0, size, BATCH_SIZE):
+            end = min(start + BATCH_SIZE, size)
+            similarities = dense[start:end] @ dense.T
+            batch = slice(sparse_indptr[start], sparse_indptr[end])
+            block = numpy.zeros((end - start, len(self.term_ids)))
+            block[sparse_rows[batch] - start, sparse_terms[batch]] = sparse_data[batch]
+            batch_terms = numpy.zeros(len(self.term_ids), dtype=bool)
+            batch_terms[sparse_terms[batch]] = True
+            entries = numpy.flatnonzero(batch_terms[sparse_terms])
+            if len(entries):
+                entry_rows = sparse_rows[entries]
+                starts = numpy.flatnonzero(numpy.diff(entry_rows, prepend=-1))
+                products = block[:, sparse_terms[entries]] * sparse_data[entries]
+                similarities[:, entry_rows[starts]] += numpy.add.reduceat(products, starts, axis=1)
+            for row, position in enumerate(range(start, end)):
+                self.neighbors[position] = _top_array(similarities[row], position)
+
+    # the similarity of the vector to every club it shares a term with, as {position: similarity}
+    def _scores(self, vector):
+        if not vector:
+            return {}
+        if self.matrix is None:
+            scores = defaultdict(float)
+            for term, weight in vector.items():
+                for position, other_weight in self.postings.get(term, {}).items():
+                    scores[position] += weight * other_weight
+            return scores
+        _, indices, data, rows = self.matrix
+        dense = numpy.zeros(len(self.term_ids) + len(vector))
+        for term, weight in vector.items():
+            dense[self._term_id(term)] = weight
+        scores = numpy.bincount(rows, weights=data * dense[indices], minlength=len(self.vectors))
+        positions = numpy.flatnonzero(scores)
+        return dict(zip(positions.tolist(), scores[positions].tolist()))
+
+    def _similarities(self, position):
+        similarities = self._scores(self.vectors[position])
+        similarities.pop(position, None)
+        return similarities
+
+    # replaces the vector of one club (appending clubs new to the index) in the matrix or the inverted index
+    def _set_vector(self, position, vector):
+        if position == len(self.vectors):
+            self.vectors.append({})
+            self.neighbors.append(empty_neighbors())
+            if self.matrix is not None:
+                indptr, indices, data, _ = self.matrix
+                self._set_matrix(numpy.append(indptr, indptr[-1]), indices, data)
+        if self.matrix is None:
+            for term in self.vectors[position]:
+                self.postings[term].pop(position, None)
+            for term, weight in vector.items():
+                self.postings[term][position] = weight
+        else:
+            indptr, indices, data, _ = self.matrix
+            start, end = indptr[position], indptr[position + 1]
+            row_indices = numpy.array([self._term_id(term) for term in vector], dtype=numpy.int64)
+            row_data = numpy.array(list(vector.values()), dtype=numpy.float64)
+            indptr = indptr.copy()
+            indptr[position + 1:] += len(vector) - (end - start)
+            self._set_matrix(indptr, numpy.concatenate((indices[:start], row_indices, indices[end:])),
+                             numpy.concatenate((data[:start], row_data, data[end:])))
+        self.vectors[position] = vector
+
+    # re-reads the changed clubs (two queries) and re-vectorizes them one at a time: each club's list is recomputed,
+    # and its new similarity is patched into the lists of the clubs that shared a term with its old or new vector
+    def _refresh(self):
+        club_names = sorted(self.dirty)
+        self.dirty = set()
+        descriptions = dict(db.session.execute(
+            select(Club.name, Club.description).where(Club.name.in_(club_names))).all())
+        club_tags = load_club_associations(club_names, fields={"tags"})["tags"]
+        recompute = set()
+        for name in club_names:
+            if name in descriptions:
+                position = self.club_ids.get(name)
+                if position is None:
+                    position = self.club_ids[name] = len(self.club_names)
+                    self.club_names.append(name)
+                vector = self._vector(club_terms(descriptions[name], club_tags.get(name, [])))
+            else:
+                position = self.club_ids.pop(name, None)
+                if position is None:
+                    continue
+                self.club_names[position] = None
+                vector = {}
+            old = self._scores(self.vectors[position]) if position < len(self.vectors) else {}
+            self._set_vector(position, vector)
+            similarities = self._similarities(position)
+            self.neighbors[position] = top_neighbors(similarities, RELATED)
+            for other in set(old).union(similarities):
+                if other != position and not update_neighbor(
+                        self.neighbors, other, position, similarities.get(other, 0.0), RELATED):
+                    recompute.add(other)
+        for position in recompute:
+            self.neighbors[position] = top_neighbors(self._similarities(position), RELATED)
+
+    def _apply(self, name, payload):
+        if name in ("club_created", "club_deleted", "tag_added", "tag_removed"):
+            self.dirty.add(payload["club"])
+        elif name == "club_updated":
+            old_name, new_name = payload["old_name"], payload["club"]
+            if old_name != new_name and old_name in self.club_ids:
+                position = self.club_ids.pop(old_name)
+                self.club_ids[new_name] = position
+                self.club_names[position] = new_name
+            self.dirty.add(new_name)
+        elif name in ("tag_updated", "tag_deleted"):
+            self.dirty.update(payload["clubs"])
+
+    # returns up to limit (club name, similarity) pairs for the club, most similar first - None for an unknown club
+    def related(self, club_name, limit):
+        with self.reading():
+            position = self.club_ids.get(club_name)
+            if position is None:
+                return None
+            positions, similarities = self.neighbors[position]
+            return [(self.club_names[other], similarity)
+                    for other, similarity in zip(positions[:limit], similarities[:limit])]
+
+# the RELATED most similar positions in one column of the similarity matrix, leaving out the club itself
+def _top_array(similarities, position):
+    similarities[position] = 0
+    best = numpy.arange(len(similarities))
+    if len(best) > RELATED:
+        best = numpy.argpartition(similarities, -RELATED)[-RELATED:]
+    best = best[similarities[best] > 0]
+    return top_neighbors(dict(zip(best.tolist(), similarities[best].tolist())), RELATED)
+
+related_clubs = app_local("related_clubs", RelatedClubIndex)
+subscribe(lambda name, payload: related_clubs.apply(name, payload))
@@ -0,0 +1,958 @@
+import click
+from flask import Blueprint, current_app, request, jsonify, abort
+from flask_login import current_user, login_required
+from sqlalchemy import case, or_, select
+
+from extensions import db
+from models import Club, User, Review, Tag, recompute_counters, MIN_RATING, MAX_RATING
+from serializers import (serialize_clubs, serialize_users, serialize_reviews, serialize_tags,
+    CLUB_FIELDS, USER_FIELDS, REVIEW_FIELDS, TAG_FIELDS)
+from pagination import paginate, get_fields, get_page_size, get_offset, encode_cursor, get_number_arg
+from search import club_search
+from facets import tag_index
+from recommendations import recommender
+from related import related_clubs
+from catalog import catalog
+from events import emit
+from cache import cached, club_key, tag_key, response_cache
+from passwords import PasswordHasherBusy
+from auth import issue_token, revoke_token, bearer_token
+from export import EXPORTS, FORMATS, export_response
+from changes import get_changes, get_latest_seq, compact_changes
+import uow
+import metrics
+import schema
+
+# the routes and CLI commands of the API - registered on the app by create_app (see app.py)
+blueprint = Blueprint("api", __name__, cli_group=None)
+
+# largest list of names accepted by the batch routes
+MAX_BATCH_SIZE = 1000
+
+# reads the list of names in the given field of a batch request body (duplicates removed, order kept)
+def get_batch_names(field):
+    data = request.get_json()
+    names = data.get(field) if isinstance(data, dict) else None
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        abort(400, f"Missing required field: {field}")
+    if len(names) > MAX_BATCH_SIZE:
+        abort(400, f"At most {MAX_BATCH_SIZE} names per request")
+    return list(dict.fromkeys(names))
+
+# checks the rating of a review request - a whole number from MIN_RATING to MAX_RATING (floats, booleans, and
+# strings are rejected before the range check, since the rating indexes the club's rating histogram)
+def get_rating(rating):
+    if not isinstance(rating, int) or isinstance(rating, bool) or rating < MIN_RATING or rating > MAX_RATING:
+        abort(400, "Invalid rating")
+    return rating
+
+# returns the subset of names that exist in the given primary key column, in one query
+def get_existing_names(column, names):
+    if not names:
+        return set()
+    return set(db.session.execute(select(column).where(column.in_(names))).scalars())
+
+# per-item results of a batch route - each name maps to the message for what happened to it
+def get_batch_results(names, found, changed, changed_message, unchanged_message, missing_message):
+    results = {}
+    for name in names:
+        if name not in found:
+            results[name] = missing_message
+        elif name in changed:
+            results[name] = changed_message
+        else:
+            results[name] = unchanged_message
+    return results
+
+@blueprint.route("/")
+def main():
+    return "Welcome to Penn Club Review!"
+
+@blueprint.route("/api")
+def api():
+    return jsonify({"message": "Welcome to the Penn Club Review API!."})
+
+# POST: input username, email, password, first name, last name - registers user in site if registration is valid
+@blueprint.route("/register", methods=["POST"])
+def register():
+    registration = request.get_json()
+
+    required_fields = ["username", "email", "password", "first_name", "last_name"]
+    for field in required_fields:
+        if field not in registration:
+            abort(400, f"Missing required field: {field}")
+    
+    user = User(username=registration["username"],email=registration["email"],
+                first_name=registration["first_name"],last_name=registration["last_name"])
+    try:
+        user.set_password(registration["password"])
+    except ValueError as error:
+        abort(400, str(error))
+    db.session.add(user)
+    emit("user_created", user=user.username)
+    db.session.commit()
+    return jsonify({"message": "Registration successful"})
+
+# POST: input username, email, password, first name, last name - registers user in site if registration is valid
+@blueprint.route("/login", methods=["POST"])
+def login():
+    login = request.get_json()
+
+    required_fields = ["username/email","password"]
+    for field in required_fields:
+        if field not in login:
+            abort(400, f"Missing required field: {field}")
+    
+    # one query for both columns - a username match wins over another user's email
+    identifier = login["username/email"]
+    user = (User.query.filter(or_(User.username == identifier, User.email == identifier))
+            .order_by(case((User.username == identifier, 0), else_=1)).first())
+    if not user:
+        return jsonify({"message": "Invalid email/username"})
+    if not user.check_password(login["password"]):
+        return jsonify({"message": "Invalid password"})
+    # hashes made with an old work factor (or old plain-text passwords) are replaced while the password is at hand
+    if user.password_needs_rehash():
+        user.set_password(login["password"])
+        db.session.commit()
+    return jsonify({"message": "Login successful", "token": issue_token(user)})
+
+# POST: no input (token in the Authorization header) - revokes the token (only with AUTH_SESSION_STORE="memory")
+@blueprint.route("/logout", methods=["POST"])
+@login_required
+def logout():
+    revoke_token(bearer_token())
+    return jsonify({"message": "Logout successful"})
+
+# GET: no input (token in the Authorization header) - returns json with the logged in user's information
+@blueprint.route("/api/me", methods=["GET"])
+@login_required
+def access_current_user():
+    return jsonify({"username": current_user.username, "email": current_user.email,
+                    "first_name": current_user.first_name, "last_name": current_user.last_name})
+
+# the password hasher's pool and queue are full - ask the client to retry instead of tying up a request thread
+@blueprint.app_errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    response = jsonify({"message": str(error)})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+# GET: optional cursor, limit, fields - returns json with one page of clubs and the cursor of the next page
+# PUT: input code, name, description, tags - adds club to database
+@blueprint.route("/api/clubs", methods=["GET", "PUT"])
+@cached(lambda: ["clubs"])
+def access_all_clubs():
+    if request.method == "GET":
+        fields = get_fields(CLUB_FIELDS)
+        if current_app.config["CATALOG_ENABLED"]:
+            clubs, next_cursor = catalog.club_page(fields)
+            return jsonify({"clubs": clubs, "next_cursor": next_cursor})
+        clubs, next_cursor = paginate(Club.query, Club.name)
+        return jsonify({"clubs": serialize_clubs(clubs, fields=fields), "next_cursor": next_cursor})
+    elif request.method == "PUT":
+        club = request.get_json()
+
+        required_fields = ["code", "name", "description"]
+        for field in required_fields:
+            if field not in club:
+                abort(400, f"Missing required field: {field}")
+
+        if Club.query.filter_by(code=club["code"],name=club["name"]).first():
+            return jsonify({"message": "Club already exists"})
+        
+        new_club = Club(code=club["code"],name=club["name"],description=club["description"])
+        db.session.add(new_club)
+        if "tags" in club:
+            for tag_name in club["tags"]:
+                tag = Tag.query.filter_by(name=tag_name).first()
+                if tag:
+                    new_club.add_tag(tag)
+                else:
+                    new_tag = Tag(name=tag_name)
+                    emit("tag_created", tag=new_tag.name)
+                    new_club.add_tag(new_tag)
+
+        club_search.index_club(new_club)
+        emit("club_created", club=new_club.name)
+        db.session.commit()
+        return jsonify({"message": "Club added"})
+
+# GET: no input - returns json with current club information 
+# PATCH: input code, name, description, tags - updates current club information
+# DELETE: no input - deletes current club from database
+@blueprint.route("/api/clubs/<string:club_name>", methods=["GET", "PATCH", "DELETE"])
+@cached(lambda club_name: [club_key(club_name)])
+def access_club(club_name):
+    if request.method == "GET" and current_app.config["CATALOG_ENABLED"]:
+        club = catalog.club(club_name)
+        if club:
+            return jsonify(club)
+    club = Club.query.filter_by(name=club_name).first()
+    if request.method == "GET":
+        if club:
+            return jsonify(serialize_clubs([club])[0])
+    elif request.method == "PATCH":
+        new_club = request.get_json()
+        old_name = club.name
+        if "code" in new_club:
+            club.code = new_club["code"]
+        if "name" in new_club and new_club["name"] != old_name:
+            if Club.query.filter_by(name=new_club["name"]).first():
+                abort(400, "Club already exists")
+            club.rename(new_club["name"])
+        if "description" in new_club:
+            club.description = new_club["description"]
+        if club.name != old_name:
+            club_search.remove_club(old_name)
+        club_search.index_club(club)
+        emit("club_updated", club=club.name, old_name=old_name,
+            tags=[tag.get_tag_name() for tag in club.get_tags()])
+        db.session.commit()
+        return jsonify({"message": "Club modified"})
+    elif request.method == "DELETE":
+        if club:
+            club_search.remove_club(club.name)
+            club.delete()
+            db.session.commit()
+            return jsonify({"message": "Club deleted"})
+        else:
+            abort(400, "Club does not exist")
+
+# GET: optional limit, fields - returns json with the clubs whose descriptions and tags are most like this club's,
+# most similar first, each with its similarity (see related.py)
+@blueprint.route("/api/clubs/<string:club_name>/related", methods=["GET"])
+@cached(lambda club_name: ["clubs"])
+def access_related_clubs(club_name):
+    fields = get_fields(CLUB_FIELDS)
+    related = related_clubs.related(club_name, get_page_size())
+    if related is None:
+        abort(400, "Club does not exist")
+    similarities = dict(related)
+    clubs = {club.name: club for club in Club.query.filter(Club.name.in_(list(similarities))).all()}
+    names = [name for name in similarities if name in clubs]
+    serialized = serialize_clubs([clubs[name] for name in names], fields=fields)
+    for item, name in zip(serialized, names):
+        item["similarity"] = round(similarities[name], 6)
+    return jsonify({"clubs": serialized})
+
+# GET: no input - returns json with current club tags 
+# PUT: input tag name - adds tag to current club tags
+# DELETE: input tag name - deletes tag from current club tags
+@blueprint.route("/api/clubs/<string:club_name>/tags", methods=["GET", "PUT", "DELETE"])
+@cached(lambda club_name: [club_key(club_name)])
+def access_club_tags(club_name):
+    club = Club.query.filter_by(name=club_name).first()
+    if request.method == "GET":
+        if club:
+            tags = [tag.get_tag_name() for tag in club.get_tags()]
+            return jsonify({"tags": tags})
+    elif request.method == "PUT":
+        tag_data = request.get_json()
+        if "name" in tag_data:
+            tag = Tag.query.filter_by(name=tag_data["name"]).first()
+            if tag:
+                club.add_tag(tag)
+            else:
+                new_tag = Tag(name=tag_data["name"])
+                emit("tag_created", tag=new_tag.name)
+                club.add_tag(new_tag)
+            club_search.index_club(club)
+            db.session.commit()
+            return jsonify({"message": "Tag added to club"})
+    elif request.method == "DELETE":
+        tag_data = request.get_json()
+        if "name" in tag_data:
+            tag = Tag.query.filter_by(name=tag_data["name"]).first()
+            if tag:
+                club.remove_tag(tag)
+            else:
+                abort(400, "Invalid tag name")
+            club_search.index_club(club)
+            db.session.commit()
+            return jsonify({"message": "Tag removed from club"})
+
+# PUT: input list of tag names - adds every tag to current club tags (creating tags that don't exist yet)
+# DELETE: input list of tag names - deletes every tag from current club tags
+@blueprint.route("/api/clubs/<string:club_name>/tags/batch", methods=["PUT", "DELETE"])
+def access_club_tags_batch(club_name):
+    club = Club.query.filter_by(name=club_name).first()
+    if not club:
+        abort(400, "Club does not exist")
+    tag_names = get_batch_names("names")
+    found = get_existing_names(Tag.name, tag_names)
+    if request.method == "PUT":
+        new_tags = [tag_name for tag_name in tag_names if tag_name not in found]
+        if new_tags:
+            db.session.execute(Tag.__table__.insert(), [{"name": tag_name, "club_count": 0} for tag_name in new_tags])
+            for tag_name in new_tags:
+                emit("tag_created", tag=tag_name)
+        changed = club.add_tags(tag_names)
+        results = get_batch_results(tag_names, tag_names, changed, "added", "already a tag", "invalid tag name")
+    else:
+        changed = club.remove_tags(found)
+        results = get_batch_results(tag_names, found, changed, "removed", "not a tag", "invalid tag name")
+    if changed:
+        club_search.index_club(club)
+    db.session.commit()
+    return jsonify({"results": results})
+
+# GET: no input - returns json with current club members 
+# PUT: input username - adds member to current club members
+# DELETE: input username - deletes member from current club members
+@blueprint.route("/api/clubs/<string:club_name>/members", methods=["GET", "PUT", "DELETE"])
+def access_club_members(club_name):
+    club = Club.query.filter_by(name=club_name).first()
+    if request.method == "GET":
+        if club:
+            members = [member.get_full_name() for member in club.get_members()]
+            return jsonify({"members": members})
+    elif request.method == "PUT":
+        member = request.get_json()
+        if "username" in member:
+            user = User.query.filter_by(username=member["username"]).first()
+            if user:
+                club.add_member(user)
+            else:
+                abort(400, "Invalid username")
+            db.session.commit()
+            return jsonify({"message": "User added to club"})
+    elif request.method == "DELETE":
+        member = request.get_json()
+        if "username" in member:
+            user = User.query.filter_by(username=member["username"]).first()
+            if user:
+                club.remove_member(user)
+            else:
+                abort(400, "Invalid username")
+            db.session.commit()
+            return jsonify({"message": "User removed from club"})
+        
+# PUT: input list of usernames - adds every user to current club members
+# DELETE: input list of usernames - deletes every user from current club members (and officers)
+@blueprint.route("/api/clubs/<string:club_name>/members/batch", methods=["PUT", "DELETE"])
+def access_club_members_batch(club_name):
+    club = Club.query.filter_by(name=club_name).first()
+    if not club:
+        abort(400, "Club does not exist")
+    usernames = get_batch_names("usernames")
+    found = get_existing_names(User.username, usernames)
+    if request.method == "PUT":
+        changed = club.add_members(found)
+        results = get_batch_results(usernames, found, changed, "added", "already a member", "invalid username")
+    else:
+        changed = club.remove_members(found)
+        results = get_batch_results(usernames, found, changed, "removed", "not a member", "invalid username")
+    db.session.commit()
+    return jsonify({"results": results})
+
+# GET: no input - returns json with emails of all current club members
+@blueprint.route("/api/clubs/<string:club_name>/members/emails", methods=["GET"])
+def access_club_members_emails(club_name):
+    club = Club.query.filter_by(name=club_name).first()
+    if club:
+        emails = [member.get_user_email() for member in club.get_members()]
+        return jsonify({"emails": emails})
+
+# GET: no input - returns json with current club officers 
+# PUT: input officer name - adds officer to current club officers
+# DELETE: input officer name - deletes officer from current club officers
+@blueprint.route("/api/clubs/<string:club_name>/officers", methods=["GET", "PUT", "DELETE"])
+def access_club_officers(club_name):
+    club = Club.query.filter_by(name=club_name).first()
+    if request.method == "GET":
+        if club:
+            officers = [officer.get_full_name() for officer in club.get_officers()]
+            return jsonify({"members": officers})
+    elif request.method == "PUT":
+        officer = request.get_json()
+        if "username" in officer:
+            user = User.query.filter_by(username=officer["username"]).first()
+            if user:
+                club.add_officer(user)
+            else:
+                abort(400, "Invalid username")
+            db.session.commit()
+            return jsonify({"message": "User added to club officers"})
+    elif request.method == "DELETE":
+        officer = request.get_json()
+        if "username" in officer:
+            user = User.query.filter_by(username=officer["username"]).first()
+            if user:
+                club.remove_officer(user)
+            else:
+                abort(400, "Invalid username")
+            db.session.commit()
+            return jsonify({"message": "User removed from club officers"})
+
+# PUT: input list of usernames - adds every user to current club officers (and members)
+# DELETE: input list of usernames - deletes every user from current club officers
+@blueprint.route("/api/clubs/<string:club_name>/officers/batch", methods=["PUT", "DELETE"])
+def access_club_officers_batch(club_name):
+    club = Club.query.filter_by(name=club_name).first()
+    if not club:
+        abort(400, "Club does not exist")
+    usernames = get_batch_names("usernames")
+    found = get_existing_names(User.username, usernames)
+    if request.method == "PUT":
+        changed = club.add_officers(found)
+        results = get_batch_results(usernames, found, changed, "added", "already an officer", "invalid username")
+    else:
+        changed = club.remove_officers(found)
+        results = get_batch_results(usernames, found, changed, "removed", "not an officer", "invalid username")
+    db.session.commit()
+    return jsonify({"results": results})
+
+# GET: no input - returns json with current club reviews 
+# PUT: input title, rating, username - adds review to current club reviews
+# DELETE: input review id - deletes review from current club reviews
+@blueprint.route("/api/clubs/<string:club_name>/reviews", methods=["GET", "PUT", "DELETE"])
+def access_club_reviews(club_name):
+    club = Club.query.filter_by(name=club_name).first()
+    if request.method == "GET":
+        if club:
+            reviews = [{
+                "id": review.get_review_id(),
+                "title": review.get_review_title(), 
+                "rating": review.get_review_rating(), 
+                "description": review.get_review_description(), 
+                "user": review.get_review_user(), 
+                "club": review.get_review_club()
+            } for review in club.get_reviews()]
+            return jsonify({"reviews": reviews})
+    elif request.method == "PUT":
+        review = request.get_json()
+        required_fields = ["title", "rating", "username"]
+        for field in required_fields:
+            if field not in review:
+                abort(400, f"Missing required field: {field}")
+        user = User.query.filter_by(username=review["username"]).first()
+        if not user:
+            abort(400, "Invalid username")
+        get_rating(review["rating"])
+        new_review = Review(title=review["title"],rating=review["rating"],review_user=user,review_club=club)
+        if "description" in required_fields:
+            new_review.set_review_description(review["description"])
+        db.session.add(new_review)
+        club.add_rating(new_review.rating)
+        db.session.flush()
+        emit("review_created", review=new_review.id, club=new_review.club, user=new_review.user)
+        db.session.commit()
+        return jsonify({"message": "Review added to club"})
+    elif request.method == "DELETE":
+        review_data = request.get_json()
+        if "id" in review_data:
+            review = Review.query.filter_by(id=review_data["id"]).first()
+            if review and (review.get_review_club() == club.get_club_name()):
+                emit("review_deleted", review=review.id, club=review.club, user=review.user)
+                review.review_club.remove_rating(review.rating)
+                db.session.delete(review)
+            else:
+                abort(400, "Invalid review id")
+            db.session.commit()
+            return jsonify({"message": "Review removed from club"})
+
+# GET: optional limit, min_reviews, fields - returns json with the highest rated clubs, best first
+@blueprint.route("/api/clubs/top-rated", methods=["GET"])
+@cached(lambda: ["clubs"])
+def top_rated_clubs():
+    fields = get_fields(CLUB_FIELDS)
+    clubs = Club.top_rated(get_page_size(), get_number_arg("min_reviews", 1))
+    return jsonify({"clubs": serialize_clubs(clubs, fields=fields)})
+
+# GET: optional cursor, limit, fields - returns json with one page of clubs matching the search string, most relevant first
+# every word of the search string is prefix-matched against club names, codes, descriptions, and tags
+@blueprint.route("/api/clubs/search-club/<string:search_str>", methods=["GET"])
+def search_club(search_str):
+    fields = get_fields(CLUB_FIELDS)
+    limit = get_page_size()
+    offset = get_offset()
+    names = club_search.search(search_str, limit + 1, offset)
+    next_cursor = encode_cursor(offset + limit) if len(names) > limit else None
+    names = names[:limit]
+    clubs = {club.name: club for club in Club.query.filter(Club.name.in_(names)).all()}
+    clubs = serialize_clubs([clubs[name] for name in names if name in clubs], fields=fields)
+    return jsonify({"clubs": clubs, "next_cursor": next_cursor})
+    
+# GET: optional q (tag expression), min_members, max_members, min_rating, max_rating, cursor, limit, fields
+# returns json with one page of matching clubs, the number of matches, and the number of matches per tag (facets)
+# q combines tag names with AND, OR, NOT and parentheses, e.g. Technology AND NOT ("Pre-Professional" OR Arts)
+@blueprint.route("/api/clubs/filter", methods=["GET"])
+@cached(lambda: ["clubs", "tags"])
+def filter_clubs():
+    fields = get_fields(CLUB_FIELDS)
+    limit = get_page_size()
+    offset = get_offset()
+    try:
+        names, count, facets = tag_index.filter(
+            request.args.get("q"),
+            min_members=get_number_arg("min_members"), max_members=get_number_arg("max_members"),
+            min_rating=get_number_arg("min_rating", type=float), max_rating=get_number_arg("max_rating", type=float),
+            limit=limit, offset=offset)
+    except ValueError as error:
+        abort(400, str(error))
+    next_cursor = encode_cursor(offset + limit) if offset + limit < count else None
+    clubs = {club.name: club for club in Club.query.filter(Club.name.in_(names)).all()}
+    clubs = serialize_clubs([clubs[name] for name in names if name in clubs], fields=fields)
+    return jsonify({"clubs": clubs, "count": count, "facets": facets, "next_cursor": next_cursor})
+
+# GET: optional cursor, limit, fields - returns json with one page of users and the cursor of the next page
+# PUT: input username, email, first name, last name - adds user to database
+@blueprint.route("/api/users", methods=["GET", "PUT"])
+def access_all_users():
+    if request.method == "GET":
+        fields = get_fields(USER_FIELDS)
+        users, next_cursor = paginate(User.query, User.username)
+        return jsonify({"users": serialize_users(users, fields=fields), "next_cursor": next_cursor})
+    elif request.method == "PUT":
+        user = request.get_json()
+
+        required_fields = ["username", "email", "first_name", "last_name"]
+        for field in required_fields:
+            if field not in user:
+                abort(400, f"Missing required field: {field}")
+
+        new_user = User(username=user["username"],email=user["email"],first_name=user["first_name"],last_name=user["last_name"])
+        db.session.add(new_user)
+        emit("user_created", user=new_user.username)
+        db.session.commit()
+        return jsonify({"message": "User added"})
+
+# GET: no input - returns json with current user information 
+# PATCH: input username, email, first_name, last_name - updates current user information
+# DELETE: no input - deletes current user from database
+@blueprint.route("/api/users/<string:username>", methods=["GET", "PATCH", "DELETE"])
+def access_user(username):
+    user = User.query.filter_by(username=username).first()
+    if request.method == "GET":
+        if user:
+            return jsonify(serialize_users([user])[0])
+    elif request.method == "PATCH":
+        new_user = request.get_json()
+        old_username = user.username
+        related_clubs = user.get_related_club_names()
+        if "username" in new_user and new_user["username"] != old_username:
+            if User.query.filter_by(username=new_user["username"]).first():
+                abort(400, "User already exists")
+            user.rename(new_user["username"])
+        if "email" in new_user:
+            user.email = new_user["email"]
+        if "first_name" in new_user:
+            user.first_name = new_user["first_name"]
+        if "last_name" in new_user:
+            user.last_name = new_user["last_name"]
+        emit("user_updated", user=user.username, old_name=old_username, clubs=related_clubs)
+        db.session.commit()
+        return jsonify({"message": "User modified"})
+    elif request.method == "DELETE":
+        if user:
+            user.delete()
+            db.session.commit()
+            return jsonify({"message": "User deleted"})
+        else:
+            abort(400, "User does not exist")
+
+# POST: input new password - changes password for current user
+@blueprint.route("/api/users/<string:username>/change-password", methods=["POST"])
+def change_user_password(username):
+    user = User.query.filter_by(username=username).first()
+    new_password = request.get_json()
+    try:
+        user.set_password(new_password)
+    except ValueError as error:
+        abort(400, str(error))
+    db.session.commit()
+    return jsonify({"message": "Password change successful"})
+
+# GET: no input - returns json with current user's favorite clubs 
+# PUT: input club name - adds club to current user's favorite clubs
+# DELETE: input club name - deletes club from current user's favorite clubs
+@blueprint.route("/api/users/<string:username>/favorites", methods=["GET", "PUT", "DELETE"])
+def access_user_favorites(username):
+    user = User.query.filter_by(username=username).first()
+    if request.method == "GET":
+        if user:
+            favorites = [club.get_club_name() for club in user.get_favorites()]
+            return jsonify({"favorites": favorites})
+    elif request.method == "PUT":
+        club_data = request.get_json()
+        if "name" in club_data:
+            club = Club.query.filter_by(name=club_data["name"]).first()
+            if club:
+                user.add_favorite(club)
+            else:
+                abort(400, "Invalid club name")
+            db.session.commit()
+            return jsonify({"message": "Club added to user favorites"})
+    elif request.method == "DELETE":
+        club_data = request.get_json()
+        if "name" in club_data:
+            club = Club.query.filter_by(name=club_data["name"]).first()
+            if club:
+                user.remove_favorite(club)
+            else:
+                abort(400, "Invalid club name")
+            db.session.commit()
+            return jsonify({"message": "Club removed from user favorites"})
+
+# PUT: input list of club names - adds every club to current user's favorite clubs
+# DELETE: input list of club names - deletes every club from current user's favorite clubs
+@blueprint.route("/api/users/<string:username>/favorites/batch", methods=["PUT", "DELETE"])
+def access_user_favorites_batch(username):
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        abort(400, "User does not exist")
+    club_names = get_batch_names("names")
+    found = get_existing_names(Club.name, club_names)
+    if request.method == "PUT":
+        changed = user.add_favorites(found)
+        results = get_batch_results(club_names, found, changed, "added", "already a favorite", "invalid club name")
+    else:
+        changed = user.remove_favorites(found)
+        results = get_batch_results(club_names, found, changed, "removed", "not a favorite", "invalid club name")
+    db.session.commit()
+    return jsonify({"results": results})
+
+# GET: no input - returns json with clubs current user is a member of 
+# PUT: input club name - adds current user to specified club members
+# DELETE: input club name - removes current user from specified club members
+@blueprint.route("/api/users/<string:username>/members", methods=["GET", "PUT", "DELETE"])
+def access_user_member_clubs(username):
+    user = User.query.filter_by(username=username).first()
+    if request.method == "GET":
+        if user:
+            clubs = [club.get_club_name() for club in user.get_member_clubs()]
+            return jsonify({"clubs": clubs})
+    elif request.method == "PUT":
+        club_data = request.get_json()
+        if "name" in club_data:
+            club = Club.query.filter_by(name=club_data["name"]).first()
+            if club:
+                user.join_club(club)
+            else:
+                abort(400, "Invalid club name")
+            db.session.commit()
+            return jsonify({"message": "Club added to user membership"})
+    elif request.method == "DELETE":
+        club_data = request.get_json()
+        if "name" in club_data:
+            club = Club.query.filter_by(name=club_data["name"]).first()
+            if club:
+                user.leave_club(club)
+            else:
+                abort(400, "Invalid club name")
+            db.session.commit()
+            return jsonify({"message": "Club removed from user membership"})
+        
+# GET: no input - returns json with clubs current user is an officer of
+@blueprint.route("/api/users/<string:username>/officers", methods=["GET"])
+def access_user_officer_clubs(username):
+    user = User.query.filter_by(username=username).first()
+    if request.method == "GET":
+        if user:
+            clubs = [club.get_club_name() for club in user.get_officer_clubs()]
+            return jsonify({"clubs": clubs})
+        
+# GET: optional limit, fields - returns json with the clubs the user might like, best first, each with its score
+# clubs are recommended when they share members and favoriters with the user's own clubs (see recommendations.py)
+@blueprint.route("/api/users/<string:username>/recommendations", methods=["GET"])
+def access_user_recommendations(username):
+    fields = get_fields(CLUB_FIELDS)
+    limit = get_page_size()
+    if not User.query.filter_by(username=username).first():
+        abort(400, "User does not exist")
+    scores = dict(recommender.recommend(username, limit))
+    clubs = {club.name: club for club in Club.query.filter(Club.name.in_(list(scores))).all()}
+    names = [name for name in scores if name in clubs]
+    recommended = serialize_clubs([clubs[name] for name in names], fields=fields)
+    for item, name in zip(recommended, names):
+        item["score"] = round(scores[name], 6)
+    return jsonify({"clubs": recommended})
+
+# GET: no input - returns json with current user's reviews 
+# PUT: input title, rating, club name - adds review to current user's reviews
+# DELETE: input review id - deletes review from current user's reviews
+@blueprint.route("/api/users/<string:username>/reviews", methods=["GET", "PUT", "DELETE"])
+def access_user_reviews(username):
+    user = User.query.filter_by(username=username).first()
+    if request.method == "GET":
+        if user:
+            reviews = [{
+                "id": review.get_review_id(),
+                "title": review.get_review_title(), 
+                "rating": review.get_review_rating(), 
+                "description": review.get_review_description(), 
+                "user": review.get_review_user(), 
+                "club": review.get_review_club()
+            } for review in user.get_reviews()]
+            return jsonify({"reviews": reviews})
+    elif request.method == "PUT":
+        review = request.get_json()
+        required_fields = ["title", "rating", "club_name"]
+        for field in required_fields:
+            if field not in review:
+                abort(400, f"Missing required field: {field}")
+        club = Club.query.filter_by(name=review["club_name"]).first()
+        if not club:
+            abort(400, "Invalid club name")
+        get_rating(review["rating"])
+        new_review = Review(title=review["title"],rating=review["rating"],review_user=user,review_club=club)
+        if "description" in required_fields:
+            new_review.set_review_description(review["description"])
+        db.session.add(new_review)
+        club.add_rating(new_review.rating)
+        db.session.flush()
+        emit("review_created", review=new_review.id, club=new_review.club, user=new_review.user)
+        db.session.commit()
+        return jsonify({"message": "Review added to user reviews"})
+    elif request.method == "DELETE":
+        review_data = request.get_json()
+        if "id" in review_data:
+            review = Review.query.filter_by(id=review_data["id"]).first()
+            if review and (review.get_review_user() == user.get_username()):
+                emit("review_deleted", review=review.id, club=review.club, user=review.user)
+                review.review_club.remove_rating(review.rating)
+                db.session.delete(review)
+            else:
+                abort(400, "Invalid review id")
+            db.session.commit()
+            return jsonify({"message": "Review removed from user reviews"})
+
+# GET: optional cursor, limit, fields - returns json with one page of reviews and the cursor of the next page
+# PUT: input title, rating, username, club name - adds review to database
+@blueprint.route("/api/reviews", methods=["GET", "PUT"])
+def access_all_reviews():
+    if request.method == "GET":
+        fields = get_fields(REVIEW_FIELDS)
+        reviews, next_cursor = paginate(Review.query, Review.id)
+        return jsonify({"reviews": serialize_reviews(reviews, fields=fields), "next_cursor": next_cursor})
+    elif request.method == "PUT":
+        review = request.get_json()
+
+        required_fields = ["title", "rating", "username", "club_name"]
+        for field in required_fields:
+            if field not in review:
+                abort(400, f"Missing required field: {field}")
+
+        user = User.query.filter_by(username=review["username"]).first()
+        if not user:
+            abort(400, "Invalid username")
+        club = Club.query.filter_by(name=review["club_name"]).first()
+        if not club:
+            abort(400, "Invalid club name")
+        get_rating(review["rating"])
+        new_review = Review(title=review["title"],rating=review["rating"],review_user=user,review_club=club)
+        if "description" in required_fields:
+            new_review.set_review_description(review["description"])
+        db.session.add(new_review)
+        club.add_rating(new_review.rating)
+        db.session.flush()
+        emit("review_created", review=new_review.id, club=new_review.club, user=new_review.user)
+        db.session.commit()
+        return jsonify({"message": "Review added"})
+
+# GET: no input - returns json with current review information 
+# PATCH: input title, rating, description - updates current review information
+# DELETE: no input - deletes current review from database
+@blueprint.route("/api/reviews/<int:review_id>", methods=["GET", "PATCH", "DELETE"])
+def access_review(review_id):
+    review = Review.query.filter_by(id=review_id).first()
+    if request.method == "GET":
+        if review:
+            return jsonify(serialize_reviews([review])[0])
+    elif request.method == "PATCH":
+        new_review = request.get_json()
+        if "title" in new_review:
+            review.title = new_review["title"]
+        if "rating" in new_review:
+            get_rating(new_review["rating"])
+            review.review_club.remove_rating(review.rating)
+            review.review_club.add_rating(new_review["rating"])
+            review.rating = new_review["rating"]
+        if "description" in new_review:
+            review.description = new_review["description"]
+        emit("review_updated", review=review.id, club=review.club, user=review.user)
+        db.session.commit()
+        return jsonify({"message": "Review modified"})
+    elif request.method == "DELETE":
+        if review:
+            emit("review_deleted", review=review.id, club=review.club, user=review.user)
+            review.review_club.remove_rating(review.rating)
+            db.session.delete(review)
+            db.session.commit()
+            return jsonify({"message": "Review deleted"})
+        else:
+            abort(400, "Review does not exist")
+
+# GET: optional cursor, limit, fields - returns json with one page of tags and the cursor of the next page
+# PUT: input tag name - adds tag to database
+@blueprint.route("/api/tags", methods=["GET", "PUT"])
+@cached(lambda: ["tags"])
+def access_all_tags():
+    if request.method == "GET":
+        fields = get_fields(TAG_FIELDS)
+        if current_app.config["CATALOG_ENABLED"]:
+            tags, next_cursor = catalog.tag_page(fields)
+            return jsonify({"tags": tags, "next_cursor": next_cursor})
+        tags, next_cursor = paginate(Tag.query, Tag.name)
+        return jsonify({"tags": serialize_tags(tags, fields=fields), "next_cursor": next_cursor})
+    elif request.method == "PUT":
+        tag = request.get_json()
+
+        required_fields = ["name"]
+        for field in required_fields:
+            if field not in tag:
+                abort(400, f"Missing required field: {field}")
+
+        new_tag = Tag(name=tag["name"])
+        db.session.add(new_tag)
+        emit("tag_created", tag=new_tag.name)
+        db.session.commit()
+        return jsonify({"message": "Tag added"})
+
+# GET: no input - returns json with current tag information 
+# PATCH: input name - updates current tag information
+# DELETE: no input - deletes current tag from database
+@blueprint.route("/api/tags/<string:tag_name>", methods=["GET", "PATCH", "DELETE"])
+@cached(lambda tag_name: [tag_key(tag_name)])
+def access_tag(tag_name):
+    if request.method == "GET" and current_app.config["CATALOG_ENABLED"]:
+        tag = catalog.tag(tag_name)
+        if tag:
+            return jsonify(tag)
+    tag = Tag.query.filter_by(name=tag_name).first()
+    if request.method == "GET":
+        if tag:
+            return jsonify(serialize_tags([tag])[0])
+    elif request.method == "PATCH":
+        new_tag = request.get_json()
+        old_name = tag.name
+        tagged_clubs = [club.get_club_name() for club in tag.get_tagged_clubs()]
+        if "name" in new_tag and new_tag["name"] != old_name:
+            if Tag.query.filter_by(name=new_tag["name"]).first():
+                abort(400, "Tag already exists")
+            tag.rename(new_tag["name"])
+        emit("tag_updated", tag=tag.name, old_name=old_name, clubs=tagged_clubs)
+        db.session.commit()
+        return jsonify({"message": "Tag modified"})
+    elif request.method == "DELETE":
+        if tag:
+            emit("tag_deleted", tag=tag.name, clubs=[club.get_club_name() for club in tag.get_tagged_clubs()])
+            db.session.delete(tag)
+            db.session.commit()
+            return jsonify({"message": "Tag deleted"})
+        else:
+            abort(400, "Tag does not exist")
+
+# GET: optional format (json or ndjson), fields - streams every club, user, review, or tag
+# unlike the paginated routes above, the whole table is sent in one response without being held in memory
+# (gzip-compressed on the fly when the client accepts it)
+@blueprint.route("/api/export/<string:collection>", methods=["GET"])
+def export_collection(collection):
+    if collection not in EXPORTS:
+        abort(404)
+    export_format = request.args.get("format", "json")
+    if export_format not in FORMATS:
+        abort(400, f"Invalid format: {export_format}")
+    fields = get_fields(EXPORTS[collection][2])
+    return export_response(collection, export_format, fields)
+
+# GET: optional since (a sequence number, default 0), limit - returns json with the changes committed after since,
+# oldest first, the since of the next batch, and the latest sequence number (see changes.py)
+# a since past the latest entry (e.g. one saved before the database was rebuilt) gets 410 with the latest number -
+# the client reloads the lists and continues from there
+@blueprint.route("/api/changes", methods=["GET"])
+def access_changes():
+    since = get_number_arg("since", 0)
+    limit = get_page_size()
+    latest = get_latest_seq()
+    if since > latest:
+        return jsonify({"message": "Unknown sequence number, reload and continue from latest", "latest": latest}), 410
+    changes, more = get_changes(since, limit)
+    return jsonify({"changes": changes, "next_since": changes[-1]["seq"] if changes else since,
+                    "latest": latest, "more": more})
+
+# GET: no input - returns json with response cache hit/miss statistics
+@blueprint.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(response_cache.get_stats())
+
+# GET: no input - returns per-route latency, SQL, and response size metrics in Prometheus text format
+# (404 unless METRICS_ENABLED is set)
+@blueprint.route("/metrics", methods=["GET"])
+def access_metrics():
+    if not current_app.config["METRICS_ENABLED"]:
+        abort(404)
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+# GET: no input - returns json with commit and rollback counts per route
+@blueprint.route("/api/commits/stats", methods=["GET"])
+def commit_stats():
+    return jsonify(uow.get_stats())
+
+# GET: no input - returns json with the number of clubs and tags in the catalog and the bytes it takes (see catalog.py)
+@blueprint.route("/api/catalog/stats", methods=["GET"])
+def catalog_stats():
+    if not current_app.config["CATALOG_ENABLED"]:
+        abort(400, "The catalog is not enabled")
+    return jsonify(catalog.footprint())
+
+# GET: optional limit, min_reviews, fields - returns json with the highest rated clubs with the current tag, best first
+@blueprint.route("/api/tags/<string:tag_name>/top-rated", methods=["GET"])
+@cached(lambda tag_name: ["clubs", tag_key(tag_name)])
+def top_rated_tag_clubs(tag_name):
+    fields = get_fields(CLUB_FIELDS)
+    clubs = Club.top_rated(get_page_size(), get_number_arg("min_reviews", 1), tag_name=tag_name)
+    return jsonify({"clubs": serialize_clubs(clubs, fields=fields)})
+
+# CLI: flask --app app rebuild-search-index - creates (if needed) and refills the club search index
+@blueprint.cli.command("rebuild-search-index")
+def rebuild_search_index():
+    club_search.create()
+    db.session.commit()
+    print("Search index rebuilt")
+
+# CLI: flask --app app migrate-schema - converts an older database to the current association table schema in place
+@blueprint.cli.command("migrate-schema")
+def migrate_schema_command():
+    migrated = schema.migrate_schema()
+    print(f"Migrated: {', '.join(migrated)}" if migrated else "Schema already up to date")
+    recompute_counters()
+    db.session.commit()
+
+# CLI: flask --app app check-query-plans - fails unless every association/review lookup uses an index
+@blueprint.cli.command("check-query-plans")
+def check_query_plans_command():
+    failed = False
+    for name, plan, uses_index in schema.check_query_plans():
+        print(f"{'ok  ' if uses_index else 'FAIL'} {name}: {plan}")
+        failed = failed or not uses_index
+    if failed:
+        raise SystemExit(1)
+
+# CLI: flask --app app compact-changes - deletes old change feed entries that newer entries supersede
+@blueprint.cli.command("compact-changes")
+@click.option("--older-than", type=int, default=None,
+              help="only entries older than this many seconds (default CHANGES_COMPACT_AFTER)")
+def compact_changes_command(older_than):
+    compacted = compact_changes(older_than)
+    db.session.commit()
+    print(f"Compacted {compacted} changes")
+
+# CLI: flask --app app repair-counters - recomputes favorite and tag counts (run after bulk imports)
+@blueprint.cli.command("repair-counters")
+def repair_counters():
+    recompute_counters()
+    db.session.commit()
+    print("Counters recomputed")
+
+# CLI: flask --app app check-catalog - compares the club catalog with the database, and reports its size
+@blueprint.cli.command("check-catalog")
+def check_catalog_command():
+    problems = catalog.check()
+    for problem in problems:
+        print(f"FAIL {problem}")
+    footprint = catalog.footprint()
+    print(f"{footprint['clubs']} clubs, {footprint['tags']} tags, {footprint['bytes'] / 2**20:.1f} MiB")
+    if problems:
+        raise SystemExit(1)
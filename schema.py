@@ -0,0 +1,102 @@
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+
+from extensions import db
+from models import Club, User, Review, Tag, Change, tags, members, officers, favorites
+
+ASSOCIATION_TABLES = (tags, members, officers, favorites)
+MODEL_TABLES = (Club.__table__, User.__table__, Review.__table__, Tag.__table__)
+# tables added since the first release - created if missing
+ADDED_TABLES = (Change.__table__,)
+
+# every lookup the routes run against the association and review tables, from both directions
+# each must be answered by an index (or the primary key) - a full-table SCAN or a sort (temp b-tree) fails the check
+INDEXED_LOOKUPS = [
+    ("tags by tag", "SELECT club_name FROM tags WHERE tag_name = 'x'"),
+    ("tags by club", "SELECT tag_name FROM tags WHERE club_name = 'x'"),
+    ("members by user", "SELECT club_name FROM members WHERE user_username = 'x'"),
+    ("members by club", "SELECT user_username FROM members WHERE club_name = 'x'"),
+    ("officers by user", "SELECT club_name FROM officers WHERE user_username = 'x'"),
+    ("officers by club", "SELECT user_username FROM officers WHERE club_name = 'x'"),
+    ("favorites by user", "SELECT club_name FROM favorites WHERE user_username = 'x'"),
+    ("favorites by club", "SELECT user_username FROM favorites WHERE club_name = 'x'"),
+    ("reviews by user", "SELECT id FROM review WHERE user = 'x'"),
+    ("reviews by club", "SELECT id FROM review WHERE club = 'x'"),
+    ("top rated clubs by tag", "SELECT club.name FROM tags JOIN club ON club.name = tags.club_name "
+        "WHERE tags.tag_name = 'x' AND tags.rating_mean IS NOT NULL AND club.review_count >= 1 "
+        "ORDER BY tags.rating_mean DESC, tags.club_name LIMIT 10"),
+]
+
+def _columns(cursor, table_name):
+    return [row[1] for row in cursor.execute(f"PRAGMA table_info({table_name})").fetchall()]
+
+# Schema Migration - converts a database created before the association tables had surrogate ids, in place
+# each old table is renamed, recreated from the model definition (with its indexes), refilled, and dropped;
+# model columns added since the database was created (e.g. the club rating aggregates) are added with ALTER TABLE,
+# missing tables (e.g. the change feed) are created, and missing model indexes are created. everything runs in one transaction, so a failure leaves the old schema intact
+# returns the names of the tables and columns that were converted or added
+def migrate_schema():
+    dialect = db.engine.dialect
+    raw_connection = db.engine.raw_connection()
+    driver_connection = raw_connection.driver_connection
+    isolation_level = driver_connection.isolation_level
+    try:
+        # take manual control of the transaction - pysqlite would otherwise autocommit each DDL statement
+        driver_connection.isolation_level = None
+        cursor = driver_connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        migrated = []
+        try:
+            for table in ASSOCIATION_TABLES:
+                columns = _columns(cursor, table.name)
+                if not columns or "id" in columns:
+                    continue
+                # columns added since the old table was created (e.g. tags.rating_mean) start out empty
+                value_columns = [column.name for column in table.columns
+                    if column.name != "id" and column.name in columns]
+                column_list = ", ".join(value_columns)
+                cursor.execute(f"ALTER TABLE {table.name} RENAME TO {table.name}_old")
+                cursor.execute(str(CreateTable(table).compile(dialect=dialect)))
+                for index in table.indexes:
+                    cursor.execute(str(CreateIndex(index).compile(dialect=dialect)))
+                cursor.execute(
+                    f"INSERT OR IGNORE INTO {table.name} ({column_list}) SELECT {column_list} FROM {table.name}_old")
+                cursor.execute(f"DROP TABLE {table.name}_old")
+                migrated.append(table.name)
+            for table in MODEL_TABLES + ASSOCIATION_TABLES:
+                columns = _columns(cursor, table.name)
+                for column in table.columns:
+                    if columns and column.name not in columns:
+                        cursor.execute(f"ALTER TABLE {table.name} ADD COLUMN "
+                            f"{CreateColumn(column).compile(dialect=dialect)}")
+                        migrated.append(f"{table.name}.{column.name}")
+                for index in table.indexes:
+                    cursor.execute(str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect)))
+            for table in ADDED_TABLES:
+                if not _columns(cursor, table.name):
+                    cursor.execute(str(CreateTable(table).compile(dialect=dialect)))
+                    migrated.append(table.name)
+                for index in table.indexes:
+                    cursor.execute(str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect)))
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        return migrated
+    finally:
+        driver_connection.isolation_level = isolation_level
+        raw_connection.close()
+
+# Query Plan Check - runs EXPLAIN QUERY PLAN on every lookup in INDEXED_LOOKUPS
+# a lookup passes when every table access is an index SEARCH (a SCAN, even of a covering index, reads every row) and
+# its rows come out of the index in order (no TEMP B-TREE sort)
+# returns a list of (lookup, plan, uses_index) tuples
+def check_query_plans():
+    results = []
+    for name, query in INDEXED_LOOKUPS:
+        details = [row[-1] for row in db.session.execute(db.text(f"EXPLAIN QUERY PLAN {query}")).all()]
+        uses_index = all(
+            detail.startswith("SEARCH") and ("INDEX" in detail or "PRIMARY KEY" in detail)
+            for detail in details if detail.startswith(("SCAN", "SEARCH")))
+        uses_index = uses_index and not any("TEMP B-TREE" in detail for detail in details)
+        results.append((name, "; ".join(details), uses_index))
+    return results
@@ -0,0 +1,243 @@
+import bisect
+import math
+import re
+from collections import defaultdict
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from extensions import db, app_local
+from events import subscribe
+from indexes import REFRESH_LIMIT, MemoryIndex
+from models import Club
+from serializers import load_club_associations
+
+# events that change the indexed text of a club - name, code, description, or tags
+CLUB_EVENTS = {"club_created", "club_updated", "club_deleted", "tag_added", "tag_removed"}
+
+# relevance weight of each indexed column - a match in the club name counts ten times as much as one in the description
+FIELD_WEIGHTS = {"name": 10.0, "code": 5.0, "description": 1.0, "tags": 3.0}
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# splits text into lowercase word tokens (the same rule FTS5's unicode61 tokenizer uses)
+def tokenize(value):
+    return _TOKEN.findall(value.lower())
+
+# loads the indexed text of every club (or of the given clubs) as (name, code, description, tags) tuples
+def club_documents(clubs=None):
+    if clubs is None:
+        clubs = Club.query.all()
+        club_tags = load_club_associations(None, fields={"tags"})["tags"]
+    else:
+        club_tags = load_club_associations([club.name for club in clubs], fields={"tags"})["tags"]
+    return [(club.name, club.code, club.description, " ".join(club_tags.get(club.name, []))) for club in clubs]
+
+# Search Index (SQLite FTS5) - stored in the database next to the clubs, so index updates commit with the route's transaction
+# club_search_docs maps each club name to the FTS5 rowid so that updates and deletes are indexed lookups
+class FTS5SearchIndex:
+    def __init__(self):
+        self.dirty = set()          # clubs whose tags were renamed or deleted since the last search
+
+    def create(self):
+        db.session.execute(text(
+            "CREATE TABLE IF NOT EXISTS club_search_docs ("
+            "docid INTEGER PRIMARY KEY AUTOINCREMENT, club_name VARCHAR(180) NOT NULL UNIQUE)"))
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS club_search USING fts5("
+            "name, code, description, tags, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"))
+
+    # refills the index in two INSERT ... SELECT statements, so no club rows pass through Python
+    def rebuild(self):
+        db.session.execute(text("DELETE FROM club_search"))
+        db.session.execute(text("DELETE FROM club_search_docs"))
+        db.session.execute(text("INSERT INTO club_search_docs (club_name) SELECT name FROM club"))
+        db.session.execute(text(
+            "INSERT INTO club_search (rowid, name, code, description, tags) "
+            "SELECT d.docid, c.name, c.code, c.description, COALESCE(t.tag_names, '') "
+            "FROM club c JOIN club_search_docs d ON d.club_name = c.name "
+            "LEFT JOIN (SELECT club_name, group_concat(tag_name, ' ') AS tag_names FROM tags GROUP BY club_name) t "
+            "ON t.club_name = c.name"))
+
+    def index_club(self, club):
+        self.remove_club(club.name)
+        name, code, description, tag_names = club_documents([club])[0]
+        docid = db.session.execute(text("INSERT INTO club_search_docs (club_name) VALUES (:name)"),
+            {"name": name}).lastrowid
+        db.session.execute(text(
+            "INSERT INTO club_search (rowid, name, code, description, tags) "
+            "VALUES (:docid, :name, :code, :description, :tags)"),
+            {"docid": docid, "name": name, "code": code, "description": description, "tags": tag_names})
+
+    def remove_club(self, club_name):
+        docid = db.session.execute(text("SELECT docid FROM club_search_docs WHERE club_name = :name"),
+            {"name": club_name}).scalar()
+        if docid is not None:
+            db.session.execute(text("DELETE FROM club_search WHERE rowid = :docid"), {"docid": docid})
+            db.session.execute(text("DELETE FROM club_search_docs WHERE docid = :docid"), {"docid": docid})
+
+    # the club routes update the FTS5 tables in their own transaction (index_club, remove_club); a tag rename or delete
+    # changes the indexed tags of every club that had the tag, so those clubs are re-indexed before the next search
+    def apply(self, name, payload):
+        if name in ("tag_updated", "tag_deleted"):
+            self.dirty.update(payload["clubs"])
+
+    def _refresh(self):
+        if len(self.dirty) > REFRESH_LIMIT:
+            self.dirty = set()
+            self.rebuild()
+        else:
+            club_names, self.dirty = list(self.dirty), set()
+            for club in Club.query.filter(Club.name.in_(club_names)).all():
+                self.index_club(club)
+        db.session.commit()
+
+    # every query word is matched as a prefix, and all of them must match; results are ranked by weighted bm25
+    def search(self, query, limit, offset=0):
+        if self.dirty:
+            self._refresh()
+        words = tokenize(query)
+        if not words:
+            return []
+        match = " ".join(f'"{word}"*' for word in words)
+        weights = ", ".join(str(FIELD_WEIGHTS[field]) for field in ("name", "code", "description", "tags"))
+        rows = db.session.execute(text(
+            f"SELECT d.club_name FROM club_search JOIN club_search_docs d ON d.docid = club_search.rowid "
+            f"WHERE club_search MATCH :match ORDER BY bm25(club_search, {weights}) LIMIT :limit OFFSET :offset"),
+            {"match": match, "limit": limit, "offset": offset})
+        return [row[0] for row in rows]
+
+# Search Index (in-process fallback) - an inverted index of token -> {club name: weighted term frequency}
+# used when SQLite was built without FTS5 or the database has no club_search table; it follows the committed write
+# events instead of the routes' index_club and remove_club calls, so a rolled back write never reaches it
+class InvertedSearchIndex(MemoryIndex):
+    def _reset(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.vocabulary = []
+        self.dirty = set()
+
+    def create(self):
+        pass
+
+    def rebuild(self):
+        with self.lock:
+            self._load()
+
+    def _build(self):
+        for document in club_documents():
+            self._add(document, keep_sorted=False)
+        self.vocabulary = sorted(self.postings)
+
+    def _add(self, document, keep_sorted=True):
+        name = document[0]
+        weights = defaultdict(float)
+        for field, value in zip(("name", "code", "description", "tags"), document):
+            for token in tokenize(value):
+                weights[token] += FIELD_WEIGHTS[field]
+        for token, weight in weights.items():
+            if keep_sorted and token not in self.postings:
+                bisect.insort(self.vocabulary, token)
+            self.postings[token][name] = weight
+        self.documents[name] = list(weights)
+
+    def index_club(self, club):
+        pass
+
+    def remove_club(self, club_name):
+        pass
+
+    def _apply(self, name, payload):
+        if name in CLUB_EVENTS:
+            self.dirty.update((payload["club"], payload.get("old_name", payload["club"])))
+        elif name in ("tag_updated", "tag_deleted"):
+            self.dirty.update(payload["clubs"])
+
+    # re-reads the changed clubs - the ones that no longer exist are only removed
+    def _refresh(self):
+        club_names, self.dirty = list(self.dirty), set()
+        for club_name in club_names:
+            self._remove(club_name)
+        for document in club_documents(Club.query.filter(Club.name.in_(club_names)).all()):
+            self._add(document)
+
+    def _remove(self, club_name):
+        for token in self.documents.pop(club_name, []):
+            posting = self.postings[token]
+            posting.pop(club_name, None)
+            if not posting:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+
+    # scores every vocabulary token starting with each query word
+    def _prefix_scores(self, word):
+        scores = defaultdict(float)
+        total = len(self.documents) or 1
+        position = bisect.bisect_left(self.vocabulary, word)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(word):
+            token = self.vocabulary[position]
+            position += 1
+            posting = self.postings[token]
+            idf = math.log(1 + total / len(posting))
+            for club_name, weight in posting.items():
+                scores[club_name] += weight * idf
+        return scores
+
+    def search(self, query, limit, offset=0):
+        words = tokenize(query)
+        if not words:
+            return []
+        with self.reading():
+            scores = None
+            for word in words:
+                word_scores = self._prefix_scores(word)
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {name: score + word_scores[name] for name, score in scores.items() if name in word_scores}
+                if not scores:
+                    return []
+        ranked = sorted(scores, key=lambda name: (-scores[name], name))
+        return ranked[offset:offset + limit]
+
+# Club Search - picks the FTS5 index when the database has one, otherwise the in-process fallback
+class ClubSearch:
+    def __init__(self):
+        self.backend = None
+
+    def get_backend(self):
+        if self.backend is None:
+            exists = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE name = 'club_search'")).first()
+            self.backend = FTS5SearchIndex() if exists else InvertedSearchIndex()
+        return self.backend
+
+    # creates the FTS5 tables (falls back to the in-process index if SQLite has no FTS5) and fills them
+    # the DDL runs in a savepoint, so a failure rolls back only the savepoint and keeps what the caller has staged
+    def create(self):
+        try:
+            with db.session.begin_nested():
+                FTS5SearchIndex().create()
+            self.backend = FTS5SearchIndex()
+        except OperationalError:
+            self.backend = InvertedSearchIndex()
+        self.backend.rebuild()
+
+    def rebuild(self):
+        self.get_backend().rebuild()
+
+    def index_club(self, club):
+        self.get_backend().index_club(club)
+
+    def remove_club(self, club_name):
+        self.get_backend().remove_club(club_name)
+
+    def search(self, query, limit, offset=0):
+        return self.get_backend().search(query, limit, offset)
+
+    def apply(self, name, payload):
+        if self.backend is not None:
+            self.backend.apply(name, payload)
+
+club_search = app_local("club_search", ClubSearch)
+subscribe(lambda name, payload: club_search.apply(name, payload))
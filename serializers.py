@@ -0,0 +1,183 @@
+from collections import defaultdict
+
+from sqlalchemy import select
+
+from extensions import db
+from models import Review, User, tags, members, officers, favorites, parse_histogram
+
+# SQLite limits the number of bound parameters per statement, so IN-lists are sent in chunks of this size
+IN_CHUNK_SIZE = 500
+
+_full_name = User.first_name + " " + User.last_name
+
+# plain column fields of each model - field name -> Python expression reading it from obj (a model instance or a
+# row with the same column names), the same value the model's getter returns (e.g. Club.get_favorite_count)
+# the expressions are compiled into one function per model and field set, see compile_columns
+CLUB_COLUMNS = {
+    "code": "obj.code",
+    "name": "obj.name",
+    "description": "obj.description",
+    "favorite_count": "obj.favorite_count or 0",
+    "review_count": "obj.review_count or 0",
+    "rating_mean": "obj.rating_mean",
+    "rating_histogram": "parse_histogram(obj.rating_histogram)",
+}
+USER_COLUMNS = {
+    "username": "obj.username",
+    "email": "obj.email",
+    "first_name": "obj.first_name",
+    "last_name": "obj.last_name",
+}
+REVIEW_COLUMNS = {
+    "id": "obj.id",
+    "title": "obj.title",
+    "rating": "obj.rating",
+    "description": "obj.description or ''",
+    "user": "obj.user",
+    "club": "obj.club",
+}
+TAG_COLUMNS = {
+    "name": "obj.name",
+    "tagged_clubs_count": "obj.club_count or 0",
+}
+# names the column expressions may use
+COLUMN_GLOBALS = {"parse_histogram": parse_histogram}
+
+# list fields of each model - field name -> (query selecting (owner key, value) rows, owner key column)
+CLUB_ASSOCIATIONS = {
+    "tags": (select(tags.c.club_name, tags.c.tag_name), tags.c.club_name),
+    "members": (select(members.c.club_name, _full_name)
+        .join(User, User.username == members.c.user_username), members.c.club_name),
+    "officers": (select(officers.c.club_name, _full_name)
+        .join(User, User.username == officers.c.user_username), officers.c.club_name),
+    "reviews": (select(Review.club, Review.id), Review.club),
+}
+USER_ASSOCIATIONS = {
+    "favorites": (select(favorites.c.user_username, favorites.c.club_name), favorites.c.user_username),
+    "membership": (select(members.c.user_username, members.c.club_name), members.c.user_username),
+    "officership": (select(officers.c.user_username, officers.c.club_name), officers.c.user_username),
+    "reviews": (select(Review.user, Review.id), Review.user),
+}
+TAG_ASSOCIATIONS = {
+    "tagged_clubs": (select(tags.c.tag_name, tags.c.club_name), tags.c.tag_name),
+}
+
+CLUB_FIELDS = tuple(CLUB_COLUMNS) + tuple(CLUB_ASSOCIATIONS)
+USER_FIELDS = tuple(USER_COLUMNS) + tuple(USER_ASSOCIATIONS)
+REVIEW_FIELDS = tuple(REVIEW_COLUMNS)
+TAG_FIELDS = tuple(TAG_COLUMNS) + tuple(TAG_ASSOCIATIONS)
+
+# yields successive slices of the given list of keys
+def _chunks(keys):
+    for start in range(0, len(keys), IN_CHUNK_SIZE):
+        yield keys[start:start + IN_CHUNK_SIZE]
+
+# runs the statement once (no filter) or once per chunk of keys, and returns all rows
+def _fetch(statement, key_column, keys):
+    if keys is None:
+        return db.session.execute(statement).all()
+    rows = []
+    for chunk in _chunks(keys):
+        rows.extend(db.session.execute(statement.where(key_column.in_(chunk))).all())
+    return rows
+
+# groups (key, value) rows into a dict of key -> list of values
+def _group(rows):
+    grouped = defaultdict(list)
+    for key, value in rows:
+        grouped[key].append(value)
+    return grouped
+
+# loads the requested list fields for the given keys with one query per field (per chunk)
+# pass keys=None to load the field for every row of the table, and fields=None to load every field
+def load_associations(associations, keys=None, fields=None):
+    if keys is not None:
+        keys = list(keys)
+    return {
+        field: _group(_fetch(statement, key_column, keys))
+        for field, (statement, key_column) in associations.items()
+        if fields is None or field in fields
+    }
+
+# Club Associations - tags, member names, officer names, and review ids keyed by club name
+def load_club_associations(club_names=None, fields=None):
+    return load_associations(CLUB_ASSOCIATIONS, club_names, fields)
+
+# Precompiled Serializers - the column expressions of the requested fields are compiled into a single function that
+# builds the whole dict in one expression, e.g. for ?fields=name,favorite_count
+#   def serialize(obj):
+#       return {"name": obj.name, "favorite_count": obj.favorite_count or 0}
+# so a list response costs one call per object instead of a getter call and a field check per field
+# compiled once per (columns, field set) - the field sets are validated against the model's fields, so few exist
+_compiled = {}
+
+def compile_columns(columns, fields=None):
+    selected = tuple(field for field in columns if fields is None or field in fields)
+    cache_key = (id(columns), selected)
+    serialize = _compiled.get(cache_key)
+    if serialize is None:
+        items = ", ".join(f"{field!r}: {columns[field]}" for field in selected)
+        namespace = dict(COLUMN_GLOBALS)
+        exec(f"def serialize(obj):\n    return {{{items}}}\n", namespace)
+        serialize = _compiled[cache_key] = namespace["serialize"]
+    return serialize
+
+# builds one serialized object from its compiled columns and preloaded list fields
+def _serialize(obj, key, columns, associations, fields):
+    data = compile_columns(columns, fields)(obj)
+    for field, grouped in associations.items():
+        data[field] = grouped.get(key, [])
+    return data
+
+# serializes a list of objects - key_column names the attribute the list fields are grouped by
+def _serialize_list(objs, key_column, columns, associations, fields):
+    serialize = compile_columns(columns, fields)
+    if not associations:
+        return [serialize(obj) for obj in objs]
+    data = []
+    for obj in objs:
+        item = serialize(obj)
+        key = getattr(obj, key_column)
+        for field, grouped in associations.items():
+            item[field] = grouped.get(key, [])
+        data.append(item)
+    return data
+
+# serializes one club using associations preloaded by load_club_associations
+def serialize_club(club, associations, fields=None):
+    return _serialize(club, club.name, CLUB_COLUMNS, associations, fields)
+
+# serializes a list of clubs with a fixed number of queries
+# set all_clubs=True when the list holds every club, so the association queries skip the IN filter
+# fields limits the output (and the queries run) to the given field names
+def serialize_clubs(clubs, all_clubs=False, fields=None):
+    clubs = list(clubs)
+    if not clubs:
+        return []
+    club_names = None if all_clubs else [club.name for club in clubs]
+    associations = load_club_associations(club_names, fields)
+    return _serialize_list(clubs, "name", CLUB_COLUMNS, associations, fields)
+
+# serializes one user using associations preloaded by load_associations(USER_ASSOCIATIONS, ...)
+def serialize_user(user, associations, fields=None):
+    return _serialize(user, user.username, USER_COLUMNS, associations, fields)
+
+# serializes a list of users with a fixed number of queries
+def serialize_users(users, fields=None):
+    users = list(users)
+    if not users:
+        return []
+    associations = load_associations(USER_ASSOCIATIONS, [user.username for user in users], fields)
+    return _serialize_list(users, "username", USER_COLUMNS, associations, fields)
+
+# serializes a list of tags with a fixed number of queries
+def serialize_tags(tag_list, fields=None):
+    tag_list = list(tag_list)
+    if not tag_list:
+        return []
+    associations = load_associations(TAG_ASSOCIATIONS, [tag.name for tag in tag_list], fields)
+    return _serialize_list(tag_list, "name", TAG_COLUMNS, associations, fields)
+
+# serializes a list of reviews (reviews have no list fields, so no extra queries are run)
+def serialize_reviews(reviews, fields=None):
+    return _serialize_list(reviews, "id", REVIEW_COLUMNS, {}, fields)
@@ -0,0 +1,82 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Storage Profiles - SQLite pragmas run on every new connection, plus SQLAlchemy engine (pool) options
+# "production": write-ahead logging so readers never block behind a writer, fsync only at checkpoints
+#   (synchronous=NORMAL is durable against crashes of the app; a power loss can drop the last few commits),
+#   memory-mapped reads, a 64MB page cache, and a busy timeout so concurrent writers wait instead of failing
+# "default": SQLite's own defaults (rollback journal, fsync on every commit) - useful as a baseline
+# journal_mode is stored in the database file, so switching profiles switches the journal mode on the next connection
+STORAGE_PROFILES = {
+    "production": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 256 * 1024 * 1024,
+            "cache_size": -64 * 1024,
+            "busy_timeout": 5000,
+            "temp_store": "MEMORY",
+        },
+        "engine_options": {
+            "pool_size": 16,
+            "max_overflow": 16,
+            "pool_timeout": 30,
+            "connect_args": {"check_same_thread": False, "timeout": 5},
+        },
+    },
+    "default": {
+        "pragmas": {
+            "journal_mode": "DELETE",
+            "synchronous": "FULL",
+        },
+        "engine_options": {},
+    },
+}
+
+# profile used when STORAGE_PROFILE isn't set in the config (override with the CLUBREVIEW_STORAGE_PROFILE environment variable)
+DEFAULT_STORAGE_PROFILE = os.environ.get("CLUBREVIEW_STORAGE_PROFILE", "production")
+
+# pool sizing only applies to file databases - an in-memory SQLite database lives in one connection, so SQLAlchemy
+# gives it a StaticPool, which takes none of these options
+POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout")
+
+def get_profile(name):
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile: {name} (expected one of {', '.join(STORAGE_PROFILES)})")
+    return STORAGE_PROFILES[name]
+
+def is_memory_database(url):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and (
+        url.database in (None, "", ":memory:") or url.query.get("mode") == "memory")
+
+# the engine options of a storage profile for the given database URL (without the pool options for in-memory SQLite)
+def get_engine_options(profile_name, url):
+    options = dict(get_profile(profile_name)["engine_options"])
+    if is_memory_database(url):
+        for name in POOL_OPTIONS:
+            options.pop(name, None)
+    return options
+
+# sets the engine options of the app's storage profile - must run before SQLAlchemy(app) creates the engine
+def configure_storage(app):
+    app.config.setdefault("STORAGE_PROFILE", DEFAULT_STORAGE_PROFILE)
+    options = get_engine_options(app.config["STORAGE_PROFILE"], app.config["SQLALCHEMY_DATABASE_URI"])
+    options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+# runs the profile's pragmas on every connection the engine opens
+def install_pragmas(engine, profile_name):
+    pragmas = get_profile(profile_name)["pragmas"]
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    event.listen(engine, "connect", set_pragmas)
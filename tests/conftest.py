@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from app import create_app
+from bootstrap import create_user, load_data
+from extensions import db
+from models import Club, User
+
+CLUBS_JSON = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "clubs.json")
+
+# Test App - every test gets its own app on a new SQLite file seeded like bootstrap.py (josh plus clubs.json), so
+# caches, indexes, and the change feed start empty (the per-app state of extensions.app_local)
+# the passwords are hashed with the cheapest work factor; config overrides the rest of the defaults
+def make_app(database_path, config=None):
+    return create_app(dict({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{database_path}", "BCRYPT_LOG_ROUNDS": 4},
+        **(config or {})))
+
+def seed(app, usernames=()):
+    with app.app_context():
+        db.create_all()
+        create_user()
+        load_data(CLUBS_JSON)
+        for username in usernames:
+            user = User(username=username, email=f"{username}@upenn.edu", first_name=username, last_name="Test")
+            user.set_password("awooga")
+            db.session.add(user)
+        db.session.commit()
+
+# users added next to josh, so concurrent writers never write the same association row
+USERNAMES = [f"user{number}" for number in range(8)]
+
+@pytest.fixture
+def database_path(tmp_path):
+    return tmp_path / "clubreview.db"
+
+@pytest.fixture
+def app(database_path):
+    app = make_app(database_path)
+    seed(app, USERNAMES)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def club_names(app):
+    with app.app_context():
+        return sorted(db.session.execute(db.select(Club.name)).scalars())
@@ -0,0 +1,88 @@
+import pytest
+
+from cache import response_cache
+from tests.conftest import make_app
+
+def get_stats(app):
+    with app.app_context():
+        return response_cache.get_stats()
+
+def test_matching_etag_gets_not_modified(app, client):
+    response = client.get("/api/clubs/Penn Memes Club")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    before = get_stats(app)
+
+    response = client.get("/api/clubs/Penn Memes Club", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.data == b""
+    assert response.headers["ETag"] == etag
+    assert client.get("/api/clubs/Penn Memes Club").json["name"] == "Penn Memes Club"
+    after = get_stats(app)
+    assert after["not_modified"] == before["not_modified"] + 1
+    assert after["hits"] == before["hits"] + 1
+
+def test_write_invalidates_the_responses_that_depend_on_it(app, client):
+    etags = {url: client.get(url).headers["ETag"]
+        for url in ("/api/clubs/Penn Memes Club", "/api/clubs", "/api/clubs/Locust Labs", "/api/tags")}
+    assert client.patch("/api/clubs/Penn Memes Club", json={"description": "Edited"}).status_code == 200
+
+    url = "/api/clubs/Penn Memes Club"
+    response = client.get(url, headers={"If-None-Match": etags[url]})
+    assert response.status_code == 200 and response.json["description"] == "Edited"
+    response = client.get("/api/clubs", headers={"If-None-Match": etags["/api/clubs"]})
+    assert response.status_code == 200
+    assert {club["name"]: club["description"] for club in response.json["clubs"]}["Penn Memes Club"] == "Edited"
+    # the other club and the tags don't depend on the description
+    for url in ("/api/clubs/Locust Labs", "/api/tags"):
+        assert client.get(url, headers={"If-None-Match": etags[url]}).status_code == 304
+
+@pytest.mark.parametrize("write, url, expected", [
+    (lambda client: client.put("/api/clubs/Penn Memes Club/tags", json={"name": "Technology"}),
+        "/api/tags/Technology", lambda body: body["tagged_clubs_count"] == 2),
+    (lambda client: client.patch("/api/tags/Technology", json={"name": "Tech"}),
+        "/api/clubs/Locust Labs", lambda body: "Tech" in body["tags"] and "Technology" not in body["tags"]),
+    (lambda client: client.put("/api/users/josh/favorites", json={"name": "Locust Labs"}),
+        "/api/clubs/Locust Labs", lambda body: body["favorite_count"] == 1),
+    (lambda client: client.put("/api/clubs/Locust Labs/reviews", json={"title": "Great", "rating": 9,
+        "username": "josh"}), "/api/clubs/top-rated", lambda body: [club["name"] for club in body["clubs"]] == [
+        "Locust Labs"]),
+    (lambda client: client.delete("/api/clubs/Penn Memes Club"),
+        "/api/tags/Graduate", lambda body: body["tagged_clubs_count"] == 1),
+], ids=["tag_added", "tag_updated", "favorite_added", "review_created", "club_deleted"])
+def test_cached_response_follows_write(client, write, url, expected):
+    first = client.get(url)
+    assert first.status_code == 200 and not expected(first.json)
+    assert write(client).status_code == 200
+    response = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 200 and expected(response.json)
+
+# a rolled back write (here a rename to a taken name) leaves every cached response valid
+def test_rejected_write_keeps_cached_responses(client):
+    etag = client.get("/api/tags/Technology").headers["ETag"]
+    assert client.patch("/api/tags/Technology", json={"name": "Graduate"}).status_code == 400
+    assert client.get("/api/tags/Technology", headers={"If-None-Match": etag}).status_code == 304
+
+# repair-counters changes counts behind the routes' backs, so every cached response is stale (counters_recomputed)
+def test_repair_counters_invalidates_every_response(app, client):
+    etags = {url: client.get(url).headers["ETag"] for url in ("/api/clubs/Locust Labs", "/api/tags/Technology")}
+    result = app.test_cli_runner().invoke(args=["repair-counters"])
+    assert result.exit_code == 0
+    for url, etag in etags.items():
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+# another app on the same database stands in for another worker process: the memory backend learns of its writes from
+# the change feed, the sqlite backend from the versions the other app bumped in the shared file
+@pytest.mark.parametrize("config", [
+    {"CACHE_BACKEND": "memory", "CHANGES_FOLLOW": True, "CHANGES_POLL_INTERVAL": 0},
+    {"CACHE_BACKEND": "sqlite"},
+], ids=["memory", "sqlite"])
+def test_writes_of_another_process_invalidate(app, database_path, tmp_path, config):
+    config = dict(config, CACHE_SQLITE_PATH=str(tmp_path / "cache.db"))
+    client = make_app(database_path, config).test_client()
+    other = make_app(database_path, config).test_client()
+    etag = client.get("/api/clubs/Penn Memes Club").headers["ETag"]
+    assert client.get("/api/clubs/Penn Memes Club", headers={"If-None-Match": etag}).status_code == 304
+
+    assert other.patch("/api/clubs/Penn Memes Club", json={"description": "Edited elsewhere"}).status_code == 200
+    response = client.get("/api/clubs/Penn Memes Club", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.json["description"] == "Edited elsewhere"
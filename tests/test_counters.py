@@ -0,0 +1,108 @@
+import threading
+
+from sqlalchemy import func, select
+
+from extensions import db
+from models import Club, Tag, favorites, recompute_counters, tags
+from tests.conftest import USERNAMES
+
+# every thread waits here before its first request, so the writes start together and contend for SQLite's write lock
+def run_concurrently(jobs):
+    barrier = threading.Barrier(len(jobs), timeout=30)
+    statuses = [None] * len(jobs)
+    def run(index):
+        barrier.wait()
+        statuses[index] = jobs[index]()
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(len(jobs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+# reads every counter and rating aggregate, then the same values as recompute_counters sets them from the association
+# and review tables - the recomputed values are rolled back
+def counters_and_recomputed(app):
+    columns = (Club.name, Club.favorite_count, Club.review_count, Club.rating_sum, Club.rating_mean,
+        Club.rating_histogram)
+    with app.app_context():
+        def read():
+            return (db.session.execute(select(*columns).order_by(Club.name)).all(),
+                db.session.execute(select(Tag.name, Tag.club_count).order_by(Tag.name)).all(),
+                db.session.execute(select(tags.c.club_name, tags.c.tag_name, tags.c.rating_mean)
+                    .order_by(tags.c.club_name, tags.c.tag_name)).all())
+        counters = read()
+        recompute_counters()
+        db.session.flush()
+        recomputed = read()
+        db.session.rollback()
+    return counters, recomputed
+
+def test_concurrent_favorites_keep_favorite_counts(app, client):
+    club = "Penn Memes Club"
+    statuses = run_concurrently([
+        lambda username=username: client.put(f"/api/users/{username}/favorites", json={"name": club}).status_code
+        for username in USERNAMES])
+    assert statuses == [200] * len(USERNAMES)
+    statuses = run_concurrently([
+        lambda username=username: client.delete(f"/api/users/{username}/favorites", json={"name": club}).status_code
+        for username in USERNAMES[::2]])
+    assert statuses == [200] * len(USERNAMES[::2])
+
+    with app.app_context():
+        assert db.session.get(Club, club).favorite_count == len(USERNAMES) - len(USERNAMES[::2])
+        linked = db.session.execute(select(func.count()).where(favorites.c.club_name == club)).scalar()
+        assert linked == len(USERNAMES) - len(USERNAMES[::2])
+    counters, recomputed = counters_and_recomputed(app)
+    assert counters == recomputed
+
+def test_concurrent_batch_favorites_keep_favorite_counts(app, client, club_names):
+    statuses = run_concurrently([
+        lambda username=username: client.put(f"/api/users/{username}/favorites/batch",
+            json={"names": club_names}).status_code
+        for username in USERNAMES])
+    assert statuses == [200] * len(USERNAMES)
+
+    counters, recomputed = counters_and_recomputed(app)
+    assert counters == recomputed
+    assert {row.favorite_count for row in counters[0]} == {len(USERNAMES)}
+
+def test_concurrent_tag_links_keep_club_counts(app, client, club_names):
+    # every club gets the same tag at once, and one club a new tag and a shared one from every thread
+    assert client.put("/api/tags", json={"name": "Shared"}).status_code == 200
+    assert client.put("/api/tags", json={"name": "Batch"}).status_code == 200
+    jobs = [lambda club=club: client.put(f"/api/clubs/{club}/tags", json={"name": "Shared"}).status_code
+        for club in club_names]
+    jobs += [lambda number=number: client.put("/api/clubs/Locust Labs/tags/batch",
+        json={"names": [f"Tag {number}", "Batch"]}).status_code for number in range(len(USERNAMES))]
+    statuses = run_concurrently(jobs)
+    assert statuses == [200] * len(jobs)
+
+    counters, recomputed = counters_and_recomputed(app)
+    assert counters == recomputed
+    club_counts = dict(counters[1])
+    assert club_counts["Shared"] == len(club_names)
+    assert club_counts["Batch"] == 1
+
+def test_concurrent_reviews_keep_rating_aggregates(app, client):
+    club = "Penn Memes Club"
+    statuses = run_concurrently([
+        lambda username=username, rating=rating: client.put(f"/api/clubs/{club}/reviews",
+            json={"title": "Review", "rating": rating, "username": username}).status_code
+        for rating in range(1, 4) for username in USERNAMES])
+    assert statuses == [200] * 3 * len(USERNAMES)
+    with app.app_context():
+        review_ids = [review.id for review in db.session.get(Club, club).get_reviews()]
+
+    # then some are edited and some deleted, again all at once
+    jobs = [lambda review_id=review_id: client.patch(f"/api/reviews/{review_id}", json={"rating": 5}).status_code
+        for review_id in review_ids[::3]]
+    jobs += [lambda review_id=review_id: client.delete(f"/api/reviews/{review_id}").status_code
+        for review_id in review_ids[1::3]]
+    statuses = run_concurrently(jobs)
+    assert statuses == [200] * len(jobs)
+
+    counters, recomputed = counters_and_recomputed(app)
+    assert counters == recomputed
+    row = next(row for row in counters[0] if row.name == club)
+    assert row.review_count == len(review_ids) - len(review_ids[1::3])
@@ -0,0 +1,173 @@
+from collections import defaultdict
+
+import pytest
+from sqlalchemy import func, select
+
+from catalog import catalog
+from extensions import db
+from facets import tag_index
+from models import Club, favorites, members, tags
+from recommendations import FAVORITE_WEIGHT, MEMBER_WEIGHT, NEIGHBORS, recommender
+from related import RELATED, club_terms, related_clubs
+from search import InvertedSearchIndex, club_search
+from serializers import load_club_associations
+from tests.conftest import make_app
+
+# memberships, favorites, and reviews for the writes below to change, made before the indexes are built
+def populate(client):
+    for username in ("josh", "user0", "user1", "user2"):
+        for club in ("Penn Memes Club", "Locust Labs"):
+            assert client.put(f"/api/clubs/{club}/members", json={"username": username}).status_code == 200
+    assert client.put("/api/clubs/Penn Memes Club/officers", json={"username": "user0"}).status_code == 200
+    for username, club in (("josh", "Penn Lorem Ipsum Club"), ("user1", "Penn Memes Club"), ("user2", "Locust Labs")):
+        assert client.put(f"/api/users/{username}/favorites", json={"name": club}).status_code == 200
+    for username, rating in (("josh", 4), ("user0", 2)):
+        assert client.put("/api/clubs/Penn Memes Club/reviews",
+            json={"title": "Review", "rating": rating, "username": username}).status_code == 200
+
+# builds every in-memory index (the search index as the in-process fallback, which FTS5 would otherwise replace)
+def load_indexes():
+    club_search.backend = InvertedSearchIndex()
+    for index in (catalog, tag_index, recommender, related_clubs, club_search.backend):
+        index.load()
+
+# compares every index with the database (or, for the similarity lists, with a full recomputation from the index)
+def check_indexes():
+    assert catalog.check() == []
+    club_names = sorted(db.session.execute(select(Club.name)).scalars())
+    clubs_by_tag = defaultdict(set)
+    for tag_name, club_name in db.session.execute(select(tags.c.tag_name, tags.c.club_name)):
+        clubs_by_tag[tag_name].add(club_name)
+    member_counts = dict(db.session.execute(
+        select(members.c.club_name, func.count()).group_by(members.c.club_name)).all())
+    rating_means = dict(db.session.execute(select(Club.name, Club.rating_mean)).all())
+
+    names, count, facets = tag_index.filter()
+    assert sorted(names) == club_names and count == len(club_names)
+    assert facets == {tag_name: len(clubs) for tag_name, clubs in clubs_by_tag.items()}
+    for tag_name, clubs in clubs_by_tag.items():
+        assert set(tag_index.filter(f'"{tag_name}"')[0]) == clubs
+    with tag_index.reading():
+        assert {name: tag_index.member_counts[tag_index.club_ids[name]] for name in club_names} == {
+            name: member_counts.get(name, 0) for name in club_names}
+        assert {name: tag_index.rating_means[tag_index.club_ids[name]] for name in club_names} == rating_means
+
+    fresh = InvertedSearchIndex()
+    fresh.rebuild()
+    with club_search.backend.reading():
+        # a refreshed club lists its tags in another order, so its tokens are compared as sets
+        assert {name: set(tokens) for name, tokens in club_search.backend.documents.items()} == {
+            name: set(tokens) for name, tokens in fresh.documents.items()}
+        assert dict(club_search.backend.postings) == dict(fresh.postings)
+        assert club_search.backend.vocabulary == fresh.vocabulary
+
+    weights = defaultdict(lambda: defaultdict(float))
+    for table, weight in ((members, MEMBER_WEIGHT), (favorites, FAVORITE_WEIGHT)):
+        for username, club_name in db.session.execute(select(table.c.user_username, table.c.club_name)):
+            weights[username][club_name] += weight
+    with recommender.reading():
+        rows = {username: {recommender.club_names[position]: weight for position, weight in row.items()}
+            for username, row in recommender.rows.items() if row}
+        assert rows == weights
+        check_neighbors(recommender, NEIGHBORS)
+
+    club_tags = load_club_associations(None, fields={"tags"})["tags"]
+    with related_clubs.reading():
+        assert sorted(related_clubs.club_ids) == club_names
+        for name, description in db.session.execute(select(Club.name, Club.description)):
+            expected = related_clubs._vector(club_terms(description, club_tags.get(name, [])))
+            assert related_clubs.vectors[related_clubs.club_ids[name]] == pytest.approx(expected)
+        check_neighbors(related_clubs, RELATED)
+
+# the check of benchmarks/recommendations.py and benchmarks/related.py - every list holds the best similarities
+def check_neighbors(index, size):
+    for position, (positions, similarities) in enumerate(index.neighbors):
+        if index.club_names[position] is None:
+            continue
+        expected = index._similarities(position)
+        assert list(similarities) == pytest.approx(sorted(expected.values(), reverse=True)[:size])
+        assert list(similarities) == pytest.approx([expected.get(other, 0.0) for other in positions])
+
+# one write through the API per event type - each sends the events its name lists (the renames and deletes last, so
+# every write still finds its club, tag, and user when they run in order)
+WRITES = {
+    "club_created": lambda client: client.put("/api/clubs", json={"code": "zebra", "name": "Zebra Club",
+        "description": "Stripes and memes", "tags": ["Technology", "Zebras"]}),
+    "club_updated": lambda client: client.patch("/api/clubs/Penn Memes Club",
+        json={"description": "Memes about juggling and technology"}),
+    "tag_added": lambda client: client.put("/api/clubs/Penn Memes Club/tags", json={"name": "Technology"}),
+    "tag_added batch": lambda client: client.put("/api/clubs/Penn Memes Club/tags/batch",
+        json={"names": ["Technology", "Athletics", "Comedy"]}),
+    "tag_removed": lambda client: client.delete("/api/clubs/Locust Labs/tags", json={"name": "Graduate"}),
+    "tag_removed batch": lambda client: client.delete("/api/clubs/Locust Labs/tags/batch",
+        json={"names": ["Graduate", "Technology"]}),
+    "tag_created": lambda client: client.put("/api/tags", json={"name": "Improv"}),
+    "member_added": lambda client: client.put("/api/clubs/Penn Lorem Ipsum Club/members",
+        json={"username": "user1"}),
+    "member_added batch": lambda client: client.put("/api/clubs/Penn Lorem Ipsum Club/members/batch",
+        json={"usernames": ["user3", "user4", "josh"]}),
+    "member_removed": lambda client: client.delete("/api/clubs/Penn Memes Club/members", json={"username": "user0"}),
+    "member_removed batch": lambda client: client.delete("/api/clubs/Locust Labs/members/batch",
+        json={"usernames": ["josh", "user1"]}),
+    "officer_added": lambda client: client.put("/api/clubs/Locust Labs/officers", json={"username": "user5"}),
+    "officer_removed": lambda client: client.delete("/api/clubs/Penn Memes Club/officers",
+        json={"username": "user0"}),
+    "favorite_added": lambda client: client.put("/api/users/user0/favorites", json={"name": "Locust Labs"}),
+    "favorite_added batch": lambda client: client.put("/api/users/user3/favorites/batch",
+        json={"names": ["Locust Labs", "Penn Memes Club"]}),
+    "favorite_removed": lambda client: client.delete("/api/users/user1/favorites", json={"name": "Penn Memes Club"}),
+    "review_created": lambda client: client.put("/api/reviews", json={"title": "Great", "rating": 5,
+        "username": "user1", "club_name": "Penn Lorem Ipsum Club"}),
+    "review_updated": lambda client: client.patch("/api/reviews/1", json={"rating": 1}),
+    "review_deleted": lambda client: client.delete("/api/reviews/2"),
+    "user_updated": lambda client: client.patch("/api/users/user0", json={"first_name": "Renamed"}),
+    "tag_updated": lambda client: client.patch("/api/tags/Graduate", json={"name": "Graduate Students"}),
+    "tag_deleted": lambda client: client.delete("/api/tags/Literary"),
+    "user_updated renamed": lambda client: client.patch("/api/users/user0", json={"username": "user0b"}),
+    "user_deleted": lambda client: client.delete("/api/users/user2"),
+    "club_updated renamed": lambda client: client.patch("/api/clubs/Penn Memes Club", json={"name": "Meme Society"}),
+    "club_deleted": lambda client: client.delete("/api/clubs/Locust Labs"),
+}
+
+@pytest.mark.parametrize("write", list(WRITES))
+def test_indexes_match_database_after_write(app, client, write):
+    populate(client)
+    with app.app_context():
+        load_indexes()
+    assert WRITES[write](client).status_code == 200
+    with app.app_context():
+        check_indexes()
+
+def test_indexes_match_database_after_every_write(app, client):
+    populate(client)
+    with app.app_context():
+        load_indexes()
+    for write in WRITES.values():
+        assert write(client).status_code == 200
+    with app.app_context():
+        check_indexes()
+
+# repair-counters (the counters_recomputed event) makes the indexes that hold counts and ratings reload them
+def test_indexes_match_database_after_counters_recomputed(app, client):
+    populate(client)
+    with app.app_context():
+        load_indexes()
+        db.session.execute(Club.__table__.update().values(favorite_count=0, review_count=0, rating_mean=None))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=["repair-counters"])
+    assert result.exit_code == 0
+    with app.app_context():
+        check_indexes()
+
+# another app on the same database stands in for another worker process - its writes reach this app's indexes
+# through the change feed (changes.catch_up) instead of the events of its own commits
+def test_indexes_follow_writes_of_another_process(app, client, database_path):
+    populate(client)
+    app.config.update(CHANGES_FOLLOW=True, CHANGES_POLL_INTERVAL=0)
+    with app.app_context():
+        load_indexes()
+    other = make_app(database_path).test_client()
+    for write in WRITES.values():
+        assert write(other).status_code == 200
+    with app.app_context():
+        check_indexes()
@@ -0,0 +1,85 @@
+from flask import abort
+
+from cache import club_key
+from catalog import catalog
+from changes import get_latest_seq
+from extensions import db
+from events import emit
+from models import Club, User
+from uow import get_stats
+
+# a route that stages a club edit, a new membership, and their events, flushes them, and then fails the request -
+# with an error response (abort) or an exception
+def add_failing_route(app, fail):
+    def stage_and_fail():
+        club = db.session.get(Club, "Penn Memes Club")
+        club.description = "Half-applied"
+        emit("club_updated", club=club.name, old_name=club.name, tags=[])
+        club.add_member(db.session.get(User, "josh"))
+        db.session.flush()
+        fail()
+    app.add_url_rule("/test/stage-and-fail", "stage_and_fail", stage_and_fail, methods=["POST"])
+
+def rollbacks(endpoint):
+    return get_stats().get(endpoint, {}).get("rollbacks", 0)
+
+# nothing the request staged is in the database, the change feed, the catalog, or the cached responses
+def check_rolled_back(app, client, etag, latest):
+    with app.app_context():
+        club = db.session.get(Club, "Penn Memes Club")
+        assert club.description != "Half-applied"
+        assert club.get_members().count() == 0
+        assert get_latest_seq() == latest
+        assert catalog.club("Penn Memes Club")["description"] == club.description
+        assert catalog.check() == []
+    assert client.get("/api/clubs/Penn Memes Club", headers={"If-None-Match": etag}).status_code == 304
+
+def test_error_response_rolls_back_staged_writes(app, client):
+    add_failing_route(app, lambda: abort(400, "Invalid request"))
+    with app.app_context():
+        catalog.load()
+        latest = get_latest_seq()
+    etag = client.get("/api/clubs/Penn Memes Club").headers["ETag"]
+    before = rollbacks("stage_and_fail")
+
+    assert client.post("/test/stage-and-fail").status_code == 400
+    assert rollbacks("stage_and_fail") == before + 1
+    check_rolled_back(app, client, etag, latest)
+
+def test_exception_rolls_back_staged_writes(app, client):
+    def fail():
+        raise RuntimeError("failed after staging")
+    add_failing_route(app, fail)
+    with app.app_context():
+        catalog.load()
+        latest = get_latest_seq()
+    etag = client.get("/api/clubs/Penn Memes Club").headers["ETag"]
+    before = rollbacks("stage_and_fail")
+
+    assert client.post("/test/stage-and-fail").status_code == 500
+    assert rollbacks("stage_and_fail") == before + 1
+    check_rolled_back(app, client, etag, latest)
+
+# a route that changes the review before it finds the new rating invalid
+def test_invalid_review_edit_is_not_applied(app, client):
+    assert client.put("/api/clubs/Penn Memes Club/reviews",
+        json={"title": "Review", "rating": 4, "username": "josh"}).status_code == 200
+    with app.app_context():
+        latest = get_latest_seq()
+    before = rollbacks("api.access_review")
+
+    assert client.patch("/api/reviews/1", json={"title": "Edited", "rating": 11}).status_code == 400
+    assert rollbacks("api.access_review") == before + 1
+    review = client.get("/api/reviews/1").json
+    assert (review["title"], review["rating"]) == ("Review", 4)
+    with app.app_context():
+        assert get_latest_seq() == latest
+
+# each route commits once, however many helpers it calls
+def test_routes_commit_once(app, client):
+    app.config["UOW_COMMIT_HEADER"] = True
+    response = client.put("/api/clubs/Penn Memes Club/members/batch", json={"usernames": ["josh", "user0", "user1"]})
+    assert response.headers["X-Commit-Count"] == "1"
+    response = client.put("/api/clubs/Locust Labs/officers", json={"username": "user2"})
+    assert response.headers["X-Commit-Count"] == "1"
+    assert client.get("/api/clubs/Locust Labs").headers["X-Commit-Count"] == "0"
@@ -0,0 +1,48 @@
+from collections import defaultdict
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from extensions import db
+
+# Unit of Work - model helpers only stage changes on the session; each route commits once at the end
+# if the route aborts or raises, everything it staged is rolled back here, so a request is never half-applied
+# commits are counted per request: a request that commits more than once is logged, and with
+# UOW_COMMIT_HEADER enabled every response reports its commit count in X-Commit-Count
+def init_app(app):
+    app.config.setdefault("UOW_COMMIT_HEADER", False)
+    app.after_request(_finish_unit_of_work)
+    app.teardown_request(_rollback_on_error)
+
+# per-endpoint totals - endpoint -> {"requests", "commits", "rollbacks", "multi_commit_requests"}
+stats = defaultdict(lambda: {"requests": 0, "commits": 0, "rollbacks": 0, "multi_commit_requests": 0})
+
+def _count_commit(session):
+    if has_request_context():
+        g.commit_count = g.get("commit_count", 0) + 1
+
+event.listen(db.session, "after_commit", _count_commit)
+
+def _finish_unit_of_work(response):
+    commits = g.get("commit_count", 0)
+    endpoint_stats = stats[request.endpoint or "unknown"]
+    endpoint_stats["requests"] += 1
+    endpoint_stats["commits"] += commits
+    if commits > 1:
+        endpoint_stats["multi_commit_requests"] += 1
+        current_app.logger.warning("%s %s committed %d times", request.method, request.path, commits)
+    # an aborted request returns an error response without committing - discard what it staged
+    if response.status_code >= 400 and db.session().in_transaction():
+        db.session.rollback()
+        endpoint_stats["rollbacks"] += 1
+    if current_app.config["UOW_COMMIT_HEADER"]:
+        response.headers["X-Commit-Count"] = str(commits)
+    return response
+
+def _rollback_on_error(exc):
+    if exc is not None and db.session().in_transaction():
+        db.session.rollback()
+        stats[request.endpoint or "unknown"]["rollbacks"] += 1
+
+def get_stats():
+    return {endpoint: dict(endpoint_stats) for endpoint, endpoint_stats in stats.items()}